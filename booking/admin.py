@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Airport, Flight, Account, TicketType, FlightTicketType, Booking, Payment, Card, Voucher, Passenger
+from django.http import StreamingHttpResponse
+
+from . import exports
+from .models import Airport, Flight, Account, TicketType, FlightTicketType, Booking, Payment, Card, Voucher, Passenger, SeatHold, Job
 
 admin.site.register(Airport)
 @admin.register(Flight)
@@ -10,8 +13,47 @@ class FlightAdmin(admin.ModelAdmin):
 admin.site.register(Account)
 admin.site.register(TicketType)
 admin.site.register(FlightTicketType)
-admin.site.register(Booking)
-admin.site.register(Payment)
+def export_action(kind, file_format):
+    def export(modeladmin, request, queryset):
+        response = StreamingHttpResponse(
+            exports.stream(kind, file_format, queryset=queryset),
+            content_type="text/csv" if file_format == "csv" else "application/x-ndjson"
+        )
+        response["Content-Disposition"] = f'attachment; filename="{kind}.{file_format}"'
+        return response
+    export.__name__ = f"export_{file_format}"
+    export.short_description = f"Export selected {kind} as {file_format.upper()}"
+    return export
+@admin.action(description="Approve selected pending cancellations")
+def approve_cancellations(modeladmin, request, queryset):
+    count = queryset.approve_cancellations()
+    modeladmin.message_user(request, f"{count} cancellation(s) approved.")
+@admin.action(description="Reject selected pending cancellations")
+def reject_cancellations(modeladmin, request, queryset):
+    count = queryset.reject_cancellations()
+    modeladmin.message_user(request, f"{count} cancellation(s) rejected.")
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ('booking_id', 'account', 'flight_ticket_type', 'seat_count', 'seat_number', 'status', 'booking_date')
+    list_filter = ('status',)
+    list_select_related = ('account', 'flight_ticket_type__flight', 'flight_ticket_type__ticket_type')
+    actions = [
+        approve_cancellations, reject_cancellations,
+        export_action('bookings', 'csv'), export_action('bookings', 'jsonl'),
+    ]
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('payment_id', 'booking', 'amount', 'payment_method', 'transaction_id', 'payment_date')
+    list_select_related = ('booking__account', 'booking__flight_ticket_type__flight')
+    actions = [export_action('payments', 'csv'), export_action('payments', 'jsonl')]
 admin.site.register(Card)
 admin.site.register(Voucher)
 admin.site.register(Passenger)
+@admin.register(SeatHold)
+class SeatHoldAdmin(admin.ModelAdmin):
+    list_display = ('seat_hold_id', 'flight_ticket_type', 'account', 'quantity', 'status', 'expires_at')
+    list_filter = ('status',)
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('job_id', 'name', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+        if getattr(settings, 'BOOKING_WARM_UP', False):
+            from . import warmup
+            warmup.run()
@@ -0,0 +1,146 @@
+"""Async JSON endpoints for the read-heavy paths: search, flight detail,
+availability and the fare calendar.
+
+Under ASGI these run on the event loop and use the async ORM and cache
+interfaces, so a worker does not tie up a thread while a search waits on
+the database or the cache. They share query builders and cache entries
+with the synchronous views.
+"""
+from datetime import timedelta
+
+from django.http import Http404, JsonResponse
+from django.utils.dateparse import parse_date
+from django.utils.translation import gettext_lazy as _
+
+from . import reference_data, search_cache
+from .constants import FARE_CALENDAR_DEFAULT_DAYS, FARE_CALENDAR_MAX_DAYS, PRICE_FORMAT
+from .models import Flight, FlightTicketType, RouteDayAvailability, build_fare_calendar
+
+
+async def _get_ticket_type_id(ticket_type_name):
+    for ticket_type in await reference_data.aget_ticket_types():
+        if ticket_type["name"] == ticket_type_name:
+            return ticket_type["ticket_type_id"]
+    return None
+
+
+def _flight_json(flight):
+    return {
+        "flight_id": flight.flight_id,
+        "flight_number": flight.flight_number,
+        "airline": flight.airline,
+        "from": flight.departure_airport_id,
+        "to": flight.arrival_airport_id,
+        "departure_time": flight.departure_time.isoformat(),
+        "arrival_time": flight.arrival_time.isoformat(),
+        "duration_minutes": int(flight.get_duration().total_seconds() // 60),
+    }
+
+
+async def _search_flights(departure_airport, arrival_airport, day, num_passengers, ticket_type_id):
+    """Async counterpart of the index() search; its results share the same cache entries."""
+    async def compute():
+        if await RouteDayAvailability.objects.rules_out(
+                departure_airport, arrival_airport, day, ticket_type_id, num_passengers).aexists():
+            return []
+        flights = [flight async for flight in Flight.objects.available(
+            departure_airport, arrival_airport, day, num_passengers, ticket_type_id
+        ).aiterator()]
+        for flight in flights:
+            flight.ticket_type_price = PRICE_FORMAT.format(flight.ticket_type_price)
+        return flights
+
+    search = search_cache.normalize(departure_airport, arrival_airport, day, num_passengers, ticket_type_id)
+    return await search_cache.aget_or_compute(search, compute)
+
+
+async def api_search_flights(request):
+    from_airport = request.GET.get("from")
+    to_airport = request.GET.get("to")
+    ticket_type_id = await _get_ticket_type_id(request.GET.get("chairType"))
+    try:
+        day = parse_date(request.GET.get("departureDate", ""))
+        num_passengers = max(int(request.GET.get("numPassengers", 1)), 1)
+    except ValueError:
+        day = None
+    if not from_airport or not to_airport or day is None or ticket_type_id is None:
+        return JsonResponse({"error": _("Please provide from, to, departureDate and chairType.")}, status=400)
+    flights = await _search_flights(from_airport, to_airport, day, num_passengers, ticket_type_id)
+    return JsonResponse({
+        "flights": [
+            dict(
+                _flight_json(flight),
+                price=float(flight.min_price),
+                available_seats=flight.ticket_type_available_seats,
+            )
+            for flight in flights
+        ],
+    })
+
+
+async def api_flight_detail(request, flight_id):
+    try:
+        flight = await Flight.objects.select_related("departure_airport", "arrival_airport").aget(pk=flight_id)
+    except Flight.DoesNotExist:
+        raise Http404(_("Flight not found."))
+    return JsonResponse(dict(
+        _flight_json(flight),
+        departure_airport=flight.departure_airport.name,
+        arrival_airport=flight.arrival_airport.name,
+        domestic=flight.is_domestic(),
+    ))
+
+
+async def api_flight_availability(request, flight_id):
+    """Price and seats left for every ticket type of a flight."""
+    fares = [
+        {
+            "ticket_type": fare["ticket_type__name"],
+            "price": float(fare["price"]),
+            "available_seats": fare["available_seats"],
+        }
+        async for fare in FlightTicketType.objects.filter(flight_id=flight_id).values(
+            "ticket_type__name", "price", "available_seats"
+        ).order_by("ticket_type_id").aiterator()
+    ]
+    if not fares and not await Flight.objects.filter(pk=flight_id).aexists():
+        raise Http404(_("Flight not found."))
+    return JsonResponse({"flight_id": flight_id, "fares": fares})
+
+
+async def api_fare_calendar(request):
+    from_airport = request.GET.get("from")
+    to_airport = request.GET.get("to")
+    chair_type_name = request.GET.get("chairType")
+    ticket_type_id = await _get_ticket_type_id(chair_type_name)
+    try:
+        departure_date = parse_date(request.GET.get("departureDate", ""))
+        num_passengers = int(request.GET.get("numPassengers", 1))
+        window = int(request.GET.get("days", FARE_CALENDAR_DEFAULT_DAYS))
+    except ValueError:
+        departure_date = None
+    if not from_airport or not to_airport or departure_date is None or ticket_type_id is None:
+        return JsonResponse({"error": _("Please provide from, to, departureDate and chairType.")}, status=400)
+    window = max(0, min(window, FARE_CALENDAR_MAX_DAYS))
+    num_passengers = max(num_passengers, 1)
+    first_day = departure_date - timedelta(days=window)
+    last_day = departure_date + timedelta(days=window)
+
+    async def compute():
+        rows = [row async for row in FlightTicketType.objects.fare_calendar(
+            from_airport, to_airport, first_day, last_day, num_passengers, ticket_type_id
+        ).aiterator()]
+        return build_fare_calendar(rows, first_day, last_day)
+
+    days = await search_cache.aget_or_compute_calendar(
+        from_airport, to_airport,
+        [first_day + timedelta(days=offset) for offset in range(2 * window + 1)],
+        num_passengers, ticket_type_id, compute
+    )
+    return JsonResponse({
+        "from": from_airport,
+        "to": to_airport,
+        "chair_type": chair_type_name,
+        "num_passengers": num_passengers,
+        "days": days,
+    })
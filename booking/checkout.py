@@ -0,0 +1,279 @@
+"""Checkout pipeline used by payment_view.
+
+The whole form is validated before anything is written, then every row is
+created inside one transaction with bulk inserts, so a group booking costs
+the same number of queries as a single passenger and leaves nothing behind
+when it fails.
+"""
+import re
+import secrets
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.translation import gettext_lazy as _
+
+from .constants import CHECKOUT_QUOTE_MINUTES, CHECKOUT_SESSION_LIMIT, REGEX_PATTERN, REGEX_PATTERN_NAME
+from .models import Booking, FlightTicketType, Passenger, SeatHold, SeatMap
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class CheckoutState:
+    """What a checkout has resolved so far, kept in the session under its checkout id.
+
+    The fares of the legs, the price quote and the passenger count are
+    resolved once when the checkout starts, so later steps neither re-query
+    them nor take prices from the submitted form. A quote older than
+    CHECKOUT_QUOTE_MINUTES is re-priced when the checkout is loaded.
+    """
+    SESSION_KEY = 'checkouts'
+
+    def __init__(self, checkout_id, legs, num_passengers, quoted_at, booking_ids=()):
+        self.checkout_id = checkout_id
+        # One dict per leg: flight_ticket_type_id, flight_id, ticket_type_id and price.
+        self.legs = legs
+        self.num_passengers = num_passengers
+        self.quoted_at = quoted_at
+        self.booking_ids = list(booking_ids)
+
+    @classmethod
+    def start(cls, request, flight_ticket_types, num_passengers):
+        state = cls(secrets.token_urlsafe(16), [], num_passengers, timezone.now())
+        state.quote(flight_ticket_types)
+        state.save(request)
+        return state
+
+    @classmethod
+    def load(cls, request, checkout_id):
+        """The checkout of this session with that id, or None."""
+        data = request.session.get(cls.SESSION_KEY, {}).get(checkout_id or '')
+        if data is None:
+            return None
+        state = cls(
+            checkout_id, data['legs'], data['num_passengers'],
+            parse_datetime(data['quoted_at']), data['booking_ids']
+        )
+        if state.quote_expired():
+            try:
+                state.quote(FlightTicketType.objects.filter(
+                    pk__in=[leg['flight_ticket_type_id'] for leg in state.legs]
+                ).order_by())
+            except KeyError:
+                # A fare of the checkout has been removed since.
+                state.discard(request)
+                return None
+            state.save(request)
+        return state
+
+    def quote(self, flight_ticket_types):
+        by_id = {fare.pk: fare for fare in flight_ticket_types}
+        order = [leg['flight_ticket_type_id'] for leg in self.legs] or list(by_id)
+        self.legs = [
+            {
+                'flight_ticket_type_id': by_id[pk].pk,
+                'flight_id': by_id[pk].flight_id,
+                'ticket_type_id': by_id[pk].ticket_type_id,
+                'price': str(by_id[pk].price),
+            }
+            for pk in order
+        ]
+        self.quoted_at = timezone.now()
+
+    def quote_expired(self):
+        return timezone.now() >= self.quoted_at + timedelta(minutes=CHECKOUT_QUOTE_MINUTES)
+
+    def leg_total(self, index):
+        return Decimal(self.legs[index]['price']) * self.num_passengers
+
+    @property
+    def total(self):
+        return sum((self.leg_total(index) for index in range(len(self.legs))), Decimal(0))
+
+    def flight_ticket_types(self):
+        """The fares of the legs with their flights and airports, in leg order, in one query."""
+        fares = FlightTicketType.objects.select_related(
+            'flight__departure_airport', 'flight__arrival_airport'
+        ).in_bulk([leg['flight_ticket_type_id'] for leg in self.legs])
+        return [fares[leg['flight_ticket_type_id']] for leg in self.legs]
+
+    def save(self, request):
+        checkouts = request.session.get(self.SESSION_KEY, {})
+        checkouts.pop(self.checkout_id, None)
+        checkouts[self.checkout_id] = {
+            'legs': self.legs,
+            'num_passengers': self.num_passengers,
+            'quoted_at': self.quoted_at.isoformat(),
+            'booking_ids': self.booking_ids,
+        }
+        # Only the most recent checkouts of a session are kept.
+        for checkout_id in list(checkouts)[:-CHECKOUT_SESSION_LIMIT]:
+            del checkouts[checkout_id]
+        request.session[self.SESSION_KEY] = checkouts
+
+    def discard(self, request):
+        checkouts = request.session.get(self.SESSION_KEY, {})
+        if checkouts.pop(self.checkout_id, None) is not None:
+            request.session[self.SESSION_KEY] = checkouts
+
+
+def get_flight_ticket_type(flight_id, ticket_type_name):
+    """Fetch the fare row of a leg together with its flight and airports."""
+    return FlightTicketType.objects.select_related(
+        'flight__departure_airport', 'flight__arrival_airport'
+    ).get(flight_id=flight_id, ticket_type__name=ticket_type_name)
+
+
+def __add_error(errors, message):
+    if message not in errors:
+        errors.append(message)
+
+
+def __is_valid_date(value):
+    try:
+        return parse_date(value) is not None
+    except ValueError:
+        return False
+
+
+def parse_passengers(data, count, international):
+    """Validate the passenger fields of the checkout form.
+
+    Returns ``(passengers, errors)``: unsaved Passenger instances and the
+    distinct error messages. Passport fields are only required when the
+    flight is international.
+    """
+    passengers = []
+    errors = []
+    for i in range(count):
+        fname = data.get(f'passenger{i}Fname')
+        if not fname:
+            __add_error(errors, _("Please input the first names."))
+        elif not re.match(REGEX_PATTERN_NAME, fname):
+            __add_error(errors, _("Some of the first names are not valid."))
+        lname = data.get(f'passenger{i}Lname')
+        if not lname:
+            __add_error(errors, _("Please input the last names."))
+        elif not re.match(REGEX_PATTERN_NAME, lname):
+            __add_error(errors, _("Some of the last names are not valid."))
+        gender = data.get(f'passenger{i}Gender')
+        if not gender:
+            __add_error(errors, _("Please select the genders."))
+        elif gender not in [_("Male"), _("Female"), _("Other")]:
+            __add_error(errors, _("Some of the genders are not valid."))
+        dob = data.get(f'passenger{i}DateOfBirth')
+        if not dob:
+            __add_error(errors, _("Please input the dates of birth."))
+        elif not __is_valid_date(dob):
+            __add_error(errors, _("Some of the dates of birth are not valid."))
+        elif parse_datetime(f"{dob}T23:59:59+0700") >= timezone.now():
+            __add_error(errors, _("The dates of birth should be prior to today."))
+        nationality = data.get(f'passenger{i}Nationality')
+        if international:
+            passno = data.get(f'passenger{i}PassportNumber')
+            if not passno:
+                __add_error(errors, _("Please input the passport numbers."))
+            elif not re.match(REGEX_PATTERN, passno):
+                __add_error(errors, _("Some of the passport numbers are not valid."))
+            coi = data.get(f'passenger{i}CountryOfIssue')
+            expire = data.get(f'passenger{i}PassportExpireDate')
+            if not expire:
+                __add_error(errors, _("Please input the passport expire dates."))
+            elif not __is_valid_date(expire):
+                __add_error(errors, _("Some of the expire dates are not valid."))
+        else:
+            passno = 'None'
+            coi = 'None'
+            expire = timezone.now()
+        if not errors:
+            passengers.append(Passenger(
+                first_name=fname,
+                last_name=lname,
+                gender=gender.capitalize(),
+                date_of_birth=dob,
+                nationality=nationality,
+                passport_number=passno,
+                passport_from_country=coi,
+                due_date=expire
+            ))
+    return passengers, errors
+
+
+def __save_passengers(passengers):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Passenger.objects.bulk_create(passengers)
+    # Without RETURNING (e.g. MySQL) bulk_create leaves the primary keys
+    # unset, and they are needed for the booking/passenger links, so the new
+    # rows are read back in one query. They are newer than every row seen
+    # before the insert and not linked to a booking yet; committed checkouts
+    # always are, as the links go in with the same transaction.
+    last_id = Passenger.objects.aggregate(last_id=Max('passenger_id'))['last_id'] or 0
+    Passenger.objects.bulk_create(passengers)
+    ids = defaultdict(list)
+    for passenger_id, first_name, last_name, passport_number in Passenger.objects.filter(
+        passenger_id__gt=last_id, flight_tickets__isnull=True
+    ).order_by('passenger_id').values_list('passenger_id', 'first_name', 'last_name', 'passport_number'):
+        ids[(first_name, last_name, passport_number)].append(passenger_id)
+    for passenger in passengers:
+        passenger.passenger_id = ids[(passenger.first_name, passenger.last_name, passenger.passport_number)].pop(0)
+    return passengers
+
+
+def create_bookings(user, flight_ticket_types, passengers, mobile, email, seat_labels=None):
+    """Create one held booking per leg for the given passengers.
+
+    Everything runs in a single transaction: passengers are bulk inserted,
+    each leg gets a booking, a seat hold and its seats on the seat map, and
+    the booking/passenger links for all legs go in with one bulk insert.
+    ``seat_labels`` optionally lists the chosen seats per leg; legs without
+    a choice get seats next to each other. Raises CheckoutError, leaving no
+    rows behind, when a leg has run out of seats or a chosen seat is taken.
+    """
+    quantity = len(passengers)
+    seat_labels = list(seat_labels or [])
+    seat_labels += [[]] * (len(flight_ticket_types) - len(seat_labels))
+    for labels in seat_labels:
+        if labels and len(labels) != quantity:
+            raise CheckoutError(_("Please choose one seat per passenger."))
+    with transaction.atomic():
+        passengers = __save_passengers(passengers)
+        bookings = []
+        for flight_ticket_type, labels in zip(flight_ticket_types, seat_labels):
+            # Built before the hold, so the new booking is not counted into a fresh map.
+            seat_map = SeatMap.objects.for_fare(flight_ticket_type)
+            booking = Booking.objects.create(
+                account=user,
+                flight_ticket_type=flight_ticket_type,
+                seat_count=quantity
+            )
+            # Seats are only held here; process_view turns the hold into a sale.
+            if SeatHold.place(flight_ticket_type, user, quantity, booking=booking) is None:
+                raise CheckoutError(_("Not enough seats are available on flight %(flight)s.") % {
+                    'flight': flight_ticket_type.flight.flight_number
+                })
+            assigned = seat_map.assign(quantity, labels)
+            if assigned is None:
+                raise CheckoutError(_("The chosen seats on flight %(flight)s are no longer free.") % {
+                    'flight': flight_ticket_type.flight.flight_number
+                })
+            booking.seat_number = ','.join(assigned)
+            booking.save(update_fields=['seat_number'])
+            bookings.append(booking)
+
+        BookingPassenger = Booking.passengers.through
+        BookingPassenger.objects.bulk_create([
+            BookingPassenger(booking_id=booking.pk, passenger_id=passenger.pk)
+            for booking in bookings
+            for passenger in passengers
+        ])
+
+        user.phone_number = f"0{mobile}"
+        user.email = email
+        user.save(update_fields=['phone_number', 'email'])
+    return bookings
@@ -31,6 +31,57 @@ BOOKING_STATUS = [
     ('DeniedCancellation', _('DeniedCancellation'))
 ]
 
+SEAT_HOLD_STATUS = [
+    ('Active', _('Active')),
+    ('Confirmed', _('Confirmed')),
+    ('Released', _('Released')),
+]
+
+SEAT_HOLD_MINUTES = 15
+SEAT_HOLD_SWEEP_BATCH_SIZE = 1000
+CHECKOUT_QUOTE_MINUTES = 15
+CHECKOUT_SESSION_LIMIT = 5
+
+# Seat letters per ticket type, aisles as spaces, and the number of the first row.
+SEAT_MAP_LAYOUTS = {
+    'Business': ('AC DF', 1),
+    'Economy': ('ABC DEF', 10),
+}
+SEAT_MAP_DEFAULT_LAYOUT = ('ABC DEF', 1)
+CANCELLATION_BATCH_SIZE = 1000
+
+BOOKINGS_PER_PAGE = 20
+FLIGHTS_PER_PAGE = 50
+
+FARE_CALENDAR_DEFAULT_DAYS = 3
+FARE_CALENDAR_MAX_DAYS = 7
+
+SEARCH_MODE_DIRECT = 'direct'
+SEARCH_MODE_CONNECTIONS = 'connections'
+
+CONNECTION_MIN_MINUTES = 45
+CONNECTION_MAX_LAYOVER_HOURS = 12
+CONNECTION_MAX_STOPS = 2
+CONNECTION_RESULTS_LIMIT = 10
+ROUTE_GRAPH_TTL = 300
+ROUTE_GRAPH_CACHE_SIZE = 32
+
+EXPORT_CHUNK_SIZE = 2000
+
+JOB_STATUS = [
+    ('Pending', _('Pending')),
+    ('Running', _('Running')),
+    ('Done', _('Done')),
+    ('Failed', _('Failed')),
+]
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 30
+JOB_STALE_SECONDS = 600
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_WAIT_SECONDS = 5
+
 PAYMENT_METHOD_CHOICES = [
         ('Credit Card', _('Credit Card')),
         ('PayPal', _('PayPal')),
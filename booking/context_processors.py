@@ -0,0 +1,20 @@
+from . import fragment_cache
+
+
+class FragmentVersions:
+    """Versions of cached fragments, read from the cache only when a template uses them."""
+
+    def __init__(self):
+        self._versions = {}
+
+    def __getitem__(self, name):
+        if name not in self._versions:
+            self._versions[name] = fragment_cache.version(name)
+        return self._versions[name]
+
+
+def fragments(request):
+    return {
+        "fragment_cache_ttl": fragment_cache.timeout(),
+        "fragment_versions": FragmentVersions(),
+    }
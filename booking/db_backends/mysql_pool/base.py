@@ -0,0 +1,13 @@
+"""The MySQL backend with an in-process connection pool, see booking.db_backends.pool."""
+from django.db.backends.mysql import base
+
+from ..pool import ConnectionPoolMixin
+
+
+class DatabaseWrapper(ConnectionPoolMixin, base.DatabaseWrapper):
+    def ping_connection(self, connection):
+        try:
+            connection.ping()
+        except Exception:
+            return False
+        return True
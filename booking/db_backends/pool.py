@@ -0,0 +1,73 @@
+"""In-process pool of database connections, shared by the threads of a worker.
+
+Django keeps one connection per thread and, with ``CONN_MAX_AGE`` at 0,
+closes it at the end of every request. Under ASGI, or any server that does
+not reuse threads, each request therefore pays for a new connection. With
+this mixin on a backend, closing a connection hands it back to a pool of up
+to ``POOL_SIZE`` idle connections instead, and the next connect takes one
+from there after a health check.
+"""
+import os
+import queue
+import threading
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPoolMixin:
+    def pool_size(self):
+        return self.settings_dict.get("POOL_SIZE") or 0
+
+    def pool(self):
+        # Keyed on the process too: connections must not be shared with forked workers.
+        key = (os.getpid(), self.alias)
+        with _pools_lock:
+            return _pools.setdefault(key, queue.LifoQueue())
+
+    def ping_connection(self, connection):
+        try:
+            connection.cursor().execute("SELECT 1")
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool()
+        while self.pool_size():
+            try:
+                connection = pool.get_nowait()
+            except queue.Empty:
+                break
+            if self.ping_connection(connection):
+                return connection
+            self.discard_connection(connection)
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        pool = self.pool()
+        if self.connection is None or not self.pool_size() or pool.qsize() >= self.pool_size():
+            return super()._close()
+        try:
+            if self.in_atomic_block or not self.autocommit:
+                self.connection.rollback()
+        except Exception:
+            return super()._close()
+        pool.put_nowait(self.connection)
+
+    def discard_connection(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def clear_pool(alias):
+    """Close the idle pooled connections of ``alias`` in this process."""
+    with _pools_lock:
+        pool = _pools.pop((os.getpid(), alias), None)
+    while pool is not None and not pool.empty():
+        try:
+            pool.get_nowait().close()
+        except Exception:
+            pass
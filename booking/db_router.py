@@ -0,0 +1,163 @@
+"""Routing of queries between the primary database and its read replicas.
+
+Writes always go to the primary (``default``). Reads made while handling a
+safe (GET/HEAD) request go to one of ``settings.DATABASE_REPLICAS``, unless
+
+- the request already wrote, or the read happens inside a transaction;
+- the session wrote before, so users keep reading their own writes despite
+  replication lag: for ``BOOKING_PRIMARY_PIN_SECONDS``, or for the rest of
+  the session when that is 0;
+- the view is decorated with ``@use_primary``, or the code runs inside
+  ``with primary():``;
+- the model coordinates concurrent requests (sessions, idempotency keys,
+  jobs) and must never be read stale.
+
+Queries outside a request handled by ``DatabasePinMiddleware``, such as
+management commands and the job worker, stay on the primary.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_SESSION_KEY = "_primary_pinned_at"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+PRIMARY_ONLY_MODELS = {"sessions.session", "booking.idempotencykey", "booking.job"}
+
+
+class _RequestState:
+    __slots__ = ("primary", "wrote")
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.wrote = False
+
+
+# Holds a mutable state so that writes made in sync_to_async threads are seen by the middleware.
+_request_state = contextvars.ContextVar("booking_db_request_state", default=None)
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def _pin_seconds():
+    return getattr(settings, "BOOKING_PRIMARY_PIN_SECONDS", 0)
+
+
+def _is_pinned(pinned_at):
+    if pinned_at is None:
+        return False
+    return not _pin_seconds() or time.time() - pinned_at < _pin_seconds()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (state is None or state.primary or state.wrote or not replicas()
+                or model._meta.label_lower in PRIMARY_ONLY_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def primary():
+    """Send the reads of the block to the primary."""
+    state = _request_state.get()
+    if state is None:
+        yield
+        return
+    previous, state.primary = state.primary, True
+    try:
+        yield
+    finally:
+        state.primary = previous
+
+
+def use_primary(view):
+    """Run every query of the view on the primary, for read-modify-write flows."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with primary():
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with primary():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class DatabasePinMiddleware:
+    """Set up replica routing for a request and pin the session to the primary once it writes.
+
+    Goes after SessionMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        session = getattr(request, "session", None)
+        pinned_at = session.get(PIN_SESSION_KEY) if session is not None else None
+        state = self.start(request, pinned_at)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if self.should_pin(session, state, pinned_at):
+            session[PIN_SESSION_KEY] = time.time()
+        return response
+
+    async def __acall__(self, request):
+        session = getattr(request, "session", None)
+        # Reading the session is a query; requests without a session cookie have nothing to read.
+        pinned_at = None
+        if session is not None and session.session_key:
+            pinned_at = await sync_to_async(session.get)(PIN_SESSION_KEY)
+        state = self.start(request, pinned_at)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if self.should_pin(session, state, pinned_at):
+            await sync_to_async(session.__setitem__)(PIN_SESSION_KEY, time.time())
+        return response
+
+    def start(self, request, pinned_at):
+        return _RequestState(primary=request.method not in SAFE_METHODS or _is_pinned(pinned_at))
+
+    def should_pin(self, session, state, pinned_at):
+        # Without a time limit the first pin lasts for the session, so it is set only once.
+        return (session is not None and state.wrote and bool(replicas())
+                and (_pin_seconds() or not _is_pinned(pinned_at)))
@@ -0,0 +1,125 @@
+"""Streaming CSV/JSONL export of bookings and payments.
+
+Rows are read as ``values()`` dicts in primary-key order, one batch at a
+time, so memory stays flat however long the date range is. Batches are
+keyset-paginated instead of relying on ``iterator()``: MySQL cannot stream
+a result set, and its driver would load the whole export into memory.
+The passengers of each booking batch are fetched with one extra query.
+"""
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .constants import EXPORT_CHUNK_SIZE
+from .models import Booking, Payment, get_day_range
+
+FORMATS = ("csv", "jsonl")
+
+BOOKING_COLUMNS = {
+    "booking_id": "booking_id",
+    "booking_date": "booking_date",
+    "status": "status",
+    "seats": "seat_count",
+    "seat_numbers": "seat_number",
+    "username": "account__username",
+    "email": "account__email",
+    "flight_number": "flight_ticket_type__flight__flight_number",
+    "from": "flight_ticket_type__flight__departure_airport_id",
+    "to": "flight_ticket_type__flight__arrival_airport_id",
+    "departure_time": "flight_ticket_type__flight__departure_time",
+    "ticket_type": "flight_ticket_type__ticket_type__name",
+    "price": "flight_ticket_type__price",
+}
+
+PAYMENT_COLUMNS = {
+    "payment_id": "payment_id",
+    "payment_date": "payment_date",
+    "amount": "amount",
+    "payment_method": "payment_method",
+    "transaction_id": "transaction_id",
+    "booking_id": "booking_id",
+    "booking_status": "booking__status",
+    "username": "booking__account__username",
+    "flight_number": "booking__flight_ticket_type__flight__flight_number",
+    "departure_time": "booking__flight_ticket_type__flight__departure_time",
+}
+
+
+def _batches(queryset, columns, chunk_size):
+    """Yield lists of rows renamed to ``columns``, keyset-paginated on the primary key."""
+    pk = queryset.model._meta.pk.name
+    lookups = list(columns.values())
+    queryset = queryset.order_by(pk).values(*lookups)
+    last = None
+    while True:
+        page = queryset.filter(**{f"{pk}__gt": last}) if last is not None else queryset
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][pk]
+        yield [{column: row[lookup] for column, lookup in columns.items()} for row in rows]
+
+
+def booking_rows(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset = Booking.objects.all() if queryset is None else queryset
+    BookingPassenger = Booking.passengers.through
+    for rows in _batches(queryset, BOOKING_COLUMNS, chunk_size):
+        passengers = BookingPassenger.objects.filter(
+            booking_id__in=[row["booking_id"] for row in rows]
+        ).order_by("booking_id", "passenger_id").values_list(
+            "booking_id", "passenger__first_name", "passenger__last_name"
+        )
+        names = {
+            booking_id: [f"{first} {last}" for _, first, last in group]
+            for booking_id, group in groupby(passengers, key=lambda passenger: passenger[0])
+        }
+        for row in rows:
+            row["passengers"] = names.get(row["booking_id"], [])
+            yield row
+
+
+def payment_rows(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset = Payment.objects.all() if queryset is None else queryset
+    for rows in _batches(queryset, PAYMENT_COLUMNS, chunk_size):
+        yield from rows
+
+
+EXPORTS = {
+    "bookings": (Booking, "booking_date", list(BOOKING_COLUMNS) + ["passengers"], booking_rows),
+    "payments": (Payment, "payment_date", list(PAYMENT_COLUMNS), payment_rows),
+}
+
+
+def filter_dates(kind, queryset, start=None, end=None):
+    """Restrict an export to the days from ``start`` to ``end``, both included."""
+    date_field = EXPORTS[kind][1]
+    if start:
+        queryset = queryset.filter(**{f"{date_field}__gte": get_day_range(start)[0]})
+    if end:
+        queryset = queryset.filter(**{f"{date_field}__lt": get_day_range(end)[1]})
+    return queryset
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream(kind, file_format, queryset=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the export line by line as text."""
+    model, _, columns, rows = EXPORTS[kind]
+    queryset = filter_dates(kind, model.objects.all() if queryset is None else queryset, start, end)
+    if file_format == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows(queryset, chunk_size):
+            if "passengers" in row:
+                row["passengers"] = "; ".join(row["passengers"])
+            yield writer.writerow([row[column] for column in columns])
+    else:
+        for row in rows(queryset, chunk_size):
+            yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
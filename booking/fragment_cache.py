@@ -0,0 +1,89 @@
+"""Cached template fragments and the cached flight detail page.
+
+Templates cache the search dropdowns and the shared layout with
+``{% cache %}``, varying on the language and on a version from
+``fragment_versions`` (see ``booking.context_processors``) that the signals
+in ``booking.signals`` bump when the data behind a fragment changes. The
+versions live in the same cache as the fragments, so a bump made by one
+process is seen by all of them.
+
+The flight detail page is cached whole, once per flight, language and
+audience (anonymous, member or admin, which is all the navigation bar
+depends on), and deleted when the flight is saved, once that transaction
+has committed so that a concurrent request cannot cache the old row again.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.db import transaction
+from django.utils.translation import get_language
+
+VERSION_KEY = "booking:fragments:version:{name}"
+FLIGHT_DETAIL_KEY = "booking:flight-detail:{version}:{flight_id}:{language}:{audience}"
+AUDIENCES = ("anonymous", "member", "admin")
+REFERENCE_DATA = "reference_data"
+
+
+def _cache():
+    # The {% cache %} tag uses this alias when it is configured.
+    try:
+        return caches["template_fragments"]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+def timeout():
+    return getattr(settings, "BOOKING_FRAGMENT_CACHE_TTL", 3600)
+
+
+def version(name):
+    cache = _cache()
+    key = VERSION_KEY.format(name=name)
+    value = cache.get(key)
+    if value is None:
+        # Seeded from the clock so an evicted counter never reuses an old version.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        value = cache.get(key, 0)
+    return value
+
+
+def invalidate(name):
+    """Make every cached variant of the fragments that vary on ``name`` miss."""
+    try:
+        _cache().incr(VERSION_KEY.format(name=name))
+    except ValueError:
+        version(name)
+
+
+def _audience(user):
+    if not user.is_authenticated:
+        return "anonymous"
+    return "admin" if user.is_superuser else "member"
+
+
+def _flight_detail_key(flight_id, language, audience):
+    return FLIGHT_DETAIL_KEY.format(
+        version=version(REFERENCE_DATA), flight_id=flight_id, language=language, audience=audience
+    )
+
+
+def get_flight_detail(request, flight_id):
+    """The cached page content of a flight for this request, or None."""
+    return _cache().get(_flight_detail_key(flight_id, get_language(), _audience(request.user)))
+
+
+def set_flight_detail(request, flight_id, content):
+    _cache().set(_flight_detail_key(flight_id, get_language(), _audience(request.user)), content, timeout())
+
+
+def invalidate_flight(flight_id):
+    """Delete the cached pages of a flight once the current transaction commits."""
+    transaction.on_commit(lambda: _delete_flight_detail(flight_id))
+
+
+def _delete_flight_detail(flight_id):
+    languages = {code for code, _name in settings.LANGUAGES} | {settings.LANGUAGE_CODE}
+    _cache().delete_many([
+        _flight_detail_key(flight_id, language, audience) for language in languages for audience in AUDIENCES
+    ])
@@ -0,0 +1,127 @@
+"""Idempotency keys for the checkout submissions.
+
+Every checkout form carries a one-time key in a hidden field; API clients
+may send an ``Idempotency-Key`` header instead. The first request with a
+key claims it by inserting a row under a unique constraint, and the
+response it produces is stored on that row. Retries and double-clicks
+with the same key get the stored response back without running the view
+again, until the key expires.
+"""
+import hashlib
+import secrets
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .constants import IDEMPOTENCY_KEY_MAX_LENGTH, IDEMPOTENCY_KEY_TTL_HOURS, IDEMPOTENCY_WAIT_SECONDS
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+FIELD = 'idempotency_key'
+_IGNORED_FIELDS = {FIELD, 'csrfmiddlewaretoken'}
+
+
+def new_key():
+    """A key for the hidden field of a form that is about to be rendered."""
+    return secrets.token_urlsafe(24)
+
+
+def _fingerprint(request):
+    """Hash of the submitted fields, to refuse a key reused for another submission."""
+    fields = sorted(
+        (name, value) for name, values in request.POST.lists() if name not in _IGNORED_FIELDS for value in values
+    )
+    return hashlib.sha256(repr(fields).encode()).hexdigest()
+
+
+def _claim(account, scope, key, fingerprint):
+    """Return ``(record, created)``; only the request that created the record runs the view."""
+    for _attempt in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    account=account, scope=scope, key=key, fingerprint=fingerprint,
+                    expires_at=timezone.now() + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(account=account, scope=scope, key=key).first()
+            if record is not None and record.expires_at > timezone.now():
+                return record, False
+            # Expired keys may be used again.
+            IdempotencyKey.objects.expired().filter(account=account, scope=scope, key=key).delete()
+    raise IntegrityError(f"Could not claim idempotency key {key!r}")
+
+
+def _wait_for_response(record):
+    """Poll a key still being processed by a concurrent request until its response is stored."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while not record.is_complete() and time.monotonic() < deadline:
+        time.sleep(0.1)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record if record.is_complete() else None
+
+
+def _replay(record):
+    response = HttpResponse(
+        bytes(record.response_body or b''), status=record.response_status,
+        content_type=record.response_content_type or None
+    )
+    if record.response_location:
+        response['Location'] = record.response_location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _store(record, response):
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        response_status=response.status_code,
+        response_content_type=response.get('Content-Type', ''),
+        response_location=response.get('Location', ''),
+        response_body=response.content,
+    )
+
+
+def idempotent(scope):
+    """Run a POST view at most once per idempotency key and account.
+
+    Requests without a key, or from anonymous users, run as before. Server
+    errors and exceptions free the key so the submission can be retried.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.META.get(HEADER) or request.POST.get(FIELD)
+            if request.method != 'POST' or not key or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return HttpResponse(_("The idempotency key is too long."), status=400)
+
+            fingerprint = _fingerprint(request)
+            record, created = _claim(request.user, scope, key, fingerprint)
+            if not created:
+                if record.fingerprint != fingerprint:
+                    return HttpResponse(_("This idempotency key was used for a different submission."), status=422)
+                record = _wait_for_response(record)
+                if record is None:
+                    return HttpResponse(_("This submission is still being processed."), status=409)
+                return _replay(record)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.streaming or response.status_code >= 500:
+                record.delete()
+            else:
+                _store(record, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,77 @@
+"""Database-backed queue for work that can run after the response is sent.
+
+Handlers are plain functions registered with ``@job`` and called with the
+payload as keyword arguments, so payloads must be JSON serialisable.
+``enqueue`` inserts the job once the current transaction has committed,
+and the ``runworker`` command claims and runs them, retrying failures with
+exponential backoff.
+
+Delivery is at least once: a job whose worker stops sending heartbeats for
+``JOB_STALE_SECONDS`` is queued again, and may already have done part of
+its work, so handlers should be safe to run twice.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .constants import JOB_RETRY_BASE_SECONDS
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def job(name):
+    """Register the decorated function as the handler of jobs called ``name``."""
+    def register(func):
+        _handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, delay=None, **payload):
+    """Queue ``name`` to run with ``payload`` once the current transaction commits."""
+    if name not in _handlers:
+        raise KeyError(f"No job handler registered as {name!r}")
+
+    def create():
+        Job.objects.create(
+            name=name, payload=payload, run_at=timezone.now() + (delay or timedelta())
+        )
+    transaction.on_commit(create)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def run(job_instance):
+    """Run a claimed job and record its outcome. Returns True when it succeeded."""
+    close_old_connections()
+    try:
+        handler = _handlers.get(job_instance.name)
+        if handler is None:
+            raise KeyError(f"No job handler registered as {job_instance.name!r}")
+        handler(**job_instance.payload)
+    except Exception:
+        error = traceback.format_exc()
+        finished = job_instance.attempts >= job_instance.max_attempts
+        logger.warning("Job %s (%s) failed on attempt %d", job_instance.job_id, job_instance.name,
+                       job_instance.attempts, exc_info=True)
+        Job.objects.filter(pk=job_instance.pk).update(
+            status='Failed' if finished else 'Pending',
+            run_at=timezone.now() + retry_delay(job_instance.attempts),
+            locked_by='',
+            last_error=error,
+            finished_at=timezone.now() if finished else None,
+        )
+        return False
+    else:
+        Job.objects.filter(pk=job_instance.pk).update(status='Done', locked_by='', finished_at=timezone.now())
+        return True
+    finally:
+        close_old_connections()
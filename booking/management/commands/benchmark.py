@@ -0,0 +1,195 @@
+import json
+import random
+import re
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from booking import idempotency
+from booking.models import Account, Booking, Flight, FlightTicketType, RouteDayAvailability
+
+SCENARIOS = ["index", "flight_list", "user_bookings", "payment_view", "process_view"]
+SAMPLE_SIZE = 500
+CHECKOUT_ID_FIELD = re.compile(r'name="checkout_id" value="([^"]+)"')
+
+
+def percentile(quantiles, p):
+    return round(quantiles[p - 1], 3)
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and query counts of one scenario."""
+    durations = [duration for duration, _, _ in samples]
+    query_counts = [queries for _, queries, _ in samples]
+    quantiles = statistics.quantiles(durations, n=100, method="inclusive") if len(durations) > 1 else durations * 99
+    return {
+        "requests": len(samples),
+        "p50_ms": percentile(quantiles, 50),
+        "p95_ms": percentile(quantiles, 95),
+        "p99_ms": percentile(quantiles, 99),
+        "mean_ms": round(statistics.fmean(durations), 3),
+        "max_ms": round(max(durations), 3),
+        "queries_min": min(query_counts),
+        "queries_max": max(query_counts),
+        "queries_mean": round(statistics.fmean(query_counts), 2),
+        "status_codes": sorted({status for _, _, status in samples}),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the booking hot paths through the test client and report latency percentiles and "
+        "query counts. Every request runs in a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per scenario.")
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS, dest="scenarios",
+                            help="Scenario to run; repeat for several. Defaults to all.")
+        parser.add_argument("--username", help="Account to log in as. Defaults to the one with most bookings.")
+        parser.add_argument("--host", default="localhost", help="Host header sent with every request.")
+        parser.add_argument("--cold-cache", action="store_true", help="Clear the caches before every request.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for picking searches and fares.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--compare", help="Previous JSON results to print the differences against.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.account = self.get_account(options["username"])
+        self.client = Client(HTTP_HOST=options["host"])
+        self.client.force_login(self.account)
+        self.load_samples()
+
+        results = {}
+        for name in options["scenarios"] or SCENARIOS:
+            prepare = getattr(self, f"prepare_{name}")
+            for _ in range(options["warmup"]):
+                self.run_once(prepare, options["cold_cache"])
+            samples = [self.run_once(prepare, options["cold_cache"]) for _ in range(options["iterations"])]
+            results[name] = summarize(samples)
+            self.report(name, results[name])
+
+        report = {
+            "generated_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "iterations": options["iterations"],
+            "cold_cache": options["cold_cache"],
+            "dataset": {
+                "flights": Flight.objects.count(),
+                "flight_ticket_types": FlightTicketType.objects.count(),
+                "accounts": Account.objects.count(),
+                "bookings": Booking.objects.count(),
+            },
+            "scenarios": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def get_account(self, username):
+        if username:
+            try:
+                return Account.objects.get(username=username)
+            except Account.DoesNotExist:
+                raise CommandError(f"Account {username!r} does not exist.")
+        account = Account.objects.annotate(bookings=Count("booking")).order_by("-bookings", "pk").first()
+        if account is None:
+            raise CommandError("No accounts to benchmark with; run generate_synthetic_data first.")
+        return account
+
+    def load_samples(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.searches = list(RouteDayAvailability.objects.filter(
+            travel_date__gte=tomorrow, max_available_seats__gte=1
+        ).values_list(
+            "departure_airport_id", "arrival_airport_id", "travel_date", "ticket_type__name"
+        )[:SAMPLE_SIZE])
+        self.fares = list(FlightTicketType.objects.filter(
+            flight__departure_time__gte=timezone.now() + timedelta(days=1), available_seats__gte=1
+        ).values_list("flight_id", "ticket_type__name")[:SAMPLE_SIZE])
+        if not self.searches or not self.fares:
+            raise CommandError("No upcoming flights with seats; run generate_synthetic_data first.")
+
+    def run_once(self, prepare, cold_cache):
+        with transaction.atomic():
+            method, url, data = prepare()
+            if cold_cache:
+                for cache in caches.all():
+                    cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = getattr(self.client, method)(url, data)
+                duration = (time.perf_counter() - start) * 1000
+            transaction.set_rollback(True)
+        return duration, len(queries), response.status_code
+
+    def prepare_index(self):
+        departure, arrival, travel_date, ticket_type = self.rng.choice(self.searches)
+        return "get", reverse("index"), {
+            "tripType": "oneway", "from": departure, "to": arrival, "departureDate": travel_date.isoformat(),
+            "numPassengers": 1, "chairType": ticket_type,
+        }
+
+    def prepare_flight_list(self):
+        return "get", reverse("flight"), {}
+
+    def prepare_user_bookings(self):
+        return "get", reverse("user_bookings"), {}
+
+    def checkout_data(self):
+        flight_id, ticket_type = self.rng.choice(self.fares)
+        return {
+            "flight1": flight_id, "flight1Class": ticket_type, "numPassengers": 1,
+            "countryCode": "84", "mobile": "912345678", "email": "benchmark@example.com",
+            "passenger0Fname": "Bench", "passenger0Lname": "Mark", "passenger0Gender": "Male",
+            "passenger0DateOfBirth": "1990-01-01", "passenger0Nationality": "Vietnamese",
+            "passenger0PassportNumber": "N1234567", "passenger0CountryOfIssue": "Vietnam",
+            "passenger0PassportExpireDate": f"{timezone.localdate().year + 5}-01-01",
+            "idempotency_key": idempotency.new_key(),
+        }
+
+    def prepare_payment_view(self):
+        return "post", reverse("payment"), self.checkout_data()
+
+    def prepare_process_view(self):
+        """Check out untimed first, so only the payment step is measured."""
+        response = self.client.post(reverse("payment"), self.checkout_data())
+        checkout_id = CHECKOUT_ID_FIELD.search(response.content.decode())
+        return "post", reverse("process"), {
+            "checkout_id": checkout_id and checkout_id.group(1), "cardNumber": "4111111111111111",
+            "cardHolderName": "Bench Mark", "expMonth": "12", "expYear": f"{timezone.localdate().year + 5}",
+            "cardType": "Visa", "idempotency_key": idempotency.new_key(),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<14} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+            f"p99 {result['p99_ms']:>9.2f} ms  queries {result['queries_min']}-{result['queries_max']}  "
+            f"status {','.join(map(str, result['status_codes']))}"
+        )
+
+    def compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)["scenarios"]
+        for name, result in results.items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+            self.stdout.write(
+                f"{name:<14} p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms ({change:+.1f}%)  "
+                f"queries {before['queries_max']} -> {result['queries_max']}"
+            )
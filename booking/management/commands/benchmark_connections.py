@@ -0,0 +1,127 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from booking.db_backends.pool import ConnectionPoolMixin, clear_pool
+from booking.management.commands.benchmark import percentile
+from booking.models import RouteDayAvailability
+
+MODES = ["new", "persistent", "persistent_checked", "pooled"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what connection handling adds to a cheap request. Each iteration sends the request "
+        "started/finished signals around one availability lookup, as a real request would, under: a new "
+        "connection per request, persistent connections with and without health checks, and the pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200, help="Simulated requests per mode.")
+        parser.add_argument("--mode", action="append", choices=MODES, dest="modes",
+                            help="Mode to run; repeat for several. Defaults to all.")
+        parser.add_argument("--max-age", type=int, default=60, help="CONN_MAX_AGE of the persistent modes.")
+        parser.add_argument("--pool-size", type=int, default=4, help="POOL_SIZE of the pooled mode.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database alias to measure.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        self.connection = connections[options["database"]]
+        self.route_days = list(RouteDayAvailability.objects.using(options["database"]).values_list(
+            "departure_airport_id", "arrival_airport_id", "travel_date"
+        )[:500]) or [("HAN", "SGN", timezone.localdate() + timedelta(days=1))]
+        self.rng = random.Random(0)
+        modes = {
+            "new": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "POOL_SIZE": 0},
+            "persistent": {"CONN_MAX_AGE": options["max_age"], "CONN_HEALTH_CHECKS": False, "POOL_SIZE": 0},
+            "persistent_checked": {"CONN_MAX_AGE": options["max_age"], "CONN_HEALTH_CHECKS": True, "POOL_SIZE": 0},
+            "pooled": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "POOL_SIZE": options["pool_size"]},
+        }
+        if options["modes"] == ["pooled"] and not isinstance(self.connection, ConnectionPoolMixin):
+            raise CommandError("The pooled mode needs a pooled engine; set DATABASE_POOL_SIZE.")
+
+        original = {key: self.connection.settings_dict.get(key) for key in modes["new"]}
+        results = {}
+        try:
+            for name in options["modes"] or MODES:
+                if name == "pooled" and not isinstance(self.connection, ConnectionPoolMixin):
+                    self.stdout.write(f"{name:<19} skipped: the {options['database']!r} engine has no pool.")
+                    continue
+                results[name] = self.measure(modes[name], options["iterations"])
+                self.report(name, results[name])
+        finally:
+            self.configure(original)
+
+        if "new" in results:
+            for name, result in results.items():
+                if name != "new":
+                    saved = results["new"]["p50_ms"] - result["p50_ms"]
+                    self.stdout.write(f"{name:<19} saves {saved:.3f} ms per request at p50 over a new connection")
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({
+                    "generated_at": timezone.now().isoformat(),
+                    "database": self.connection.vendor,
+                    "iterations": options["iterations"],
+                    "modes": results,
+                }, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+
+    def configure(self, settings_dict):
+        self.connection.close()
+        clear_pool(self.connection.alias)
+        self.connection.settings_dict.update(settings_dict)
+
+    def measure(self, mode, iterations):
+        self.configure(mode)
+        # connection_created also fires for pooled connections, so new ones are told apart by identity.
+        opened = set()
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == self.connection.alias:
+                opened.add(connection.connection)
+        connection_created.connect(count)
+        try:
+            self.request()  # Warm up: the first connection is opened in every mode.
+            warm = set(opened)
+            durations = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                self.request()
+                durations.append((time.perf_counter() - start) * 1000)
+        finally:
+            connection_created.disconnect(count)
+        quantiles = statistics.quantiles(durations, n=100, method="inclusive") if len(durations) > 1 else durations * 99
+        return {
+            "requests": len(durations),
+            "p50_ms": percentile(quantiles, 50),
+            "p95_ms": percentile(quantiles, 95),
+            "p99_ms": percentile(quantiles, 99),
+            "mean_ms": round(statistics.fmean(durations), 3),
+            "connections_opened": len(opened - warm),
+        }
+
+    def request(self):
+        """One cheap request: the signals run close_old_connections as the handlers do."""
+        request_started.send(sender=self.__class__)
+        try:
+            departure, arrival, travel_date = self.rng.choice(self.route_days)
+            RouteDayAvailability.objects.using(self.connection.alias).filter(
+                departure_airport_id=departure, arrival_airport_id=arrival, travel_date=travel_date
+            ).first()
+        finally:
+            request_finished.send(sender=self.__class__)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<19} p50 {result['p50_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms  "
+            f"p99 {result['p99_ms']:>8.3f} ms  connections opened {result['connections_opened']}"
+        )
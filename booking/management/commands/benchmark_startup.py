@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone, translation
+
+# Run in a fresh interpreter: time django.setup(), then each URL twice.
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+result = {"setup_ms": (time.perf_counter() - start) * 1000, "first_ms": {}, "second_ms": {}}
+from django.test import Client
+client = Client(HTTP_HOST=sys.argv[1])
+for url in sys.argv[2:]:
+    for attempt in ("first_ms", "second_ms"):
+        start = time.perf_counter()
+        response = client.get(url)
+        result[attempt][url] = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise SystemExit(f"{url} returned {response.status_code}")
+print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure startup and first-request latency of fresh worker processes, with and without the "
+        "template and translation warm-up of booking.warmup. Each run starts a new interpreter with the "
+        "current settings module."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Processes started per mode.")
+        parser.add_argument("--url", action="append", dest="urls",
+                            help="URL to request; repeat for several. Defaults to pages in every language.")
+        parser.add_argument("--host", default="localhost", help="Host header sent with every request.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        urls = options["urls"] or self.default_urls()
+        results = {}
+        for mode, warm_up in (("cold", "false"), ("warm", "true")):
+            runs = [self.run_child(warm_up, options["host"], urls) for _ in range(options["runs"])]
+            results[mode] = self.summarize(runs, urls)
+            self.report(mode, results[mode])
+
+        cold, warm = results["cold"], results["warm"]
+        self.stdout.write(
+            f"Warm-up moves {cold['first_requests_ms'] - warm['first_requests_ms']:.1f} ms out of the first "
+            f"requests and adds {warm['setup_ms'] - cold['setup_ms']:.1f} ms to startup."
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({
+                    "generated_at": timezone.now().isoformat(),
+                    "settings": os.environ.get("DJANGO_SETTINGS_MODULE"),
+                    "runs": options["runs"],
+                    "modes": results,
+                }, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+
+    def default_urls(self):
+        urls = []
+        for language, _name in settings.LANGUAGES:
+            with translation.override(language):
+                urls += [reverse("index"), reverse("flight"), reverse("login")]
+        return urls
+
+    def run_child(self, warm_up, host, urls):
+        env = {**os.environ, "BOOKING_WARM_UP": warm_up}
+        env.setdefault("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE)
+        process = subprocess.run(
+            [sys.executable, "-c", CHILD, host, *urls],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise CommandError(f"The benchmark process failed:\n{process.stderr or process.stdout}")
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def summarize(self, runs, urls):
+        """Medians over the runs, in ms."""
+        return {
+            "setup_ms": round(statistics.median(run["setup_ms"] for run in runs), 3),
+            "first_requests_ms": round(statistics.median(sum(run["first_ms"].values()) for run in runs), 3),
+            "second_requests_ms": round(statistics.median(sum(run["second_ms"].values()) for run in runs), 3),
+            "first_ms": {url: round(statistics.median(run["first_ms"][url] for run in runs), 3) for url in urls},
+        }
+
+    def report(self, mode, result):
+        self.stdout.write(
+            f"{mode:<5} setup {result['setup_ms']:>8.1f} ms  first requests {result['first_requests_ms']:>8.1f} ms  "
+            f"same requests again {result['second_requests_ms']:>8.1f} ms"
+        )
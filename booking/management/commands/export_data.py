@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from booking import exports
+from booking.constants import EXPORT_CHUNK_SIZE
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+class Command(BaseCommand):
+    help = "Export bookings or payments as CSV or JSONL, streaming rows in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(exports.EXPORTS))
+        parser.add_argument("--format", choices=exports.FORMATS, default="csv", dest="file_format")
+        parser.add_argument("--start", type=_date, help="First day to export (YYYY-MM-DD).")
+        parser.add_argument("--end", type=_date, help="Last day to export (YYYY-MM-DD), included.")
+        parser.add_argument("--output", help="File to write to. Defaults to standard output.")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Rows read per query.")
+
+    def handle(self, *args, **options):
+        if options["start"] and options["end"] and options["start"] > options["end"]:
+            raise CommandError("--start must not be after --end.")
+        lines = exports.stream(
+            options["kind"], options["file_format"],
+            start=options["start"], end=options["end"], chunk_size=options["chunk_size"]
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
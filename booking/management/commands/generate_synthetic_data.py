@@ -0,0 +1,164 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from booking.models import Account, Airport, Booking, Flight, FlightTicketType, RouteDayAvailability, TicketType
+
+SYNTHETIC_PREFIX = "SYN"
+SYNTHETIC_PASSWORD = "benchmark123"
+COUNTRIES = ["Vietnam", "Vietnam", "Vietnam", "Thailand", "Singapore", "Japan"]
+BOOKED_FLIGHT_SAMPLE_SIZE = 10000
+TICKET_TYPES = {"Economy": (800000, 3000000, 180), "Business": (3000000, 9000000, 24)}
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic airports, flights, fares, accounts and bookings for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--airports", type=int, default=20, help="Number of airports.")
+        parser.add_argument("--days", type=int, default=30, help="Days of schedule, starting tomorrow.")
+        parser.add_argument("--flights-per-day", type=int, default=200, help="Flights departing each day.")
+        parser.add_argument("--accounts", type=int, default=1000, help="Number of member accounts.")
+        parser.add_argument("--bookings", type=int, default=10000, help="Number of confirmed bookings.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows inserted per statement.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible data sets.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        with transaction.atomic():
+            airports = self.create_airports(options["airports"])
+            ticket_types = [
+                TicketType.objects.filter(name=name).first() or TicketType.objects.create(name=name)
+                for name in TICKET_TYPES
+            ]
+            flight_ids = self.create_flights(
+                rng, airports, ticket_types, options["days"], options["flights_per_day"], batch_size)
+            accounts = self.create_accounts(options["accounts"], batch_size)
+            fares = self.sample_fares(rng, flight_ids, BOOKED_FLIGHT_SAMPLE_SIZE)
+            booking_count = self.create_bookings(rng, accounts, fares, options["bookings"], batch_size)
+            self.reset_sequences()
+            # bulk_create sends no signals, so the search summary is rebuilt in one go.
+            RouteDayAvailability.objects.rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(airports)} airport(s), {len(flight_ids)} flight(s) with {len(ticket_types)} fare(s) each, "
+            f"{len(accounts)} account(s) and {booking_count} booking(s)."
+        ))
+
+    def create_airports(self, count):
+        airports = [
+            Airport(
+                airport_code=f"{SYNTHETIC_PREFIX}{i:03d}",
+                name=f"Synthetic Airport {i}",
+                city=f"Synthetic City {i}",
+                country=COUNTRIES[i % len(COUNTRIES)],
+            )
+            for i in range(count)
+        ]
+        Airport.objects.bulk_create(airports, ignore_conflicts=True)
+        return airports
+
+    def create_flights(self, rng, airports, ticket_types, days, flights_per_day, batch_size):
+        """Insert flights and their fares one batch at a time; return the flight ids used.
+
+        Primary keys are assigned here rather than read back, because not
+        every backend returns them from a bulk insert.
+        """
+        first_flight_id = next_flight_id = (Flight.objects.aggregate(last=Max("flight_id"))["last"] or 0) + 1
+        first_day = timezone.localdate() + timedelta(days=1)
+        flights = []
+        fares = []
+        for day_offset in range(days):
+            midnight = timezone.make_aware(datetime.combine(first_day + timedelta(days=day_offset), time.min))
+            for _ in range(flights_per_day):
+                departure, arrival = rng.sample(airports, 2)
+                departure_time = midnight + timedelta(minutes=rng.randrange(5 * 60, 23 * 60, 5))
+                flights.append(Flight(
+                    flight_id=next_flight_id,
+                    flight_number=f"{SYNTHETIC_PREFIX}{next_flight_id}",
+                    airline="Synthetic Air",
+                    departure_airport_id=departure.airport_code,
+                    arrival_airport_id=arrival.airport_code,
+                    departure_time=departure_time,
+                    arrival_time=departure_time + timedelta(minutes=rng.randrange(60, 6 * 60, 5)),
+                ))
+                for ticket_type in ticket_types:
+                    low, high, seats = TICKET_TYPES[ticket_type.name]
+                    fares.append(FlightTicketType(
+                        flight_id=next_flight_id,
+                        ticket_type=ticket_type,
+                        price=Decimal(rng.randrange(low, high, 10000)),
+                        available_seats=rng.randint(0, seats),
+                    ))
+                next_flight_id += 1
+                if len(flights) >= batch_size:
+                    self.flush_flights(flights, fares, batch_size)
+                    flights, fares = [], []
+        self.flush_flights(flights, fares, batch_size)
+        return range(first_flight_id, next_flight_id)
+
+    def flush_flights(self, flights, fares, batch_size):
+        Flight.objects.bulk_create(flights, batch_size=batch_size)
+        FlightTicketType.objects.bulk_create(fares, batch_size=batch_size)
+
+    def sample_fares(self, rng, flight_ids, size):
+        """Fares with seats left on a random sample of the new flights."""
+        sample = rng.sample(flight_ids, min(size, len(flight_ids)))
+        fares = []
+        for start in range(0, len(sample), 1000):
+            fares.extend(FlightTicketType.objects.filter(
+                flight_id__in=sample[start:start + 1000], available_seats__gt=0
+            ).values_list("pk", "available_seats"))
+        return fares
+
+    def create_accounts(self, count, batch_size):
+        next_account_id = (Account.objects.aggregate(last=Max("account_id"))["last"] or 0) + 1
+        # Hashing is deliberately slow, so every account shares one hash.
+        password = make_password(SYNTHETIC_PASSWORD)
+        accounts = [
+            Account(
+                account_id=next_account_id + i,
+                username=f"synthetic{next_account_id + i}",
+                password=password,
+                email=f"synthetic{next_account_id + i}@example.com",
+                phone_number=f"09{next_account_id + i:08d}"[:10],
+                role="Member",
+            )
+            for i in range(count)
+        ]
+        Account.objects.bulk_create(accounts, batch_size=batch_size)
+        return accounts
+
+    def create_bookings(self, rng, accounts, fares, count, batch_size):
+        if not accounts or not fares:
+            return 0
+        bookings = []
+        created = 0
+        for _ in range(count):
+            flight_ticket_type_id, available_seats = rng.choice(fares)
+            bookings.append(Booking(
+                account_id=rng.choice(accounts).account_id,
+                flight_ticket_type_id=flight_ticket_type_id,
+                seat_count=rng.randint(1, min(available_seats, 4)),
+                status="Confirmed",
+            ))
+            if len(bookings) >= batch_size:
+                Booking.objects.bulk_create(bookings, batch_size=batch_size)
+                created += len(bookings)
+                bookings = []
+        Booking.objects.bulk_create(bookings, batch_size=batch_size)
+        return created + len(bookings)
+
+    def reset_sequences(self):
+        """Move sequences past the explicit primary keys (a no-op on MySQL and SQLite)."""
+        statements = connection.ops.sequence_reset_sql(no_style(), [Flight, Account])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,328 @@
+import csv
+import json
+import os
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from booking import fragment_cache, route_graph, search_cache
+from booking.models import Airport, Booking, Flight, FlightTicketType, RouteDayAvailability, SeatMap, TicketType
+
+FLIGHT_FIELDS = ["airline", "departure_airport_id", "arrival_airport_id", "arrival_time"]
+REQUIRED_CSV_COLUMNS = {
+    "flight_number", "departure_airport", "arrival_airport", "departure_time", "arrival_time",
+    "ticket_type", "price", "available_seats",
+}
+
+
+class ScheduleError(Exception):
+    pass
+
+
+def _datetime(value, tz):
+    parsed = parse_datetime(f"{value}".strip())
+    if parsed is None:
+        raise ScheduleError(f"invalid date and time {value!r}")
+    return timezone.make_aware(parsed, tz) if timezone.is_naive(parsed) else parsed
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update flights and their fares from a CSV or JSON schedule. Flights are matched "
+        "on flight number and departure time; rows are written in batches inside one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with one row per flight and ticket type, or a JSON list of flights.")
+        parser.add_argument("--format", choices=["csv", "json"], dest="file_format",
+                            help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Flights handled per batch of queries.")
+        parser.add_argument("--update-seats", action="store_true",
+                            help="Reset the seats of existing fares, less those already sold or held; "
+                                 "by default only new fares get seats.")
+        parser.add_argument("--dry-run", action="store_true", help="Report the changes without writing them.")
+
+    def handle(self, *args, **options):
+        file_format = options["file_format"] or os.path.splitext(options["path"])[1].lstrip(".").lower()
+        if file_format not in ("csv", "json"):
+            raise CommandError("Cannot tell the file format; pass --format csv or --format json.")
+        self.airports = set(Airport.objects.values_list("airport_code", flat=True))
+        self.ticket_types = dict(TicketType.objects.values_list("name", "ticket_type_id"))
+        self.ticket_type_names = {ticket_type_id: name for name, ticket_type_id in self.ticket_types.items()}
+        self.timezone = timezone.get_current_timezone()
+        self.verbosity = options["verbosity"]
+        self.update_seats = options["update_seats"]
+        self.dry_run = options["dry_run"]
+
+        with open(options["path"], newline="") as schedule:
+            records = self.read_csv(schedule) if file_format == "csv" else self.read_json(schedule)
+
+        self.summary = Counter()
+        self.route_days = set()
+        self.changed_flight_ids = set()
+        with transaction.atomic():
+            for batch in _chunks(records.values(), options["batch_size"]):
+                self.import_batch(batch)
+            if not self.dry_run and self.route_days:
+                # Bulk writes send no signals, so derived data is refreshed here.
+                self.refresh_availability()
+                transaction.on_commit(self.invalidate_caches)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would create' if self.dry_run else 'Created'} {self.summary['flights_created']} flight(s) and "
+            f"{self.summary['fares_created']} fare(s); "
+            f"{'would update' if self.dry_run else 'updated'} {self.summary['flights_updated']} flight(s) and "
+            f"{self.summary['fares_updated']} fare(s); {self.summary['unchanged']} flight(s) unchanged."
+        ))
+
+    def build_record(self, row, line):
+        try:
+            departure = f"{row['departure_airport']}".strip().upper()
+            arrival = f"{row['arrival_airport']}".strip().upper()
+            for code in (departure, arrival):
+                if code not in self.airports:
+                    raise ScheduleError(f"unknown airport {code!r}")
+            if departure == arrival:
+                raise ScheduleError("departure and arrival airports are the same")
+            departure_time = _datetime(row["departure_time"], self.timezone)
+            arrival_time = _datetime(row["arrival_time"], self.timezone)
+            if arrival_time <= departure_time:
+                raise ScheduleError("arrival is not after departure")
+            return {
+                "flight_number": f"{row['flight_number']}".strip(),
+                "airline": f"{row.get('airline') or ''}".strip(),
+                "departure_airport_id": departure,
+                "arrival_airport_id": arrival,
+                "departure_time": departure_time,
+                "arrival_time": arrival_time,
+                "fares": {},
+            }
+        except KeyError as e:
+            raise CommandError(f"{line}: missing {e.args[0]}")
+        except ScheduleError as e:
+            raise CommandError(f"{line}: {e}")
+
+    def add_fare(self, record, fare, line):
+        try:
+            ticket_type_id = self.ticket_types.get(f"{fare['ticket_type']}".strip())
+            if ticket_type_id is None:
+                raise ScheduleError(f"unknown ticket type {fare['ticket_type']!r}")
+            price = Decimal(f"{fare['price']}")
+            available_seats = int(fare["available_seats"])
+            if price < 0 or available_seats < 0:
+                raise ScheduleError("price and seats cannot be negative")
+        except KeyError as e:
+            raise CommandError(f"{line}: missing {e.args[0]}")
+        except (InvalidOperation, ValueError):
+            raise CommandError(f"{line}: invalid price or seats")
+        except ScheduleError as e:
+            raise CommandError(f"{line}: {e}")
+        record["fares"][ticket_type_id] = (price, available_seats)
+
+    def read_csv(self, schedule):
+        """One row per flight and ticket type; rows of the same flight are merged."""
+        reader = csv.DictReader(schedule)
+        missing = REQUIRED_CSV_COLUMNS - set(reader.fieldnames or [])
+        if missing:
+            raise CommandError(f"Missing column(s): {', '.join(sorted(missing))}.")
+        records = {}
+        for row in reader:
+            line = f"line {reader.line_num}"
+            record = self.build_record(row, line)
+            record = records.setdefault((record["flight_number"], record["departure_time"]), record)
+            self.add_fare(record, row, line)
+        return records
+
+    def read_json(self, schedule):
+        """A list of flights, each with a list of fares."""
+        try:
+            flights = json.load(schedule)
+        except ValueError as e:
+            raise CommandError(f"Invalid JSON: {e}")
+        if not isinstance(flights, list):
+            raise CommandError("The JSON schedule must be a list of flights.")
+        records = {}
+        for index, flight in enumerate(flights):
+            line = f"flight {index}"
+            record = self.build_record(flight, line)
+            for fare in flight.get("fares", []):
+                self.add_fare(record, fare, line)
+            records[(record["flight_number"], record["departure_time"])] = record
+        return records
+
+    def import_batch(self, records):
+        """Diff a batch against the database with two queries, then write it with bulk queries."""
+        keys = {(record["flight_number"], record["departure_time"]) for record in records}
+        existing = {
+            (flight.flight_number, flight.departure_time): flight
+            for flight in Flight.objects.filter(
+                flight_number__in={number for number, _ in keys},
+                departure_time__gte=min(departure_time for _, departure_time in keys),
+                departure_time__lte=max(departure_time for _, departure_time in keys),
+            )
+        }
+        fares = FlightTicketType.objects.filter(flight__in=list(existing.values()))
+        if self.update_seats and not self.dry_run:
+            # Bookings wait for the import, so the seats taken cannot change under it.
+            fares = fares.select_for_update()
+        existing_fares = {(fare.flight_id, fare.ticket_type_id): fare for fare in fares}
+        taken_seats = self.taken_seats(existing_fares.values()) if self.update_seats else {}
+
+        new_flights, changed_fares, new_fares = [], [], []
+        changed_flights = defaultdict(list)
+        pending_fares = []
+        for record in records:
+            key = (record["flight_number"], record["departure_time"])
+            flight = existing.get(key)
+            if flight is None:
+                flight = Flight(**{field: value for field, value in record.items() if field != "fares"})
+                new_flights.append(flight)
+                pending_fares.append((flight, record["fares"]))
+                self.report("+", flight, [])
+                continue
+
+            changes, changed_fields = [], []
+            previous_route_day = self.route_day(flight)
+            for field in FLIGHT_FIELDS:
+                if getattr(flight, field) != record[field]:
+                    changes.append(f"{field} {getattr(flight, field)} -> {record[field]}")
+                    setattr(flight, field, record[field])
+                    changed_fields.append(field)
+            if changed_fields:
+                changed_flights[tuple(changed_fields)].append(flight)
+                self.changed_flight_ids.add(flight.flight_id)
+            for ticket_type_id, (price, available_seats) in record["fares"].items():
+                fare = existing_fares.get((flight.flight_id, ticket_type_id))
+                name = self.ticket_type_names[ticket_type_id]
+                if fare is None:
+                    new_fares.append(FlightTicketType(
+                        flight=flight, ticket_type_id=ticket_type_id, price=price, available_seats=available_seats))
+                    changes.append(f"{name} fare added")
+                    continue
+                fare_changes = []
+                if fare.price != price:
+                    fare_changes.append(f"{name} price {fare.price} -> {price}")
+                    fare.price = price
+                if self.update_seats:
+                    taken = taken_seats.get(fare.pk, 0)
+                    if available_seats < taken:
+                        raise CommandError(
+                            f"{flight.flight_number} {flight.departure_time.isoformat()}: {name} has {taken} "
+                            f"seat(s) sold or held, more than the {available_seats} in the schedule.")
+                    if fare.available_seats != available_seats - taken:
+                        fare_changes.append(f"{name} seats {fare.available_seats} -> {available_seats - taken}")
+                        fare.available_seats = available_seats - taken
+                if fare_changes:
+                    changed_fares.append(fare)
+                    changes.extend(fare_changes)
+            if changes:
+                self.route_days.add(previous_route_day)
+                self.summary["flights_updated"] += 1
+                self.report("~", flight, changes)
+            else:
+                self.summary["unchanged"] += 1
+
+        self.summary["flights_created"] += len(new_flights)
+        self.summary["fares_created"] += len(new_fares) + sum(len(fares) for _, fares in pending_fares)
+        self.summary["fares_updated"] += len(changed_fares)
+        self.route_days.update(self.route_day(flight) for flight in new_flights)
+        for flights in changed_flights.values():
+            self.route_days.update(self.route_day(flight) for flight in flights)
+        if self.dry_run:
+            return
+
+        self.create_flights(new_flights)
+        for flight, fares in pending_fares:
+            new_fares.extend(
+                FlightTicketType(flight=flight, ticket_type_id=ticket_type_id, price=price, available_seats=seats)
+                for ticket_type_id, (price, seats) in fares.items()
+            )
+        # bulk_update builds a CASE per field and row, so only the fields that changed are sent.
+        for fields, flights in changed_flights.items():
+            Flight.objects.bulk_update(flights, fields)
+        self.update_fares(changed_fares)
+        FlightTicketType.objects.bulk_create(new_fares)
+
+    def taken_seats(self, fares):
+        """Seats of each fare that are held or sold, which --update-seats keeps out of the available ones."""
+        taken = {fare.pk: fare.held_seats for fare in fares}
+        sold = Booking.objects.filter(flight_ticket_type__in=list(taken)).exclude(status="Canceled").filter(
+            Q(seat_hold__isnull=True) | Q(seat_hold__status="Confirmed")
+        ).values("flight_ticket_type_id").annotate(seats=Sum("seat_count")).order_by()
+        for row in sold:
+            taken[row["flight_ticket_type_id"]] += row["seats"]
+        return taken
+
+    def update_fares(self, fares):
+        """Write changed fares with one UPDATE per distinct price and seat count.
+
+        Schedules mostly reuse a handful of fare levels, and a plain
+        UPDATE ... WHERE pk IN (...) is far cheaper than the per-row CASE
+        bulk_update builds. Mostly distinct values fall back to bulk_update.
+        Seat maps of the fares are dropped, to be rebuilt at the new size
+        with the seats already assigned to bookings kept.
+        """
+        if self.update_seats:
+            SeatMap.objects.filter(flight_ticket_type__in=[fare.pk for fare in fares]).delete()
+        groups = defaultdict(list)
+        for fare in fares:
+            groups[(fare.price, fare.available_seats)].append(fare.pk)
+        if len(groups) * 10 > len(fares):
+            FlightTicketType.objects.bulk_update(fares, ["price", "available_seats"])
+            return
+        for (price, available_seats), ids in groups.items():
+            FlightTicketType.objects.filter(pk__in=ids).update(price=price, available_seats=available_seats)
+
+    def create_flights(self, flights):
+        if not flights:
+            return
+        Flight.objects.bulk_create(flights)
+        if connection.features.can_return_rows_from_bulk_insert:
+            return
+        # Without RETURNING (e.g. MySQL) the new keys are read back in one query.
+        ids = {
+            (flight_number, departure_time): flight_id
+            for flight_id, flight_number, departure_time in Flight.objects.filter(
+                flight_number__in={flight.flight_number for flight in flights},
+                departure_time__gte=min(flight.departure_time for flight in flights),
+                departure_time__lte=max(flight.departure_time for flight in flights),
+            ).values_list("flight_id", "flight_number", "departure_time")
+        }
+        for flight in flights:
+            flight.flight_id = ids[(flight.flight_number, flight.departure_time)]
+
+    def refresh_availability(self):
+        """Rebuild the availability summaries of the route/days the import touched, and only those."""
+        RouteDayAvailability.objects.rebuild(route_days={
+            (departure_airport_id, arrival_airport_id, timezone.localtime(departure_time).date())
+            for departure_airport_id, arrival_airport_id, departure_time in self.route_days
+        })
+
+    def route_day(self, flight):
+        return flight.departure_airport_id, flight.arrival_airport_id, flight.departure_time
+
+    def report(self, marker, flight, changes):
+        if self.verbosity < 2:
+            return
+        line = f"{marker} {flight.flight_number} {flight.departure_time.isoformat()} " \
+               f"{flight.departure_airport_id}-{flight.arrival_airport_id}"
+        self.stdout.write(f"{line}: {'; '.join(changes)}" if changes else line)
+
+    def invalidate_caches(self):
+        for departure_airport_id, arrival_airport_id, departure_time in self.route_days:
+            search_cache.invalidate(departure_airport_id, arrival_airport_id, departure_time)
+            route_graph.invalidate_day(departure_time)
+        for flight_id in self.changed_flight_ids:
+            fragment_cache.invalidate_flight(flight_id)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from booking.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys. Meant to run from cron, e.g. hourly."
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.expired().delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency key(s)."))
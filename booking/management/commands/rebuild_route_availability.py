@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from booking.models import RouteDayAvailability
+
+
+class Command(BaseCommand):
+    help = "Rebuild the route/day availability summary from flights and fares."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        created = RouteDayAvailability.objects.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} route/day availability row(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from booking.models import SeatHold
+
+
+class Command(BaseCommand):
+    help = "Release seat holds whose checkout was abandoned. Meant to run from cron every minute or so."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Holds released per transaction.")
+
+    def handle(self, *args, **options):
+        kwargs = {}
+        if options["batch_size"]:
+            kwargs["batch_size"] = options["batch_size"]
+        released = SeatHold.objects.release_expired(**kwargs)
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired seat hold(s)."))
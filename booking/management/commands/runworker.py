@@ -0,0 +1,74 @@
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from booking import jobs
+from booking.constants import JOB_STALE_SECONDS
+from booking.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs. Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so "
+        "several workers can run side by side, and executed in a pool of threads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Jobs run at the same time.")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Seconds to wait before polling an empty queue again.")
+        parser.add_argument("--stale-after", type=int, default=JOB_STALE_SECONDS,
+                            help="Seconds without a heartbeat after which a running job is assumed lost "
+                                 "and queued again.")
+        parser.add_argument("--once", action="store_true", help="Exit once no job is due instead of polling.")
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: self.stopping.set())
+        counts = {True: 0, False: 0}
+
+        running = {}
+        heartbeat_every = options["stale_after"] / 3
+        last_heartbeat = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="booking-job") as pool:
+            try:
+                while not self.stopping.is_set():
+                    close_old_connections()
+                    for future in [future for future in running if future.done()]:
+                        counts[future.result()] += 1
+                        del running[future]
+                    if running and time.monotonic() - last_heartbeat >= heartbeat_every:
+                        Job.objects.heartbeat(list(running.values()), worker)
+                        last_heartbeat = time.monotonic()
+
+                    Job.objects.requeue_stale(timezone.now() - timedelta(seconds=options["stale_after"]))
+                    claimed = []
+                    if len(running) < concurrency:
+                        claimed = Job.objects.claim(concurrency - len(running), worker)
+                    running.update((pool.submit(jobs.run, job), job.job_id) for job in claimed)
+                    if claimed:
+                        continue
+                    if options["once"] and not running:
+                        break
+                    if running:
+                        wait(running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(options["poll_interval"])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping; waiting for running jobs to finish.")
+            for future in running:
+                counts[future.result()] += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {counts[True]} job(s), {counts[False]} failed."))
@@ -0,0 +1,101 @@
+"""In-process request metrics, aggregated per view.
+
+Each worker keeps its own numbers; nothing is shared between processes.
+Latencies go into fixed histogram buckets so memory stays constant no
+matter how many requests are recorded, and percentiles are read back as
+the upper bound of the bucket they fall in.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+TOP_DUPLICATES = 10
+
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r"\(\s*(%s|\?)(\s*,\s*(%s|\?))*\s*\)")
+
+_lock = threading.Lock()
+_views = {}
+
+
+def fingerprint(sql):
+    """Reduce a statement to its shape, so the same query with other values matches."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("(...)", sql)
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.db_ms = 0.0
+        self.duplicate_queries = 0
+        self.slow_requests = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.duplicates = Counter()
+
+    def add(self, duration_ms, queries, db_ms, duplicates, slow):
+        self.requests += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.queries += queries
+        self.db_ms += db_ms
+        self.duplicate_queries += sum(duplicates.values())
+        self.slow_requests += slow
+        self.buckets[bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.duplicates.update(duplicates)
+        # Keep only the worst offenders so a view issuing ever-new shapes cannot grow this unbounded.
+        if len(self.duplicates) > TOP_DUPLICATES * 10:
+            self.duplicates = Counter(dict(self.duplicates.most_common(TOP_DUPLICATES)))
+
+    def percentile(self, p):
+        threshold = self.requests * p / 100
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (None,), self.buckets):
+            seen += count
+            if seen >= threshold:
+                return bound if bound is not None else round(self.max_ms, 3)
+        return None
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "mean_ms": round(self.total_ms / self.requests, 3),
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "mean_queries": round(self.queries / self.requests, 2),
+            "mean_db_ms": round(self.db_ms / self.requests, 3),
+            "duplicate_queries": self.duplicate_queries,
+            "slow_requests": self.slow_requests,
+            "histogram": {
+                f"le_{bound}ms" if bound is not None else "inf": count
+                for bound, count in zip(BUCKETS_MS + (None,), self.buckets)
+            },
+            "top_duplicates": [
+                {"sql": sql, "count": count} for sql, count in self.duplicates.most_common(TOP_DUPLICATES)
+            ],
+        }
+
+
+def record(view_name, duration_ms, queries, db_ms, duplicates, slow=False):
+    with _lock:
+        _views.setdefault(view_name, ViewMetrics()).add(duration_ms, queries, db_ms, duplicates, slow)
+
+
+def snapshot():
+    """Return the metrics of every view recorded by this process."""
+    with _lock:
+        return {view_name: metrics.snapshot() for view_name, metrics in sorted(_views.items())}
+
+
+def reset():
+    with _lock:
+        _views.clear()
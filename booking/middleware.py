@@ -0,0 +1,104 @@
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every query of a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[metrics.fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return Counter({sql: count - 1 for sql, count in self.fingerprints.items() if count > 1})
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, query count and DB time of every request per view.
+
+    Works without DEBUG: queries are observed through execute_wrapper
+    rather than connection.queries. The numbers are sent back in a
+    Server-Timing header and aggregated in booking.metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "BOOKING_REQUEST_METRICS", True)
+        self.slow_request_ms = getattr(settings, "BOOKING_SLOW_REQUEST_MS", 500)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # Connections are thread-bound, so the wrappers go on the ones of the
+        # thread the async ORM runs this request's queries in.
+        stack = await sync_to_async(self.recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, start)
+
+    def recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def finish(self, request, response, recorder, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.duration * 1000
+
+        match = getattr(request, "resolver_match", None)
+        view_name = match.func.__name__ if match else "unresolved"
+        duplicates = recorder.duplicates()
+        slow = duration_ms >= self.slow_request_ms
+        metrics.record(view_name, duration_ms, recorder.count, db_ms, duplicates, slow)
+        if slow:
+            logger.warning(
+                "Slow request to %s (%s): %.1f ms, %d queries, %.1f ms in the database, %d duplicated",
+                view_name, request.path, duration_ms, recorder.count, db_ms, sum(duplicates.values()),
+                extra={"duplicates": duplicates.most_common(metrics.TOP_DUPLICATES)},
+            )
+
+        response["Server-Timing"] = (
+            f'total;dur={duration_ms:.1f}, db;dur={db_ms:.1f};desc="{recorder.count} queries"'
+        )
+        return response
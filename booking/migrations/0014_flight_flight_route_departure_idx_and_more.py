@@ -0,0 +1,21 @@
+# Generated by Django 5.0.8 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0013_alter_booking_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_airport', 'arrival_airport', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flighttickettype',
+            index=models.Index(fields=['flight', 'ticket_type', 'available_seats'], name='ftt_flight_type_seats_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.8 on 2026-10-18 10:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0014_flight_flight_route_departure_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flighttickettype',
+            name='held_seats',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('seat_hold_id', models.AutoField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('status', models.CharField(choices=[('Active', 'Active'), ('Confirmed', 'Confirmed'), ('Released', 'Released')], default='Active', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='seat_hold', to='booking.booking')),
+                ('flight_ticket_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='booking.flighttickettype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='seathold_status_expiry_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.8 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_seathold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_time', 'flight_id'], name='flight_departure_cursor_idx'),
+        ),
+    ]
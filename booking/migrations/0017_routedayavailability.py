@@ -0,0 +1,63 @@
+# Generated by Django 5.0.8 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_route_day_availability(apps, schema_editor):
+    FlightTicketType = apps.get_model('booking', 'FlightTicketType')
+    RouteDayAvailability = apps.get_model('booking', 'RouteDayAvailability')
+    groups = FlightTicketType.objects.annotate(
+        travel_date=TruncDate('flight__departure_time')
+    ).values(
+        'flight__departure_airport_id', 'flight__arrival_airport_id', 'travel_date', 'ticket_type_id'
+    ).annotate(
+        min_price=Min('price', filter=Q(available_seats__gt=0)),
+        max_available_seats=Max('available_seats'),
+        total_available_seats=Sum('available_seats'),
+        flight_count=Count('flight_id', distinct=True),
+    ).order_by()
+    RouteDayAvailability.objects.bulk_create([
+        RouteDayAvailability(
+            departure_airport_id=group['flight__departure_airport_id'],
+            arrival_airport_id=group['flight__arrival_airport_id'],
+            travel_date=group['travel_date'],
+            ticket_type_id=group['ticket_type_id'],
+            min_price=group['min_price'],
+            max_available_seats=group['max_available_seats'],
+            total_available_seats=group['total_available_seats'],
+            flight_count=group['flight_count'],
+        )
+        for group in groups.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0016_flight_flight_departure_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDayAvailability',
+            fields=[
+                ('route_day_availability_id', models.AutoField(primary_key=True, serialize=False)),
+                ('travel_date', models.DateField()),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_available_seats', models.IntegerField(default=0)),
+                ('total_available_seats', models.IntegerField(default=0)),
+                ('flight_count', models.IntegerField(default=0)),
+                ('arrival_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='booking.airport')),
+                ('departure_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='booking.airport')),
+                ('ticket_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='booking.tickettype')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='routedayavailability',
+            constraint=models.UniqueConstraint(fields=('departure_airport', 'arrival_airport', 'travel_date', 'ticket_type'), name='route_day_availability_key'),
+        ),
+        migrations.RunPython(populate_route_day_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.8 on 2026-10-18 10:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_seat_counts(apps, schema_editor):
+    """seat_number used to hold the number of seats booked; it now holds seat labels."""
+    Booking = apps.get_model('booking', 'Booking')
+    for value in Booking.objects.values_list('seat_number', flat=True).distinct():
+        seat_count = int(value) if value.strip().isdigit() else 1
+        Booking.objects.filter(seat_number=value).update(seat_count=seat_count, seat_number='')
+
+
+def restore_seat_counts(apps, schema_editor):
+    Booking = apps.get_model('booking', 'Booking')
+    for seat_count in Booking.objects.values_list('seat_count', flat=True).distinct():
+        Booking.objects.filter(seat_count=seat_count).update(seat_number=str(seat_count))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0019_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='seat_count',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='seat_number',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(move_seat_counts, restore_seat_counts),
+        migrations.CreateModel(
+            name='SeatMap',
+            fields=[
+                ('seat_map_id', models.AutoField(primary_key=True, serialize=False)),
+                ('layout', models.CharField(max_length=20)),
+                ('first_row', models.IntegerField(default=1)),
+                ('capacity', models.IntegerField()),
+                ('occupied', models.BinaryField(default=bytes)),
+                ('flight_ticket_type', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='seat_map', to='booking.flighttickettype')),
+            ],
+        ),
+    ]
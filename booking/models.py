@@ -3,13 +3,29 @@ from django.utils.translation import gettext_lazy as _
 from .constants import (
     MAX_LENGTH_NAME, GENDER_CHOICES, MAX_LENGTH_CHOICES, BOOKING_STATUS,
     STATUS_CHOICES, ROLE_CHOICES, CARD_TYPE_CHOICES, PAYMENT_METHOD_CHOICES, 
-    REGEX_PATTERN, REGEX_PATTERN_NAME, REGEX_PATTERN_NUMBER, REGEX_PATTERN_EMAIL
+    REGEX_PATTERN, REGEX_PATTERN_NAME, REGEX_PATTERN_NUMBER, REGEX_PATTERN_EMAIL,
+    SEAT_HOLD_STATUS, SEAT_HOLD_MINUTES, SEAT_HOLD_SWEEP_BATCH_SIZE, CANCELLATION_BATCH_SIZE,
+    JOB_STATUS, JOB_MAX_ATTEMPTS, IDEMPOTENCY_KEY_MAX_LENGTH, SEAT_MAP_LAYOUTS, SEAT_MAP_DEFAULT_LAYOUT
 )
+import re
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.core.validators import RegexValidator, MinLengthValidator
 from datetime import date
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Min, Q, F
+from django.db.models import Count, Max, Min, Q, F, Sum
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from . import search_cache
+
+
+def get_day_range(day):
+    """Return the half-open [start, end) datetime range covering the given date."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
 
 class Account(AbstractUser):
     account_id = models.AutoField(primary_key=True)
@@ -69,6 +85,30 @@ class Airport(models.Model):
         airports = Airport.objects.all().values("airport_code", "name", "city", "country")
         return list(airports)
 
+class FlightQuerySet(models.QuerySet):
+    def available(self, departure_airport, arrival_airport, day, num_passengers, ticket_type_id):
+        """Flights of a route and day with enough seats of a ticket type, cheapest first."""
+        # A plain range on departure_time keeps the route/departure index usable,
+        # unlike departure_time__date which wraps the column in DATE().
+        day_start, day_end = get_day_range(day)
+        return self.filter(
+            departure_airport=departure_airport,
+            arrival_airport=arrival_airport,
+            departure_time__gte=day_start,
+            departure_time__lt=day_end,
+            flighttickettype__ticket_type_id=ticket_type_id,
+            flighttickettype__available_seats__gte=num_passengers
+        ).select_related(
+            "departure_airport", "arrival_airport"
+        ).annotate(
+            min_price=Min(
+                "flighttickettype__price",
+                filter=Q(flighttickettype__available_seats__gte=num_passengers)
+            ),
+            ticket_type_price=F("flighttickettype__price"),
+            ticket_type_available_seats=F("flighttickettype__available_seats")
+        ).order_by("min_price")
+
 class Flight(models.Model):
     flight_id = models.AutoField(primary_key=True)
     flight_number = models.CharField(max_length=MAX_LENGTH_NAME)
@@ -78,6 +118,8 @@ class Flight(models.Model):
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField()
 
+    objects = FlightQuerySet.as_manager()
+
     def get_duration(self):
         """Calculate the flight duration."""
         return self.arrival_time - self.departure_time
@@ -93,6 +135,15 @@ class Flight(models.Model):
     def __str__(self):
         return f"Flight {self.flight_number} from {self.departure_airport} to {self.arrival_airport}"
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['departure_airport', 'arrival_airport', 'departure_time'],
+                name='flight_route_departure_idx',
+            ),
+            models.Index(fields=['departure_time', 'flight_id'], name='flight_departure_cursor_idx'),
+        ]
+
 class TicketType(models.Model):
     ticket_type_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=MAX_LENGTH_NAME)
@@ -100,34 +151,296 @@ class TicketType(models.Model):
     def __str__(self):
         return f"{self.name}"
 
+def build_fare_calendar(rows, first_day, last_day):
+    """One entry per day from first_day to last_day, from fare_calendar() rows."""
+    by_day = {row["day"]: row for row in rows}
+    calendar = []
+    day = first_day
+    while day <= last_day:
+        row = by_day.get(day)
+        calendar.append({
+            "date": day.isoformat(),
+            "min_price": float(row["min_price"]) if row else None,
+            "flights": row["flights"] if row else 0,
+        })
+        day += timedelta(days=1)
+    return calendar
+
+class FlightTicketTypeQuerySet(models.QuerySet):
+    def fare_calendar(self, departure_airport, arrival_airport, first_day, last_day, num_passengers, ticket_type_id):
+        """Cheapest fare and number of flights per day, as a single grouped query."""
+        return self.filter(
+            flight__departure_airport=departure_airport,
+            flight__arrival_airport=arrival_airport,
+            flight__departure_time__gte=get_day_range(first_day)[0],
+            flight__departure_time__lt=get_day_range(last_day)[1],
+            ticket_type_id=ticket_type_id,
+            available_seats__gte=num_passengers
+        ).annotate(
+            day=TruncDate("flight__departure_time")
+        ).values("day").annotate(
+            min_price=Min("price"),
+            flights=Count("flight_id", distinct=True)
+        ).order_by("day")
+
 class FlightTicketType(models.Model):
     flight_ticket_types_id = models.AutoField(primary_key=True)
     flight = models.ForeignKey('Flight', on_delete=models.CASCADE)
     ticket_type = models.ForeignKey(TicketType, on_delete=models.CASCADE)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     available_seats = models.IntegerField()
+    held_seats = models.IntegerField(default=0)
+
+    objects = FlightTicketTypeQuerySet.as_manager()
 
     def is_seat_available(self, quantity):
         """Check if there are any available seats."""
         return self.available_seats >= quantity
 
     def book_seat(self, quantity=1):
-        """Book seats if available."""
-        if self.is_seat_available(quantity):
+        """Book seats if available.
+
+        The check and the decrement run as one conditional UPDATE, so
+        concurrent bookings can never take more seats than there are.
+        """
+        booked = FlightTicketType.objects.filter(
+            pk=self.pk, available_seats__gte=quantity
+        ).update(available_seats=F('available_seats') - quantity)
+        if booked:
             self.available_seats -= quantity
-            self.save()
-            return True
-        return False
+            self.availability_changed()
+        return bool(booked)
 
     def release_seat(self, quantity=1):
-        """Release booked seats."""
+        """Release booked seats with a single atomic UPDATE."""
+        FlightTicketType.objects.filter(pk=self.pk).update(
+            available_seats=F('available_seats') + quantity
+        )
         self.available_seats += quantity
-        self.save()
+        self.availability_changed()
+
+    def hold_seat(self, quantity=1):
+        """Move seats from available to held if enough are available.
+
+        Held seats are already subtracted from available_seats, so search
+        queries need no aggregate over SeatHold to exclude them.
+        """
+        held = FlightTicketType.objects.filter(
+            pk=self.pk, available_seats__gte=quantity
+        ).update(
+            available_seats=F('available_seats') - quantity,
+            held_seats=F('held_seats') + quantity
+        )
+        if held:
+            self.available_seats -= quantity
+            self.held_seats += quantity
+            self.availability_changed()
+        return bool(held)
+
+    def confirm_held_seat(self, quantity=1):
+        """Turn held seats into sold seats."""
+        FlightTicketType.objects.filter(pk=self.pk).update(
+            held_seats=F('held_seats') - quantity
+        )
+        self.held_seats -= quantity
+
+    def release_held_seat(self, quantity=1):
+        """Give held seats back to the available pool."""
+        FlightTicketType.objects.filter(pk=self.pk).update(
+            available_seats=F('available_seats') + quantity,
+            held_seats=F('held_seats') - quantity
+        )
+        self.available_seats += quantity
+        self.held_seats -= quantity
+        self.availability_changed()
+
+    def route_day(self):
+        """Departure airport, arrival airport and local departure date of the flight."""
+        flight = self.flight
+        return (flight.departure_airport_id, flight.arrival_airport_id,
+                timezone.localtime(flight.departure_time).date())
+
+    def availability_changed(self):
+        """Refresh what is derived from this fare's seats and price.
+
+        Uses the flight, so callers on hot paths load the fare with
+        ``select_related('flight')``.
+        """
+        departure_airport_id, arrival_airport_id, travel_date = self.route_day()
+        search_cache.invalidate(departure_airport_id, arrival_airport_id, travel_date)
+        RouteDayAvailability.refresh(departure_airport_id, arrival_airport_id, travel_date, self.ticket_type_id)
 
     def __str__(self):
         return (f"Flight {self.flight.flight_number} - {self.ticket_type.name} "
                 f"(Price: {self.price}, Available Seats: {self.available_seats})")
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['flight', 'ticket_type', 'available_seats'],
+                name='ftt_flight_type_seats_idx',
+            ),
+        ]
+
+class RouteDayAvailabilityQuerySet(models.QuerySet):
+    def rules_out(self, departure_airport_id, arrival_airport_id, travel_date, ticket_type_id, num_passengers):
+        """Rows showing that no flight of the route/day has seats for ``num_passengers``.
+
+        A search can skip the flight query when this exists. A missing row
+        only means the summary was never built (fares written in bulk,
+        restored dumps), so it rules nothing out.
+        """
+        return self.filter(
+            departure_airport_id=departure_airport_id,
+            arrival_airport_id=arrival_airport_id,
+            travel_date=travel_date,
+            ticket_type_id=ticket_type_id,
+            max_available_seats__lt=num_passengers,
+        )
+
+    # Route/days rebuilt per statement when rebuild() is given some; each adds a term to an OR.
+    ROUTE_DAYS_PER_QUERY = 100
+
+    def rebuild(self, batch_size=1000, route_days=None):
+        """Recompute the summary rows from Flight and FlightTicketType in bulk.
+
+        ``route_days`` limits the rebuild to the given (departure airport,
+        arrival airport, travel date) triples; by default every row is.
+        """
+        with transaction.atomic():
+            if route_days is None:
+                self.all().delete()
+                return self._create_summaries(FlightTicketType.objects.all(), batch_size)
+            route_days = sorted(set(route_days))
+            created = 0
+            for offset in range(0, len(route_days), self.ROUTE_DAYS_PER_QUERY):
+                fares, summaries = Q(pk__in=[]), Q(pk__in=[])
+                for departure_airport_id, arrival_airport_id, travel_date in \
+                        route_days[offset:offset + self.ROUTE_DAYS_PER_QUERY]:
+                    day_start, day_end = get_day_range(travel_date)
+                    fares |= Q(flight__departure_airport_id=departure_airport_id,
+                               flight__arrival_airport_id=arrival_airport_id,
+                               flight__departure_time__gte=day_start, flight__departure_time__lt=day_end)
+                    summaries |= Q(departure_airport_id=departure_airport_id,
+                                   arrival_airport_id=arrival_airport_id, travel_date=travel_date)
+                self.filter(summaries).delete()
+                created += self._create_summaries(FlightTicketType.objects.filter(fares), batch_size)
+            return created
+
+    def _create_summaries(self, fares, batch_size):
+        groups = fares.annotate(
+            travel_date=TruncDate('flight__departure_time')
+        ).values(
+            'flight__departure_airport_id', 'flight__arrival_airport_id', 'travel_date', 'ticket_type_id'
+        ).annotate(
+            min_price=Min('price', filter=Q(available_seats__gt=0)),
+            max_available_seats=Max('available_seats'),
+            total_available_seats=Sum('available_seats'),
+            flight_count=Count('flight_id', distinct=True),
+        ).order_by()
+        rows = []
+        created = 0
+        for group in groups.iterator(chunk_size=batch_size):
+            rows.append(RouteDayAvailability(
+                departure_airport_id=group['flight__departure_airport_id'],
+                arrival_airport_id=group['flight__arrival_airport_id'],
+                travel_date=group['travel_date'],
+                ticket_type_id=group['ticket_type_id'],
+                min_price=group['min_price'],
+                max_available_seats=group['max_available_seats'],
+                total_available_seats=group['total_available_seats'],
+                flight_count=group['flight_count'],
+            ))
+            if len(rows) >= batch_size:
+                created += len(self.bulk_create(rows))
+                rows = []
+        created += len(self.bulk_create(rows))
+        return created
+
+
+class RouteDayAvailability(models.Model):
+    """Seats and cheapest fare per route, day and ticket type.
+
+    Kept up to date by FlightTicketType.availability_changed() so a search
+    can tell with one indexed lookup whether a route has any flight with
+    enough seats. Rebuild it with the rebuild_route_availability command.
+    """
+    route_day_availability_id = models.AutoField(primary_key=True)
+    departure_airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='+')
+    arrival_airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='+')
+    travel_date = models.DateField()
+    ticket_type = models.ForeignKey(TicketType, on_delete=models.CASCADE)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    max_available_seats = models.IntegerField(default=0)
+    total_available_seats = models.IntegerField(default=0)
+    flight_count = models.IntegerField(default=0)
+
+    objects = RouteDayAvailabilityQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['departure_airport', 'arrival_airport', 'travel_date', 'ticket_type'],
+                name='route_day_availability_key',
+            ),
+        ]
+
+    @classmethod
+    def refresh(cls, departure_airport_id, arrival_airport_id, travel_date, ticket_type_id):
+        """Recompute the summary row of one route, day and ticket type.
+
+        The row is rewritten by a single UPDATE whose values are aggregate
+        subqueries, so concurrent refreshes never write back stale numbers.
+        """
+        day_start, day_end = get_day_range(travel_date)
+        fares = FlightTicketType.objects.filter(
+            flight__departure_airport_id=departure_airport_id,
+            flight__arrival_airport_id=arrival_airport_id,
+            flight__departure_time__gte=day_start,
+            flight__departure_time__lt=day_end,
+            ticket_type_id=ticket_type_id
+        ).order_by()
+        summary = {
+            'min_price': Min('price', filter=Q(available_seats__gt=0)),
+            'max_available_seats': Max('available_seats'),
+            'total_available_seats': Sum('available_seats'),
+            'flight_count': Count('flight_id', distinct=True),
+        }
+        key = {
+            'departure_airport_id': departure_airport_id,
+            'arrival_airport_id': arrival_airport_id,
+            'travel_date': travel_date,
+            'ticket_type_id': ticket_type_id,
+        }
+
+        def update():
+            grouped = fares.values('ticket_type_id')
+            return cls.objects.filter(**key).update(**{
+                name: Subquery(grouped.annotate(value=aggregate).values('value'))
+                if name == 'min_price' else
+                Coalesce(Subquery(grouped.annotate(value=aggregate).values('value')), 0)
+                for name, aggregate in summary.items()
+            })
+
+        if update():
+            return
+        values = fares.aggregate(**summary)
+        if not values['flight_count']:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**key, **values)
+        except IntegrityError:
+            # Created concurrently; fall back to rewriting it.
+            update()
+
+    def has_seats_for(self, num_passengers):
+        return self.max_available_seats >= num_passengers
+
+    def __str__(self):
+        return (f"{self.departure_airport_id} - {self.arrival_airport_id} on {self.travel_date} "
+                f"({self.ticket_type_id}): from {self.min_price}, {self.total_available_seats} seats")
+
 class Card(models.Model):
     card_id = models.AutoField(primary_key=True)
     user = models.ForeignKey('Account', on_delete=models.CASCADE)
@@ -166,16 +479,73 @@ class Passenger(models.Model):
     due_date = models.DateField(default=timezone.now)
 
 
+class BookingQuerySet(models.QuerySet):
+    def with_listing_data(self):
+        """Load what the booking listings render, without one query per row."""
+        return self.select_related('flight_ticket_type__flight')
+
+    def approve_cancellations(self, batch_size=CANCELLATION_BATCH_SIZE):
+        """Cancel the pending bookings of this queryset and return how many were cancelled.
+
+        Everything runs in one transaction. Each batch locks its bookings,
+        cancels them with one UPDATE, releases their still-active holds with
+        another and gives the seats back with one aggregated UPDATE per
+        FlightTicketType, and one seat map update per FlightTicketType.
+        """
+        pending = self.filter(status='PendingCancellation').order_by('booking_id')
+        seats = defaultdict(lambda: [0, 0])
+        labels = defaultdict(list)
+        cancelled = 0
+        with transaction.atomic():
+            while True:
+                booking_ids = list(pending.select_for_update().values_list('booking_id', flat=True)[:batch_size])
+                if not booking_ids:
+                    break
+                batch = Booking.objects.filter(booking_id__in=booking_ids)
+                # Seats of an active hold are still held, those without a hold or with a
+                # confirmed one were sold, and those of a released hold were already given back.
+                active_hold = Q(seat_hold__status='Active')
+                sold = Q(seat_hold__isnull=True) | Q(seat_hold__status='Confirmed')
+                for row in batch.values('flight_ticket_type_id').annotate(
+                    sold=Sum('seat_count', filter=sold),
+                    held=Sum('seat_hold__quantity', filter=active_hold),
+                ).order_by():
+                    seats[row['flight_ticket_type_id']][0] += row['sold'] or 0
+                    seats[row['flight_ticket_type_id']][1] += row['held'] or 0
+                for flight_ticket_type_id, seat_number in batch.filter(sold | active_hold).exclude(
+                        seat_number='').values_list('flight_ticket_type_id', 'seat_number'):
+                    labels[flight_ticket_type_id].extend(seat_number.split(','))
+                SeatHold.objects.filter(booking_id__in=booking_ids, status='Active').update(status='Released')
+                cancelled += batch.update(status='Canceled')
+            for flight_ticket_type_id, (sold, held) in seats.items():
+                FlightTicketType.objects.filter(pk=flight_ticket_type_id).update(
+                    available_seats=F('available_seats') + sold + held,
+                    held_seats=F('held_seats') - held
+                )
+            SeatMap.objects.release(labels)
+        for flight_ticket_type in FlightTicketType.objects.filter(pk__in=seats.keys()).select_related('flight'):
+            flight_ticket_type.availability_changed()
+        return cancelled
+
+    def reject_cancellations(self):
+        """Deny the pending cancellations of this queryset with a single UPDATE."""
+        return self.filter(status='PendingCancellation').update(status='DeniedCancellation')
+
+
 class Booking(models.Model):
     booking_id = models.AutoField(primary_key=True)
     account = models.ForeignKey('Account', on_delete=models.CASCADE)
     flight_ticket_type = models.ForeignKey('FlightTicketType', on_delete=models.CASCADE)
     booking_date = models.DateTimeField(auto_now_add=True)
-    seat_number = models.CharField(max_length=10)
+    # Labels of the assigned seats, comma separated, e.g. "12A,12B".
+    seat_number = models.TextField(blank=True)
+    seat_count = models.IntegerField(default=1)
     cancellation_approved = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=BOOKING_STATUS, default='PendingCancellation')
     passengers = models.ManyToManyField(Passenger, related_name='flight_tickets')
 
+    objects = BookingQuerySet.as_manager()
+
     def is_confirmed(self):
         """Check if the booking is confirmed."""
         return self.status == 'Confirmed'
@@ -185,6 +555,20 @@ class Booking(models.Model):
             self.status = new_status
             self.save()
 
+    def seat_labels(self):
+        return self.seat_number.split(',') if self.seat_number else []
+
+    def reclaim_seats(self):
+        """Assign seats again after the hold was released, keeping the same seats when they are still free."""
+        seat_map = SeatMap.objects.for_fare(self.flight_ticket_type)
+        labels = self.seat_labels() and seat_map.assign(self.seat_count, self.seat_labels())
+        labels = labels or seat_map.assign(self.seat_count)
+        if labels is None:
+            return False
+        self.seat_number = ','.join(labels)
+        Booking.objects.filter(pk=self.pk).update(seat_number=self.seat_number)
+        return True
+
     def total_cost(self):
         """Calculate the total cost of the booking."""
         return self.flight_ticket_type.price
@@ -208,15 +592,322 @@ class Booking(models.Model):
         """Admin approves the cancellation request."""
         pending_cancellation_status = dict(BOOKING_STATUS)['PendingCancellation']
         if self.status == pending_cancellation_status:
-            self.flight_ticket_type.release_seat(int(self.seat_number))
+            seat_hold = SeatHold.objects.filter(booking=self).first()
+            if seat_hold is None or seat_hold.status == 'Confirmed':
+                self.flight_ticket_type.release_seat(self.seat_count)
+                SeatMap.objects.release({self.flight_ticket_type_id: self.seat_labels()})
+            elif seat_hold.release():
+                SeatMap.objects.release({self.flight_ticket_type_id: self.seat_labels()})
             
-            self.status = 'Cancelled'
+            self.status = 'Canceled'
             self.save()
             return True, _("Booking cancelled successfully.")
         else:
             return False, _("Cancellation cannot be approved. Current status is not PendingCancellation.")
 
 
+class SeatHoldQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status='Active', expires_at__gt=timezone.now())
+
+    def expired(self, now=None):
+        return self.filter(status='Active', expires_at__lte=now or timezone.now())
+
+    def release_expired(self, now=None, batch_size=SEAT_HOLD_SWEEP_BATCH_SIZE):
+        """Release every expired hold and return the number of holds released.
+
+        Each batch marks its holds as released in one UPDATE and returns the
+        seats with one UPDATE per FlightTicketType.
+        """
+        now = now or timezone.now()
+        released = 0
+        while True:
+            with transaction.atomic():
+                holds = list(
+                    self.expired(now)
+                    .select_for_update(skip_locked=True)
+                    .values_list('seat_hold_id', 'flight_ticket_type_id', 'quantity', 'booking_id')[:batch_size]
+                )
+                if not holds:
+                    return released
+                seats = defaultdict(int)
+                for _hold_id, flight_ticket_type_id, quantity, _booking_id in holds:
+                    seats[flight_ticket_type_id] += quantity
+                self.filter(seat_hold_id__in=[hold[0] for hold in holds]).update(status='Released')
+                for flight_ticket_type_id, quantity in seats.items():
+                    FlightTicketType.objects.filter(pk=flight_ticket_type_id).update(
+                        available_seats=F('available_seats') + quantity,
+                        held_seats=F('held_seats') - quantity
+                    )
+                labels = defaultdict(list)
+                for flight_ticket_type_id, seat_number in Booking.objects.filter(
+                    booking_id__in=[hold[3] for hold in holds if hold[3]]
+                ).exclude(seat_number='').values_list('flight_ticket_type_id', 'seat_number'):
+                    labels[flight_ticket_type_id].extend(seat_number.split(','))
+                SeatMap.objects.release(labels)
+            for flight_ticket_type in FlightTicketType.objects.filter(pk__in=seats.keys()).select_related('flight'):
+                flight_ticket_type.availability_changed()
+            released += len(holds)
+
+
+class SeatHold(models.Model):
+    seat_hold_id = models.AutoField(primary_key=True)
+    flight_ticket_type = models.ForeignKey('FlightTicketType', on_delete=models.CASCADE, related_name='seat_holds')
+    account = models.ForeignKey('Account', on_delete=models.CASCADE)
+    booking = models.OneToOneField('Booking', on_delete=models.CASCADE, null=True, blank=True, related_name='seat_hold')
+    quantity = models.IntegerField()
+    status = models.CharField(max_length=20, choices=SEAT_HOLD_STATUS, default='Active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    objects = SeatHoldQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='seathold_status_expiry_idx'),
+        ]
+
+    @classmethod
+    def place(cls, flight_ticket_type, account, quantity, booking=None):
+        """Hold seats for SEAT_HOLD_MINUTES, or return None if they are not available."""
+        if not flight_ticket_type.hold_seat(quantity):
+            return None
+        return cls.objects.create(
+            flight_ticket_type=flight_ticket_type,
+            account=account,
+            booking=booking,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(minutes=SEAT_HOLD_MINUTES)
+        )
+
+    def is_expired(self):
+        """Check if the hold has run out."""
+        return timezone.now() >= self.expires_at
+
+    def confirm(self):
+        """Turn the hold into sold seats.
+
+        A hold that has already been released by the sweeper falls back to
+        booking the seats again, which fails if they have been sold since.
+        """
+        if self.status == 'Confirmed':
+            return True
+        if SeatHold.objects.filter(pk=self.pk, status='Active').update(status='Confirmed'):
+            self.flight_ticket_type.confirm_held_seat(self.quantity)
+        elif self.flight_ticket_type.book_seat(self.quantity):
+            if self.booking_id is not None and not self.booking.reclaim_seats():
+                return False
+            SeatHold.objects.filter(pk=self.pk).update(status='Confirmed')
+        else:
+            return False
+        self.status = 'Confirmed'
+        return True
+
+    def release(self):
+        """Give the held seats back if the hold is still active."""
+        if SeatHold.objects.filter(pk=self.pk, status='Active').update(status='Released'):
+            self.flight_ticket_type.release_held_seat(self.quantity)
+            self.status = 'Released'
+            return True
+        return False
+
+    def __str__(self):
+        return (f"Hold {self.seat_hold_id} - {self.quantity} seat(s) on "
+                f"{self.flight_ticket_type_id} until {self.expires_at}")
+
+
+class SeatMapQuerySet(models.QuerySet):
+    def for_fare(self, flight_ticket_type):
+        """The seat map of a fare, built on first use.
+
+        The map is sized to the seats still available plus those taken by
+        the fare's live bookings, and bookings made before it existed get
+        seats assigned in booking order.
+        """
+        seat_map = self.filter(flight_ticket_type_id=flight_ticket_type.pk).first()
+        if seat_map is not None:
+            return seat_map
+        with transaction.atomic():
+            fare = FlightTicketType.objects.select_for_update().select_related('ticket_type').get(
+                pk=flight_ticket_type.pk)
+            seat_map = self.filter(flight_ticket_type=fare).first()
+            if seat_map is not None:
+                return seat_map
+            bookings = list(
+                Booking.objects.filter(flight_ticket_type=fare)
+                .exclude(status='Canceled').exclude(seat_hold__status='Released')
+                .order_by('booking_id')
+            )
+            layout, first_row = SEAT_MAP_LAYOUTS.get(fare.ticket_type.name, SEAT_MAP_DEFAULT_LAYOUT)
+            seat_map = SeatMap(
+                flight_ticket_type=fare, layout=layout, first_row=first_row,
+                capacity=fare.available_seats + sum(booking.seat_count for booking in bookings)
+            )
+            seat_map.build(bookings)
+            seat_map.save()
+            Booking.objects.bulk_update(bookings, ['seat_number'], batch_size=500)
+        return seat_map
+
+    def release(self, labels_by_fare):
+        """Free seats, given as ``{flight_ticket_type_id: [labels]}``, with one update per map."""
+        for flight_ticket_type_id, labels in labels_by_fare.items():
+            if not labels:
+                continue
+            with transaction.atomic():
+                seat_map = self.select_for_update().filter(flight_ticket_type_id=flight_ticket_type_id).first()
+                if seat_map is None:
+                    continue
+                mask = seat_map.mask
+                for label in labels:
+                    try:
+                        mask &= ~(1 << seat_map.index(label))
+                    except ValueError:
+                        continue
+                seat_map.save_mask(mask)
+
+
+class SeatMap(models.Model):
+    """The seats of a fare as a bitmap, one bit per seat in row-major order.
+
+    A set bit means the seat is taken, so a cabin of 300 seats is 38 bytes
+    and counting free seats is a popcount. Seats are labelled by row number
+    and letter, e.g. "12C", following the fare's layout.
+    """
+    seat_map_id = models.AutoField(primary_key=True)
+    flight_ticket_type = models.OneToOneField('FlightTicketType', on_delete=models.CASCADE, related_name='seat_map')
+    # Seat letters of a row with spaces for aisles, e.g. "ABC DEF".
+    layout = models.CharField(max_length=20)
+    first_row = models.IntegerField(default=1)
+    capacity = models.IntegerField()
+    occupied = models.BinaryField(default=bytes)
+
+    objects = SeatMapQuerySet.as_manager()
+
+    LABEL = re.compile(r'(\d+)([A-Z])')
+
+    @property
+    def letters(self):
+        return self.layout.replace(' ', '')
+
+    @property
+    def row_count(self):
+        return -(-self.capacity // len(self.letters))
+
+    @property
+    def mask(self):
+        return int.from_bytes(bytes(self.occupied), 'little')
+
+    def set_mask(self, mask):
+        self.occupied = mask.to_bytes((self.capacity + 7) // 8, 'little')
+
+    def save_mask(self, mask):
+        self.set_mask(mask)
+        SeatMap.objects.filter(pk=self.pk).update(occupied=self.occupied)
+
+    def label(self, index):
+        width = len(self.letters)
+        return f"{self.first_row + index // width}{self.letters[index % width]}"
+
+    def index(self, label):
+        match = self.LABEL.fullmatch(label.strip().upper())
+        if match is None:
+            raise ValueError(f"Invalid seat {label!r}")
+        row, column = int(match.group(1)) - self.first_row, self.letters.find(match.group(2))
+        index = row * len(self.letters) + column
+        if row < 0 or column < 0 or index >= self.capacity:
+            raise ValueError(f"No seat {label!r} on this map")
+        return index
+
+    def free_count(self):
+        return self.capacity - self.mask.bit_count()
+
+    def find_seats(self, mask, count):
+        """Indexes of ``count`` free seats: side by side within a section of a row
+        if possible, else anywhere in one row, else the free seats nearest the front."""
+        width = len(self.letters)
+        sections, start = [], 0
+        for block in self.layout.split():
+            sections.append((start, start + len(block)))
+            start += len(block)
+        run = (1 << count) - 1
+        for spans in (sections, [(0, width)]):
+            for row in range(self.row_count):
+                for first, last in spans:
+                    for column in range(first, last - count + 1):
+                        index = row * width + column
+                        if index + count <= self.capacity and not (mask >> index) & run:
+                            return list(range(index, index + count))
+        free = [index for index in range(self.capacity) if not (mask >> index) & 1]
+        return free[:count] if len(free) >= count else None
+
+    def build(self, bookings):
+        """Mark the seats of ``bookings``, assigning seats to those that have none or lost theirs."""
+        mask = 0
+        unseated = []
+        for booking in bookings:
+            try:
+                indexes = [self.index(label) for label in booking.seat_labels()]
+            except ValueError:
+                indexes = []
+            if len(indexes) != booking.seat_count or any((mask >> index) & 1 for index in indexes):
+                unseated.append(booking)
+                continue
+            for index in indexes:
+                mask |= 1 << index
+        for booking in unseated:
+            indexes = self.find_seats(mask, booking.seat_count) or []
+            for index in indexes:
+                mask |= 1 << index
+            booking.seat_number = ','.join(self.label(index) for index in indexes)
+        self.set_mask(mask)
+
+    def assign(self, count, labels=None):
+        """Take the seats ``labels``, or the best ``count`` free seats, and return their labels.
+
+        Returns None when the seats are not free. The map row is locked for
+        the read-modify-write, so concurrent checkouts never share a seat.
+        """
+        with transaction.atomic():
+            seat_map = SeatMap.objects.select_for_update().get(pk=self.pk)
+            mask = seat_map.mask
+            if labels:
+                try:
+                    indexes = sorted({seat_map.index(label) for label in labels})
+                except ValueError:
+                    return None
+                if len(indexes) != count or any((mask >> index) & 1 for index in indexes):
+                    return None
+            else:
+                indexes = seat_map.find_seats(mask, count)
+                if indexes is None:
+                    return None
+            for index in indexes:
+                mask |= 1 << index
+            seat_map.save_mask(mask)
+        self.occupied = seat_map.occupied
+        return [seat_map.label(index) for index in indexes]
+
+    def rows(self):
+        """Rows for display: the row number and its seats as ``(label, taken)``, with None for aisles."""
+        mask = self.mask
+        width = len(self.letters)
+        rows = []
+        for row in range(self.row_count):
+            seats, column = [], 0
+            for letter in self.layout:
+                if letter == ' ':
+                    seats.append(None)
+                    continue
+                index = row * width + column
+                column += 1
+                seats.append((self.label(index), bool((mask >> index) & 1)) if index < self.capacity else None)
+            rows.append((self.first_row + row, seats))
+        return rows
+
+    def __str__(self):
+        return f"Seat map of {self.flight_ticket_type_id}: {self.free_count()} of {self.capacity} seats free"
+
+
 class Payment(models.Model):
     payment_id = models.AutoField(primary_key=True)
     booking = models.ForeignKey('Booking', on_delete=models.CASCADE)
@@ -255,3 +946,107 @@ class Voucher(models.Model):
 
     def __str__(self):
         return f"Voucher {self.code} - {self.description} - Expires on {self.expiry_date}"
+
+
+class JobQuerySet(models.QuerySet):
+    def due(self, now=None):
+        return self.filter(status='Pending', run_at__lte=now or timezone.now())
+
+    def claim(self, limit, worker):
+        """Mark up to ``limit`` due jobs as running for ``worker`` and return them.
+
+        Rows locked by another worker are skipped rather than waited for, so
+        any number of workers can poll the same table.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            job_ids = list(
+                self.due(now).order_by('run_at', 'job_id')
+                .select_for_update(skip_locked=True)
+                .values_list('job_id', flat=True)[:limit]
+            )
+            if not job_ids:
+                return []
+            # The status check keeps backends without row locks from running a job twice.
+            self.filter(job_id__in=job_ids, status='Pending').update(
+                status='Running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+            )
+        return list(self.filter(job_id__in=job_ids, status='Running', locked_by=worker, locked_at=now))
+
+    def heartbeat(self, job_ids, worker):
+        """Mark running jobs of ``worker`` as still alive, so requeue_stale leaves them alone."""
+        return self.filter(job_id__in=job_ids, status='Running', locked_by=worker).update(locked_at=timezone.now())
+
+    def requeue_stale(self, before):
+        """Give jobs of workers that died while running them back to the queue.
+
+        A job that has used up its attempts is failed instead, so one that
+        keeps killing its worker is not picked up forever.
+        """
+        stale = self.filter(status='Running', locked_at__lt=before)
+        stale.filter(attempts__gte=F('max_attempts')).update(
+            status='Failed', locked_by='', finished_at=timezone.now(),
+            last_error='The worker running the job stopped before it finished.'
+        )
+        return stale.filter(attempts__lt=F('max_attempts')).update(status='Pending', locked_by='')
+
+
+class Job(models.Model):
+    job_id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS, default='Pending')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=JOB_MAX_ATTEMPTS)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.job_id} - {self.name} ({self.status}, attempt {self.attempts}/{self.max_attempts})"
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self, now=None):
+        return self.filter(expires_at__lte=now or timezone.now())
+
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of a submission, replayed to retries that carry the same key."""
+    idempotency_key_id = models.AutoField(primary_key=True)
+    account = models.ForeignKey('Account', on_delete=models.CASCADE)
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=IDEMPOTENCY_KEY_MAX_LENGTH)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_content_type = models.CharField(max_length=100, blank=True)
+    response_location = models.TextField(blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'scope', 'key'], name='idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expiry_idx'),
+        ]
+
+    def is_complete(self):
+        return self.response_status is not None
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.response_status or 'in progress'})"
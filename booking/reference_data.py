@@ -0,0 +1,146 @@
+"""Cached reference data: airports, cities and ticket types.
+
+These tables almost never change but are read on every search, so their
+values are kept in a process-local store. When ``BOOKING_REFERENCE_CACHE``
+names a Django cache alias, the values and a version counter are also kept
+in that cache so that an invalidation made in one process is seen by all.
+Invalidation is driven by the signals in ``booking.signals``, once the
+writing transaction has committed.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Airport, TicketType
+
+VERSION_KEY = "booking:reference-data:version"
+VALUE_KEY = "booking:reference-data:{name}:{version}"
+
+_lock = threading.Lock()
+_local = {}
+# Bumped by invalidate(); a value loaded across a bump may predate it and is not kept.
+_generation = 0
+
+
+def _shared_cache():
+    alias = getattr(settings, "BOOKING_REFERENCE_CACHE", None)
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def _current_version(cache):
+    if cache is None:
+        return 0
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = _reset_version(cache)
+    return version
+
+
+def _reset_version(cache):
+    # Seeded from the clock so an evicted counter never reuses an old version.
+    cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+    return cache.get(VERSION_KEY, 0)
+
+
+def _load_airports():
+    return list(Airport.objects.order_by("airport_code").values("airport_code", "name", "city", "country"))
+
+
+def _load_ticket_types():
+    return list(TicketType.objects.order_by("ticket_type_id").values("ticket_type_id", "name"))
+
+
+def _load_cities():
+    return sorted({airport["city"] for airport in get_airports()})
+
+
+def _store(name, version, value, generation):
+    with _lock:
+        if generation == _generation:
+            _local[name] = (version, value)
+
+
+def _get(name, loader):
+    generation = _generation
+    cache = _shared_cache()
+    version = _current_version(cache)
+    cached = _local.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    value = None
+    if cache is not None:
+        value = cache.get(VALUE_KEY.format(name=name, version=version))
+    if value is None:
+        value = loader()
+        if cache is not None and generation == _generation:
+            cache.set(VALUE_KEY.format(name=name, version=version), value, timeout=None)
+    _store(name, version, value, generation)
+    return value
+
+
+async def _aget(name, loader):
+    """Async _get, for async views; ``loader`` is a coroutine function."""
+    generation = _generation
+    cache = _shared_cache()
+    version = 0
+    if cache is not None:
+        version = await cache.aget(VERSION_KEY)
+        if version is None:
+            await cache.aadd(VERSION_KEY, int(time.time() * 1000), timeout=None)
+            version = await cache.aget(VERSION_KEY, 0)
+    cached = _local.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    value = None
+    if cache is not None:
+        value = await cache.aget(VALUE_KEY.format(name=name, version=version))
+    if value is None:
+        value = await loader()
+        if cache is not None and generation == _generation:
+            await cache.aset(VALUE_KEY.format(name=name, version=version), value, timeout=None)
+    _store(name, version, value, generation)
+    return value
+
+
+async def _aload_ticket_types():
+    return [row async for row in TicketType.objects.order_by("ticket_type_id").values("ticket_type_id", "name")]
+
+
+def get_airports():
+    """Return all airports as dicts, ordered by airport code."""
+    return _get("airports", _load_airports)
+
+
+def get_cities():
+    """Return the distinct airport cities, sorted alphabetically."""
+    return _get("cities", _load_cities)
+
+
+def get_ticket_types():
+    """Return all ticket types as dicts, ordered by id."""
+    return _get("ticket_types", _load_ticket_types)
+
+
+async def aget_ticket_types():
+    """Async get_ticket_types."""
+    return await _aget("ticket_types", _aload_ticket_types)
+
+
+def invalidate():
+    """Drop the cached reference data in this process and, if configured, everywhere."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _local.clear()
+    cache = _shared_cache()
+    if cache is not None:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            _reset_version(cache)
@@ -0,0 +1,243 @@
+"""Connecting-flight search over an in-memory route graph.
+
+All fares of one ticket type departing on a given day (plus the hours a
+connection may spill into the next day) are loaded with a single query
+into per-airport lists sorted by departure time. Itineraries are then
+found with a bounded-stop label-setting (Dijkstra) search over legs,
+ordered either by arrival time or by total price.
+
+Graphs are kept per process and reused until the flights of their day
+change. Structural changes (schedules, prices, new or deleted fares) bump
+a per-day version in the cache once the change has committed, which
+rebuilds the graph on next use.
+Seat counts change on every booking, so instead of rebuilding for those,
+the legs of every candidate itinerary are re-read in one query and
+patched into the graph before results are returned.
+"""
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .constants import (
+    CONNECTION_MAX_LAYOVER_HOURS, CONNECTION_MAX_STOPS, CONNECTION_MIN_MINUTES, CONNECTION_RESULTS_LIMIT,
+    ROUTE_GRAPH_CACHE_SIZE, ROUTE_GRAPH_TTL
+)
+from .models import FlightTicketType, get_day_range
+
+VERSION_KEY = "booking:route-graph:version:{date}"
+
+SORT_EARLIEST = "earliest"
+SORT_CHEAPEST = "cheapest"
+
+_lock = threading.Lock()
+_graphs = OrderedDict()
+
+
+class Leg:
+    __slots__ = (
+        "flight_id", "flight_number", "departure", "arrival",
+        "departure_time", "arrival_time", "price", "available_seats"
+    )
+
+    def __init__(self, flight_id, flight_number, departure, arrival, departure_time, arrival_time, price,
+                 available_seats):
+        self.flight_id = flight_id
+        self.flight_number = flight_number
+        self.departure = departure
+        self.arrival = arrival
+        self.departure_time = departure_time
+        self.arrival_time = arrival_time
+        self.price = price
+        self.available_seats = available_seats
+
+
+class RouteGraph:
+    """Legs of one day and ticket type, grouped by departure airport."""
+
+    def __init__(self, day, ticket_type_id, legs, version):
+        self.day = day
+        self.ticket_type_id = ticket_type_id
+        self.version = version
+        self.built_at = time.monotonic()
+        self.departures = defaultdict(list)
+        self.legs_by_flight = {}
+        for leg in sorted(legs, key=lambda leg: leg.departure_time):
+            self.departures[leg.departure].append(leg)
+            self.legs_by_flight[leg.flight_id] = leg
+        self.departure_times = {
+            airport: [leg.departure_time for leg in airport_legs]
+            for airport, airport_legs in self.departures.items()
+        }
+
+    @classmethod
+    def load(cls, day, ticket_type_id, version):
+        window_start, day_end = get_day_range(day)
+        window_end = day_end + timedelta(hours=CONNECTION_MAX_LAYOVER_HOURS + 24)
+        rows = FlightTicketType.objects.filter(
+            ticket_type_id=ticket_type_id,
+            flight__departure_time__gte=window_start,
+            flight__departure_time__lt=window_end
+        ).values_list(
+            "flight_id", "flight__flight_number", "flight__departure_airport_id", "flight__arrival_airport_id",
+            "flight__departure_time", "flight__arrival_time", "price", "available_seats"
+        ).order_by()
+        return cls(day, ticket_type_id, [Leg(*row) for row in rows.iterator()], version)
+
+    def is_fresh(self, version):
+        return self.version == version and time.monotonic() - self.built_at < ROUTE_GRAPH_TTL
+
+    def legs_from(self, airport, not_before):
+        """Legs leaving ``airport`` at or after ``not_before``, in departure order."""
+        legs = self.departures.get(airport, [])
+        start = bisect_left(self.departure_times.get(airport, []), not_before)
+        return itertools.islice(legs, start, None)
+
+    def update_seats(self, seats_by_flight):
+        for flight_id, available_seats in seats_by_flight.items():
+            leg = self.legs_by_flight.get(flight_id)
+            if leg is not None:
+                leg.available_seats = available_seats
+
+
+class Itinerary:
+    def __init__(self, legs):
+        self.legs = list(legs)
+        self.stops = len(self.legs) - 1
+        self.departure_time = self.legs[0].departure_time
+        self.arrival_time = self.legs[-1].arrival_time
+        self.total_price = sum(leg.price for leg in self.legs)
+        self.available_seats = min(leg.available_seats for leg in self.legs)
+
+    def get_duration(self):
+        return self.arrival_time - self.departure_time
+
+    def flight_ids(self):
+        return [leg.flight_id for leg in self.legs]
+
+
+def _cache():
+    return caches[getattr(settings, "BOOKING_SEARCH_CACHE", "default")]
+
+
+def _day_version(day):
+    cache = _cache()
+    key = VERSION_KEY.format(date=day.isoformat())
+    version = cache.get(key)
+    if version is None:
+        # Seeded from the clock so an evicted counter never reuses an old version.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def invalidate_day(departure_time):
+    """Rebuild the graphs that may contain a flight departing at ``departure_time``, after commit."""
+    day = timezone.localtime(departure_time).date()
+    transaction.on_commit(lambda: _bump_days(day))
+
+
+def _bump_days(day):
+    cache = _cache()
+    # Itineraries starting the day before can connect onto this flight.
+    for graph_day in (day, day - timedelta(days=1)):
+        key = VERSION_KEY.format(date=graph_day.isoformat())
+        try:
+            cache.incr(key)
+        except ValueError:
+            _day_version(graph_day)
+
+
+def get_graph(day, ticket_type_id):
+    """Return the route graph of a day, building it only when it changed."""
+    version = _day_version(day)
+    key = (day, ticket_type_id)
+    with _lock:
+        graph = _graphs.get(key)
+        if graph is not None and graph.is_fresh(version):
+            _graphs.move_to_end(key)
+            return graph
+    graph = RouteGraph.load(day, ticket_type_id, version)
+    with _lock:
+        _graphs[key] = graph
+        _graphs.move_to_end(key)
+        while len(_graphs) > ROUTE_GRAPH_CACHE_SIZE:
+            _graphs.popitem(last=False)
+    return graph
+
+
+def _cost(sort, legs):
+    total_price = sum(leg.price for leg in legs)
+    if sort == SORT_CHEAPEST:
+        return (total_price, legs[-1].arrival_time)
+    return (legs[-1].arrival_time, total_price)
+
+
+def _search(graph, origin, destination, num_passengers, sort, max_stops, limit):
+    day_start, day_end = get_day_range(graph.day)
+    min_connection = timedelta(minutes=CONNECTION_MIN_MINUTES)
+    max_layover = timedelta(hours=CONNECTION_MAX_LAYOVER_HOURS)
+    order = itertools.count()
+    heap = []
+    for leg in graph.legs_from(origin, day_start):
+        if leg.departure_time >= day_end:
+            break
+        if leg.available_seats >= num_passengers and leg.arrival != origin:
+            heapq.heappush(heap, (_cost(sort, [leg]), next(order), (leg,)))
+
+    # Fewest stops at which each leg has been settled: a later, costlier
+    # path reaching it with as many stops or more can never do better.
+    settled = {}
+    results = []
+    while heap and len(results) < limit:
+        _, _, path = heapq.heappop(heap)
+        leg = path[-1]
+        stops = len(path) - 1
+        if settled.get(leg.flight_id, max_stops + 1) <= stops:
+            continue
+        settled[leg.flight_id] = stops
+        if leg.arrival == destination:
+            results.append(Itinerary(path))
+            continue
+        if stops == max_stops:
+            continue
+        visited = {origin} | {previous.arrival for previous in path}
+        latest = leg.arrival_time + max_layover
+        for next_leg in graph.legs_from(leg.arrival, leg.arrival_time + min_connection):
+            if next_leg.departure_time > latest:
+                break
+            if next_leg.available_seats < num_passengers or next_leg.arrival in visited:
+                continue
+            next_path = path + (next_leg,)
+            heapq.heappush(heap, (_cost(sort, next_path), next(order), next_path))
+    return results
+
+
+def search(origin, destination, day, num_passengers, ticket_type_id, sort=SORT_EARLIEST,
+           max_stops=CONNECTION_MAX_STOPS, limit=CONNECTION_RESULTS_LIMIT):
+    """Find up to ``limit`` itineraries with at most ``max_stops`` connections.
+
+    Seat counts of the legs found are re-read in one query and patched into
+    the graph; if that rules out some itineraries the search is run again.
+    """
+    graph = get_graph(day, ticket_type_id)
+    itineraries = _search(graph, origin, destination, num_passengers, sort, max_stops, limit)
+    flight_ids = {flight_id for itinerary in itineraries for flight_id in itinerary.flight_ids()}
+    if not flight_ids:
+        return itineraries
+    seats = dict(FlightTicketType.objects.filter(
+        flight_id__in=flight_ids, ticket_type_id=ticket_type_id
+    ).values_list("flight_id", "available_seats"))
+    stale = any(graph.legs_by_flight[flight_id].available_seats != seats.get(flight_id, 0) for flight_id in flight_ids)
+    graph.update_seats({flight_id: seats.get(flight_id, 0) for flight_id in flight_ids})
+    if stale:
+        itineraries = _search(graph, origin, destination, num_passengers, sort, max_stops, limit)
+    return itineraries
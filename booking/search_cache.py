@@ -0,0 +1,225 @@
+"""Short-lived cache for flight search results.
+
+Results are keyed on the normalized search (route, date, passengers and
+ticket type) plus a version number kept per route and date. Anything that
+changes seats or prices on a flight bumps the version of that flight's
+route and date, which makes every cached search for it miss at once. The
+bump waits for the writing transaction to commit, so that a search running
+meanwhile cannot cache the old availability under the new version.
+
+With ``BOOKING_SEARCH_CACHE_STALE_TTL`` set, an expired result is kept for
+that many more seconds: one request recomputes it while the others keep
+being served the stale copy instead of all hitting the database together.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+VERSION_KEY = "booking:search:version:{departure}:{arrival}:{date}"
+RESULT_KEY = "booking:search:{version}:{departure}:{arrival}:{date}:{passengers}:{ticket_type}"
+REFRESH_KEY = "booking:search:refresh:{key}"
+CALENDAR_KEY = "booking:calendar:{departure}:{arrival}:{start}:{end}:{passengers}:{ticket_type}:{fingerprint}"
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def _cache():
+    return caches[getattr(settings, "BOOKING_SEARCH_CACHE", "default")]
+
+
+def _ttl():
+    return getattr(settings, "BOOKING_SEARCH_CACHE_TTL", 30)
+
+
+def _stale_ttl():
+    return getattr(settings, "BOOKING_SEARCH_CACHE_STALE_TTL", 0)
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def _route_date(day):
+    if hasattr(day, "hour"):
+        day = timezone.localtime(day).date()
+    return day.isoformat()
+
+
+def _version(cache, departure, arrival, date):
+    key = VERSION_KEY.format(departure=departure, arrival=arrival, date=date)
+    version = cache.get(key)
+    if version is None:
+        # Seeded from the clock so an evicted counter never reuses an old version.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+async def _aversion(cache, departure, arrival, date):
+    key = VERSION_KEY.format(departure=departure, arrival=arrival, date=date)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), timeout=None)
+        version = await cache.aget(key, 0)
+    return version
+
+
+def _result_key(search, version):
+    departure, arrival, date, passengers, ticket_type = search
+    return RESULT_KEY.format(
+        version=version, departure=departure, arrival=arrival, date=date,
+        passengers=passengers, ticket_type=ticket_type
+    )
+
+
+def _calendar_key(departure, arrival, dates, version_keys, versions, num_passengers, ticket_type_id):
+    fingerprint = hashlib.md5(
+        ":".join(str(versions[version_key]) for version_key in version_keys).encode()
+    ).hexdigest()
+    return CALENDAR_KEY.format(
+        departure=departure, arrival=arrival, start=dates[0], end=dates[-1],
+        passengers=num_passengers, ticket_type=ticket_type_id, fingerprint=fingerprint
+    )
+
+
+def normalize(departure, arrival, departure_date, num_passengers, ticket_type_id):
+    """Return the canonical form of a search, or None if it cannot be cached."""
+    day = parse_date(f"{departure_date}")
+    if day is None:
+        return None
+    return (
+        f"{departure}".strip().upper(),
+        f"{arrival}".strip().upper(),
+        day.isoformat(),
+        int(num_passengers),
+        int(ticket_type_id),
+    )
+
+
+def get_or_compute(search, compute):
+    """Return the cached result of ``search`` (see normalize), computing it on a miss."""
+    if search is None:
+        return compute()
+    departure, arrival, date = search[:3]
+    cache = _cache()
+    key = _result_key(search, _version(cache, departure, arrival, date))
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        if now < entry["fresh_until"]:
+            _count("hits")
+            return entry["value"]
+        # Stale: only the request that wins the refresh lock recomputes.
+        if not cache.add(REFRESH_KEY.format(key=key), 1, timeout=_ttl()):
+            _count("stale_hits")
+            return entry["value"]
+    _count("misses")
+    value = compute()
+    cache.set(key, {"value": value, "fresh_until": now + _ttl()}, timeout=_ttl() + _stale_ttl())
+    cache.delete(REFRESH_KEY.format(key=key))
+    return value
+
+
+async def aget_or_compute(search, compute):
+    """Async get_or_compute, for async views; ``compute`` is a coroutine function.
+
+    Shares its entries with get_or_compute, so both kinds of view warm the
+    same cache.
+    """
+    if search is None:
+        return await compute()
+    departure, arrival, date = search[:3]
+    cache = _cache()
+    key = _result_key(search, await _aversion(cache, departure, arrival, date))
+    entry = await cache.aget(key)
+    now = time.time()
+    if entry is not None:
+        if now < entry["fresh_until"]:
+            _count("hits")
+            return entry["value"]
+        if not await cache.aadd(REFRESH_KEY.format(key=key), 1, timeout=_ttl()):
+            _count("stale_hits")
+            return entry["value"]
+    _count("misses")
+    value = await compute()
+    await cache.aset(key, {"value": value, "fresh_until": now + _ttl()}, timeout=_ttl() + _stale_ttl())
+    await cache.adelete(REFRESH_KEY.format(key=key))
+    return value
+
+
+def get_or_compute_calendar(departure, arrival, dates, num_passengers, ticket_type_id, compute):
+    """Return a cached fare calendar, computing it on a miss.
+
+    The key embeds the version of every date in the window (fetched in one
+    round trip), so a seat or price change on any of those days invalidates
+    the calendar as well as the searches for that day.
+    """
+    cache = _cache()
+    departure = f"{departure}".strip().upper()
+    arrival = f"{arrival}".strip().upper()
+    dates = [_route_date(day) for day in dates]
+    version_keys = [VERSION_KEY.format(departure=departure, arrival=arrival, date=date) for date in dates]
+    versions = cache.get_many(version_keys)
+    for date, version_key in zip(dates, version_keys):
+        if version_key not in versions:
+            versions[version_key] = _version(cache, departure, arrival, date)
+    key = _calendar_key(departure, arrival, dates, version_keys, versions, num_passengers, ticket_type_id)
+    value = cache.get(key)
+    if value is not None:
+        _count("hits")
+        return value
+    _count("misses")
+    value = compute()
+    cache.set(key, value, timeout=_ttl())
+    return value
+
+
+async def aget_or_compute_calendar(departure, arrival, dates, num_passengers, ticket_type_id, compute):
+    """Async get_or_compute_calendar; ``compute`` is a coroutine function."""
+    cache = _cache()
+    departure = f"{departure}".strip().upper()
+    arrival = f"{arrival}".strip().upper()
+    dates = [_route_date(day) for day in dates]
+    version_keys = [VERSION_KEY.format(departure=departure, arrival=arrival, date=date) for date in dates]
+    versions = await cache.aget_many(version_keys)
+    for date, version_key in zip(dates, version_keys):
+        if version_key not in versions:
+            versions[version_key] = await _aversion(cache, departure, arrival, date)
+    key = _calendar_key(departure, arrival, dates, version_keys, versions, num_passengers, ticket_type_id)
+    value = await cache.aget(key)
+    if value is not None:
+        _count("hits")
+        return value
+    _count("misses")
+    value = await compute()
+    await cache.aset(key, value, timeout=_ttl())
+    return value
+
+
+def invalidate(departure, arrival, day):
+    """Make every cached search for this route and date miss once the transaction commits."""
+    date = _route_date(day)
+    transaction.on_commit(lambda: _bump(departure, arrival, date))
+
+
+def _bump(departure, arrival, date):
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY.format(departure=departure, arrival=arrival, date=date))
+    except ValueError:
+        _version(cache, departure, arrival, date)
+
+
+def stats():
+    """Return the hit/miss counters of this process."""
+    with _stats_lock:
+        return {event: _stats[event] for event in ("hits", "stale_hits", "misses")}
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fragment_cache, reference_data, route_graph, search_cache
+from .models import Airport, Flight, FlightTicketType, RouteDayAvailability, TicketType
+
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+@receiver(post_save, sender=TicketType)
+@receiver(post_delete, sender=TicketType)
+def invalidate_reference_data(sender, using, **kwargs):
+    """Airports and ticket types feed the cached search dropdowns and flight pages."""
+    # After commit, so that a concurrent read cannot cache the old rows again under the new version.
+    transaction.on_commit(__invalidate_reference_data, using=using)
+
+
+def __invalidate_reference_data():
+    reference_data.invalidate()
+    fragment_cache.invalidate(fragment_cache.REFERENCE_DATA)
+
+
+def __route_day(flight):
+    return (flight.departure_airport_id, flight.arrival_airport_id,
+            timezone.localtime(flight.departure_time).date())
+
+
+@receiver(pre_save, sender=Flight)
+def remember_flight_route_day(sender, instance, **kwargs):
+    """Keep the route and day a rescheduled flight is moving away from."""
+    previous = Flight.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._previous_route_day = __route_day(previous) if previous else None
+    instance._previous_departure_time = previous.departure_time if previous else None
+
+
+@receiver(post_save, sender=Flight)
+def refresh_flight_availability(sender, instance, **kwargs):
+    fragment_cache.invalidate_flight(instance.pk)
+    route_graph.invalidate_day(instance.departure_time)
+    previous_departure_time = getattr(instance, '_previous_departure_time', None)
+    if previous_departure_time is not None:
+        route_graph.invalidate_day(previous_departure_time)
+    route_days = {__route_day(instance), getattr(instance, '_previous_route_day', None)} - {None}
+    ticket_type_ids = list(
+        FlightTicketType.objects.filter(flight=instance).values_list('ticket_type_id', flat=True)
+    )
+    for departure_airport_id, arrival_airport_id, travel_date in route_days:
+        search_cache.invalidate(departure_airport_id, arrival_airport_id, travel_date)
+        for ticket_type_id in ticket_type_ids:
+            RouteDayAvailability.refresh(departure_airport_id, arrival_airport_id, travel_date, ticket_type_id)
+
+
+@receiver(post_delete, sender=Flight)
+def invalidate_flight_searches(sender, instance, **kwargs):
+    fragment_cache.invalidate_flight(instance.pk)
+    search_cache.invalidate(instance.departure_airport_id, instance.arrival_airport_id, instance.departure_time)
+    route_graph.invalidate_day(instance.departure_time)
+
+
+@receiver(post_save, sender=FlightTicketType)
+@receiver(post_delete, sender=FlightTicketType)
+def refresh_fare_availability(sender, instance, **kwargs):
+    """Prices and seat counts edited through the admin."""
+    instance.availability_changed()
+    route_graph.invalidate_day(instance.flight.departure_time)
@@ -29,8 +29,11 @@ document.querySelector('.model-search-btn').addEventListener('click', (e) => {
     // Get the number of passengers and chair type
     const numPassengers = document.getElementById('num-passengers').value;
     const chairType = document.getElementById('chair-type').value;
+    // Get the search mode and the order of connecting itineraries
+    const searchMode = document.getElementById('search-mode').value;
+    const sortBy = document.getElementById('sort-by').value;
     // Build the URL for the search request
-    const url = `?tripType=${tripType}&from=${encodeURIComponent(fromAirport)}&to=${encodeURIComponent(toAirport)}&departureDate=${departureDate}&returnDate=${returnDate}&numPassengers=${numPassengers}&chairType=${chairType}`;
+    const url = `?tripType=${tripType}&from=${encodeURIComponent(fromAirport)}&to=${encodeURIComponent(toAirport)}&departureDate=${departureDate}&returnDate=${returnDate}&numPassengers=${numPassengers}&chairType=${chairType}&searchMode=${searchMode}&sortBy=${sortBy}`;
     // Redirect to the search URL
     window.location.href = url;
 });
@@ -0,0 +1,34 @@
+"""Job handlers run by the runworker command, see booking.jobs."""
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils.translation import gettext as _
+
+from .jobs import job
+from .models import Booking, Payment
+
+
+@job('send_booking_confirmation')
+def send_booking_confirmation(booking_ids):
+    """E-mail the account holder the confirmed bookings of one checkout."""
+    bookings = list(
+        Booking.objects.filter(booking_id__in=booking_ids, status='Confirmed')
+        .select_related('account', 'flight_ticket_type__flight', 'flight_ticket_type__ticket_type')
+        .prefetch_related('passengers')
+        .order_by('booking_id')
+    )
+    if not bookings:
+        return
+    references = dict(
+        Payment.objects.filter(booking__in=bookings).values_list('booking_id', 'transaction_id')
+    )
+    account = bookings[0].account
+    send_mail(
+        _("Your booking is confirmed"),
+        render_to_string('emails/booking_confirmation.txt', {
+            'account': account,
+            'bookings': [(booking, references.get(booking.booking_id)) for booking in bookings],
+        }),
+        settings.DEFAULT_FROM_EMAIL,
+        [account.email],
+    )
@@ -1,3 +1,1018 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    checkout, db_router, exports, fragment_cache, jobs, metrics, reference_data, route_graph, search_cache, warmup
+)
+from .constants import FARE_CALENDAR_MAX_DAYS, FLIGHTS_PER_PAGE, PRICE_FORMAT
+from .db_backends.pool import ConnectionPoolMixin, clear_pool
+from .models import (
+    Account, Airport, Booking, Card, Flight, FlightTicketType, IdempotencyKey, Job, Payment, RouteDayAvailability,
+    Passenger, SeatHold, SeatMap, TicketType
+)
+
+
+def create_flight_ticket_type(available_seats=10, price=1000000):
+    departure_airport, _ = Airport.objects.get_or_create(
+        airport_code='HAN', defaults={'name': 'Noi Bai', 'city': 'Hanoi', 'country': 'Vietnam'})
+    arrival_airport, _ = Airport.objects.get_or_create(
+        airport_code='SGN', defaults={'name': 'Tan Son Nhat', 'city': 'Ho Chi Minh', 'country': 'Vietnam'})
+    ticket_type, _ = TicketType.objects.get_or_create(name='Economy')
+    departure_time = timezone.now() + timedelta(days=7)
+    flight = Flight.objects.create(
+        flight_number='VN123',
+        departure_airport=departure_airport,
+        arrival_airport=arrival_airport,
+        departure_time=departure_time,
+        arrival_time=departure_time + timedelta(hours=2),
+    )
+    return FlightTicketType.objects.create(
+        flight=flight, ticket_type=ticket_type, price=price, available_seats=available_seats)
+
+
+def updates_to(queries, table):
+    """UPDATE statements issued against the given table, with identifiers double-quoted."""
+    statements = [query['sql'].replace('`', '"') for query in queries]
+    return [sql for sql in statements if sql.startswith(f'UPDATE "{table}"')]
+
+
+def inserts_into(queries, table):
+    """INSERT statements issued against the given table, with identifiers double-quoted."""
+    statements = [query['sql'].replace('`', '"') for query in queries]
+    return [sql for sql in statements if sql.startswith(f'INSERT INTO "{table}"')]
+
+
+class SeatInventoryTests(TestCase):
+    def test_book_seat_is_a_single_conditional_update(self):
+        flight_ticket_type = create_flight_ticket_type(available_seats=3)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(flight_ticket_type.book_seat(2))
+        inventory_updates = updates_to(queries, 'booking_flighttickettype')
+        self.assertEqual(len(inventory_updates), 1)
+        self.assertIn('"available_seats" >=', inventory_updates[0])
+        self.assertEqual(flight_ticket_type.available_seats, 1)
+
+    def test_book_seat_refuses_to_oversell(self):
+        flight_ticket_type = create_flight_ticket_type(available_seats=1)
+        self.assertFalse(flight_ticket_type.book_seat(2))
+        flight_ticket_type.refresh_from_db()
+        self.assertEqual(flight_ticket_type.available_seats, 1)
+
+    def test_release_seat_is_symmetric(self):
+        flight_ticket_type = create_flight_ticket_type(available_seats=5)
+        flight_ticket_type.book_seat(3)
+        flight_ticket_type.release_seat(3)
+        flight_ticket_type.refresh_from_db()
+        self.assertEqual(flight_ticket_type.available_seats, 5)
+
+
+class RouteDayAvailabilityTests(TestCase):
+    def test_summary_follows_seat_changes_and_rebuilds(self):
+        flight_ticket_type = create_flight_ticket_type(available_seats=10, price=900000)
+        create_flight_ticket_type(available_seats=4, price=700000)
+        summary = RouteDayAvailability.objects.get()
+        self.assertEqual(
+            (summary.flight_count, summary.max_available_seats, summary.total_available_seats, summary.min_price),
+            (2, 10, 14, 700000))
+
+        flight_ticket_type.book_seat(8)
+        summary.refresh_from_db()
+        self.assertEqual((summary.max_available_seats, summary.total_available_seats), (4, 6))
+        self.assertFalse(summary.has_seats_for(5))
+
+        RouteDayAvailability.objects.all().delete()
+        self.assertEqual(RouteDayAvailability.objects.rebuild(), 1)
+        self.assertEqual(RouteDayAvailability.objects.get().total_available_seats, 6)
+
+    def test_search_falls_back_to_the_query_without_a_summary(self):
+        flight_ticket_type = create_flight_ticket_type()
+        # As after bulk_create or a restored dump: the fare exists, its summary does not.
+        RouteDayAvailability.objects.all().delete()
+        cache.clear()
+        response = self.client.get(reverse('index'), {
+            'tripType': 'oneway', 'from': 'HAN', 'to': 'SGN', 'numPassengers': 2, 'chairType': 'Economy',
+            'departureDate': timezone.localtime(flight_ticket_type.flight.departure_time).date().isoformat(),
+        })
+        self.assertEqual([flight.pk for flight in response.context['departure_flights']],
+                         [flight_ticket_type.flight_id])
+
+
+@override_settings(BOOKING_SEARCH_CACHE_TTL=30, BOOKING_SEARCH_CACHE_STALE_TTL=60)
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.flight_ticket_type = create_flight_ticket_type()
+        self.search = search_cache.normalize(
+            'HAN', 'SGN', timezone.localtime(self.flight_ticket_type.flight.departure_time).date(), 1,
+            self.flight_ticket_type.ticket_type_id)
+        self.computed = []
+
+    def compute(self):
+        self.computed.append(len(self.computed) + 1)
+        return self.computed[-1]
+
+    def test_version_is_bumped_when_the_booking_commits(self):
+        self.assertEqual(search_cache.get_or_compute(self.search, self.compute), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight_ticket_type.book_seat(1)
+            # Until the commit, searches keep the version their cached results belong to.
+            self.assertEqual(search_cache.get_or_compute(self.search, self.compute), 1)
+        self.assertEqual(search_cache.get_or_compute(self.search, self.compute), 2)
+
+    def test_expired_result_is_served_stale_while_one_request_refreshes(self):
+        with mock.patch('booking.search_cache.time') as clock:
+            clock.time.return_value = 1000.0
+            self.assertEqual(search_cache.get_or_compute(self.search, self.compute), 1)
+            clock.time.return_value = 1040.0
+            served_meanwhile = []
+
+            def refresh():
+                served_meanwhile.append(search_cache.get_or_compute(self.search, self.compute))
+                return self.compute()
+            self.assertEqual(search_cache.get_or_compute(self.search, refresh), 2)
+            self.assertEqual(served_meanwhile, [1])
+            self.assertEqual(search_cache.get_or_compute(self.search, self.compute), 2)
+
+
+class FareCalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reference_data.invalidate()
+        for seats, price in [(10, 1000000), (10, 900000), (1, 500000)]:
+            self.day = timezone.localtime(create_flight_ticket_type(seats, price).flight.departure_time).date()
+
+    def calendar(self, **params):
+        return self.client.get(reverse('fare_calendar'), {
+            'from': 'HAN', 'to': 'SGN', 'chairType': 'Economy', 'departureDate': self.day.isoformat(), **params
+        })
+
+    def test_days_are_grouped_and_the_window_is_clamped(self):
+        days = self.calendar(numPassengers=2, days=30).json()['days']
+        self.assertEqual(len(days), 2 * FARE_CALENDAR_MAX_DAYS + 1)
+        self.assertEqual(days[0]['date'], (self.day - timedelta(days=FARE_CALENDAR_MAX_DAYS)).isoformat())
+        # The fare with a single seat left is too small for two passengers.
+        self.assertEqual(days[FARE_CALENDAR_MAX_DAYS],
+                         {'date': self.day.isoformat(), 'min_price': 900000.0, 'flights': 2})
+        self.assertEqual(sum(day['flights'] for day in days), 2)
+
+        days = self.calendar(days=1).json()['days']
+        self.assertEqual([day['min_price'] for day in days], [None, 500000.0, None])
+
+    def test_invalid_input_is_rejected(self):
+        self.assertEqual(self.calendar(departureDate='2024-02-30').status_code, 400)
+        self.assertEqual(self.calendar(numPassengers='two').status_code, 400)
+        self.assertEqual(self.calendar(chairType='Hammock').status_code, 400)
+        self.assertEqual(self.calendar(**{'from': ''}).status_code, 400)
+
+
+class ConnectionSearchTests(TestCase):
+    def setUp(self):
+        self.airports = {
+            code: Airport.objects.create(airport_code=code, name=code, city=code, country='Vietnam')
+            for code in ['HAN', 'DAD', 'SGN']
+        }
+        self.ticket_type = TicketType.objects.create(name='Economy')
+        self.day = timezone.localtime(timezone.now() + timedelta(days=7)).date()
+        self.morning = timezone.make_aware(timezone.datetime.combine(self.day, timezone.datetime.min.time())) \
+            + timedelta(hours=8)
+
+    def add_leg(self, number, departure, arrival, departs_after, hours, price, seats=10):
+        departure_time = self.morning + departs_after
+        flight = Flight.objects.create(
+            flight_number=number, departure_airport=self.airports[departure], arrival_airport=self.airports[arrival],
+            departure_time=departure_time, arrival_time=departure_time + timedelta(hours=hours))
+        return FlightTicketType.objects.create(
+            flight=flight, ticket_type=self.ticket_type, price=price, available_seats=seats)
+
+    def search(self, sort=route_graph.SORT_EARLIEST, passengers=1):
+        return route_graph.search('HAN', 'SGN', self.day, passengers, self.ticket_type.pk, sort=sort)
+
+    def test_connections_respect_minimum_connection_time_and_sort(self):
+        self.add_leg('VN1', 'HAN', 'DAD', timedelta(), 1, 500000)
+        self.add_leg('VN2', 'DAD', 'SGN', timedelta(hours=2), 1, 500000)
+        self.add_leg('VN3', 'DAD', 'SGN', timedelta(minutes=65), 1, 100000)
+        self.add_leg('VN4', 'HAN', 'SGN', timedelta(hours=6), 2, 2000000)
+
+        earliest = self.search()
+        self.assertEqual([leg.flight_number for leg in earliest[0].legs], ['VN1', 'VN2'])
+        self.assertEqual([itinerary.stops for itinerary in earliest], [1, 0])
+
+        cheapest = self.search(sort=route_graph.SORT_CHEAPEST)
+        self.assertEqual(cheapest[0].total_price, 1000000)
+
+    def test_seats_are_rechecked_against_the_database(self):
+        self.add_leg('VN1', 'HAN', 'DAD', timedelta(), 1, 500000)
+        second_leg = self.add_leg('VN2', 'DAD', 'SGN', timedelta(hours=2), 1, 500000)
+        self.assertEqual(len(self.search(passengers=5)), 1)
+        # Seat changes do not rebuild the graph; the final check catches them.
+        second_leg.book_seat(8)
+        self.assertEqual(self.search(passengers=5), [])
+        self.assertEqual(len(self.search(passengers=2)), 1)
+
+
+class FlightListTests(TestCase):
+    def setUp(self):
+        reference_data.invalidate()
+        self.flights = [create_flight_ticket_type().flight for _ in range(FLIGHTS_PER_PAGE + 1)]
+        # One departure time for all, so the pages are told apart by flight id alone.
+        Flight.objects.update(departure_time=self.flights[0].departure_time)
+
+    def test_cursor_continues_after_the_last_flight_shown(self):
+        response = self.client.get(reverse('flight'), {'departure_location': 'Hanoi'})
+        first_page = response.context['flights']
+        self.assertEqual(len(first_page), FLIGHTS_PER_PAGE)
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{reverse('flight')}?{response.context['next_query']}")
+        self.assertEqual([flight.pk for flight in first_page + response.context['flights']],
+                         [flight.pk for flight in self.flights])
+        self.assertIsNone(response.context['next_query'])
+        self.assertFalse(response.context['is_first_page'])
+
+    def test_malformed_cursor_starts_from_the_first_page(self):
+        for cursor in ['not base64!', 'bm90LWEtY3Vyc29y', 'MjAzMC0wMS0wMXxhYmM']:
+            response = self.client.get(reverse('flight'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['is_first_page'])
+            self.assertEqual(response.context['flights'][0], self.flights[0])
+
+
+class SeatHoldTests(TestCase):
+    def setUp(self):
+        self.flight_ticket_type = create_flight_ticket_type(available_seats=5)
+        self.account = Account.objects.create_user(
+            username='holder1', password='secret123', email='holder@example.com', phone_number='0912345678')
+
+    def test_hold_moves_seats_out_of_availability(self):
+        seat_hold = SeatHold.place(self.flight_ticket_type, self.account, 3)
+        self.flight_ticket_type.refresh_from_db()
+        self.assertEqual((self.flight_ticket_type.available_seats, self.flight_ticket_type.held_seats), (2, 3))
+        self.assertIsNone(SeatHold.place(self.flight_ticket_type, self.account, 3))
+        self.assertTrue(seat_hold.confirm())
+        self.flight_ticket_type.refresh_from_db()
+        self.assertEqual((self.flight_ticket_type.available_seats, self.flight_ticket_type.held_seats), (2, 0))
+
+    def test_sweeper_releases_expired_holds_in_bulk(self):
+        for _ in range(3):
+            SeatHold.place(self.flight_ticket_type, self.account, 1)
+        SeatHold.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with CaptureQueriesContext(connection) as queries:
+            released = SeatHold.objects.release_expired()
+        self.assertEqual(released, 3)
+        self.assertEqual(len(updates_to(queries, 'booking_seathold')), 1)
+        self.assertEqual(len(updates_to(queries, 'booking_flighttickettype')), 1)
+        self.flight_ticket_type.refresh_from_db()
+        self.assertEqual((self.flight_ticket_type.available_seats, self.flight_ticket_type.held_seats), (5, 0))
+
+    def test_confirming_a_released_hold_books_again(self):
+        seat_hold = SeatHold.place(self.flight_ticket_type, self.account, 2)
+        SeatHold.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        SeatHold.objects.release_expired()
+        self.assertTrue(seat_hold.confirm())
+        self.flight_ticket_type.refresh_from_db()
+        self.assertEqual((self.flight_ticket_type.available_seats, self.flight_ticket_type.held_seats), (3, 0))
+
+
+class BookingListingQueryTests(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='frequentflyer', password='secret123', email='flyer@example.com',
+            phone_number='0912345678', is_superuser=True)
+        self.client.force_login(self.account)
+
+    def create_bookings(self, count):
+        for _ in range(count):
+            Booking.objects.create(
+                account=self.account, flight_ticket_type=create_flight_ticket_type(),
+                status='PendingCancellation')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        for url in [reverse('user_bookings'), reverse('pending_cancellations')]:
+            self.create_bookings(1)
+            few = self.count_queries(url)
+            self.create_bookings(15)
+            many = self.count_queries(url)
+            self.assertEqual(few, many, url)
+
+
+class BulkCancellationTests(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='disrupted', password='secret123', email='disrupted@example.com',
+            phone_number='0912345678', is_superuser=True)
+        self.flight_ticket_types = [create_flight_ticket_type(available_seats=10) for _ in range(2)]
+
+    def book(self, flight_ticket_type, seats, hold_status=None):
+        booking = Booking.objects.create(
+            account=self.account, flight_ticket_type=flight_ticket_type,
+            seat_count=seats, status='PendingCancellation')
+        if hold_status:
+            SeatHold.objects.create(
+                flight_ticket_type=flight_ticket_type, account=self.account, booking=booking,
+                quantity=seats, status=hold_status, expires_at=timezone.now() + timedelta(minutes=5))
+        return booking
+
+    def test_approval_releases_seats_with_one_update_per_fare(self):
+        first, second = self.flight_ticket_types
+        FlightTicketType.objects.filter(pk=first.pk).update(available_seats=4, held_seats=2)
+        for seats in (1, 2):
+            self.book(first, seats)
+        self.book(first, 2, hold_status='Active')
+        self.book(second, 3, hold_status='Confirmed')
+        with CaptureQueriesContext(connection) as queries:
+            cancelled = Booking.objects.all().approve_cancellations(batch_size=2)
+        self.assertEqual(cancelled, 4)
+        self.assertEqual(len(updates_to(queries, 'booking_booking')), 2)
+        self.assertEqual(len(updates_to(queries, 'booking_flighttickettype')), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.available_seats, first.held_seats), (9, 0))
+        self.assertEqual(second.available_seats, 13)
+        self.assertEqual(set(Booking.objects.values_list('status', flat=True)), {'Canceled'})
+        self.assertFalse(SeatHold.objects.filter(status='Active').exists())
+        self.assertEqual(Booking.objects.all().approve_cancellations(), 0)
+
+    def test_seats_of_swept_holds_are_not_given_back_twice(self):
+        flight_ticket_type = self.flight_ticket_types[0]
+        passengers = [Passenger(first_name='Left', last_name=f'Cart{i}') for i in range(3)]
+        [abandoned] = checkout.create_bookings(
+            self.account, [flight_ticket_type], passengers, '912345678', 'disrupted@example.com')
+        SeatHold.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        SeatHold.objects.release_expired()
+        # The released seats have been given to someone else since.
+        SeatMap.objects.get().assign(3, abandoned.seat_labels())
+
+        Booking.objects.all().approve_cancellations()
+        flight_ticket_type.refresh_from_db()
+        self.assertEqual((flight_ticket_type.available_seats, flight_ticket_type.held_seats), (10, 0))
+        self.assertEqual(SeatMap.objects.get().free_count(), 7)
+
+    def test_bulk_endpoint_rejects_selected_bookings(self):
+        selected, other = [self.book(self.flight_ticket_types[0], 1) for _ in range(2)]
+        self.client.force_login(self.account)
+        response = self.client.post(reverse('bulk_cancellations'), {
+            'action': 'reject', 'booking_ids': [selected.booking_id]})
+        self.assertRedirects(response, reverse('pending_cancellations'))
+        self.assertEqual(Booking.objects.get(pk=selected.pk).status, 'DeniedCancellation')
+        self.assertEqual(Booking.objects.get(pk=other.pk).status, 'PendingCancellation')
+        self.client.post(reverse('bulk_cancellations'), {'action': 'approve', 'scope': 'all'})
+        self.assertEqual(Booking.objects.get(pk=other.pk).status, 'Canceled')
+
+
+class ConcurrentSeatBookingTests(TransactionTestCase):
+    available_seats = 10
+    threads = 40
+
+    def test_no_oversell_under_contention(self):
+        flight_ticket_type = create_flight_ticket_type(available_seats=self.available_seats)
+        barrier = threading.Barrier(self.threads)
+        results = []
+        errors = []
+
+        def book():
+            try:
+                # Every thread works on its own stale copy of the row.
+                stale_copy = FlightTicketType.objects.get(pk=flight_ticket_type.pk)
+                barrier.wait()
+                results.append(stale_copy.book_seat(1))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=book) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results.count(True), self.available_seats)
+        flight_ticket_type.refresh_from_db()
+        self.assertEqual(flight_ticket_type.available_seats, 0)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.flight_ticket_type = create_flight_ticket_type(available_seats=5)
+        self.account = Account.objects.create_user(
+            username='doubleclick', password='secret123', email='double@example.com', phone_number='0912345678')
+        self.client.force_login(self.account)
+
+    def checkout(self, key, **extra):
+        return self.client.post(reverse('payment'), dict({
+            'flight1': self.flight_ticket_type.flight_id, 'flight1Class': 'Economy', 'numPassengers': 1,
+            'totalCost': '1000000', 'countryCode': '84', 'mobile': '912345678', 'email': 'double@example.com',
+            'passenger0Fname': 'Double', 'passenger0Lname': 'Click', 'passenger0Gender': 'Male',
+            'passenger0DateOfBirth': '1990-01-01', 'passenger0Nationality': 'Vietnamese',
+            'idempotency_key': key,
+        }, **extra))
+
+    def test_retried_checkout_replays_the_first_response(self):
+        first = self.checkout('key-1')
+        retry = self.checkout('key-1')
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+        self.flight_ticket_type.refresh_from_db()
+        self.assertEqual(self.flight_ticket_type.available_seats, 4)
+        self.assertEqual(self.checkout('key-1', numPassengers=2).status_code, 422)
+
+        payment = {
+            'checkout_id': first.context['checkout_id'], 'cardNumber': '4111111111111111',
+            'cardHolderName': 'Double Click', 'expMonth': '12', 'expYear': '2059', 'cardType': 'Visa',
+            'idempotency_key': first.context['idempotency_key'],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('process'), payment)
+            self.client.post(reverse('process'), payment)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_failed_payment_rolls_back_the_seat_confirmation(self):
+        first = self.checkout('key-3')
+        payment = {
+            'checkout_id': first.context['checkout_id'], 'cardNumber': '4111111111111111',
+            'cardHolderName': 'Double Click', 'expMonth': '12', 'expYear': '2059', 'cardType': 'Visa',
+        }
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, \
+                mock.patch('booking.views.Payment.save', side_effect=RuntimeError('gateway down')):
+            self.assertContains(self.client.post(reverse('process'), payment), 'gateway down')
+        self.assertEqual(callbacks, [])
+        self.assertEqual(SeatHold.objects.get().status, 'Active')
+        self.assertNotEqual(Booking.objects.get().status, 'Confirmed')
+        self.assertFalse(Payment.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('process'), payment)
+        self.assertEqual(SeatHold.objects.get().status, 'Confirmed')
+        self.assertEqual(Booking.objects.get().status, 'Confirmed')
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.checkout('key-2')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.flight_ticket_type = create_flight_ticket_type(available_seats=9)
+        self.account = Account.objects.create_user(
+            username='groupleader', password='secret123', email='group@example.com', phone_number='0912345678')
+
+    def form(self, count, **overrides):
+        data = {}
+        for i in range(count):
+            data.update({f'passenger{i}Fname': 'An', f'passenger{i}Lname': 'Nguyen', f'passenger{i}Gender': 'Male',
+                         f'passenger{i}DateOfBirth': '1990-01-01', f'passenger{i}Nationality': 'Vietnam'})
+        data.update(overrides)
+        return data
+
+    def test_every_passenger_is_validated_before_anything_is_written(self):
+        passengers, errors = checkout.parse_passengers(self.form(2), 2, international=False)
+        self.assertEqual((len(passengers), errors), (2, []))
+        self.assertIsNone(passengers[0].pk)
+
+        passengers, errors = checkout.parse_passengers(
+            self.form(3, passenger1Fname='An1', passenger2DateOfBirth='1990-02-30'), 3, international=True)
+        self.assertEqual(passengers[1:], [])
+        self.assertIn('Some of the first names are not valid.', errors)
+        self.assertIn('Some of the dates of birth are not valid.', errors)
+        self.assertIn('Please input the passport numbers.', errors)
+        self.assertEqual(len(errors), len(set(errors)))
+
+    def book(self, count):
+        passengers, _errors = checkout.parse_passengers(self.form(count), count, international=False)
+        with CaptureQueriesContext(connection) as queries:
+            bookings = checkout.create_bookings(
+                self.account, [self.flight_ticket_type], passengers, '912345678', 'group@example.com')
+        self.assertEqual(len(inserts_into(queries, 'booking_passenger')), 1)
+        self.assertEqual(bookings[0].passengers.count(), count)
+        return len(queries)
+
+    def test_group_bookings_cost_the_same_queries_and_roll_back_as_a_whole(self):
+        SeatMap.objects.for_fare(self.flight_ticket_type)
+        self.assertEqual(self.book(1), self.book(7))
+
+        with self.assertRaises(checkout.CheckoutError):
+            self.book(2)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(Passenger.objects.count(), 8)
+        self.flight_ticket_type.refresh_from_db()
+        self.assertEqual(self.flight_ticket_type.available_seats, 1)
+
+    def test_passengers_are_bulk_inserted_without_returning(self):
+        SeatMap.objects.for_fare(self.flight_ticket_type)
+        # As on MySQL: the new keys are read back instead of returned by the INSERT.
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            self.assertEqual(self.book(1), self.book(3))
+            self.book(2)
+        self.assertEqual(Passenger.objects.filter(flight_tickets__isnull=True).count(), 0)
+
+
+class CheckoutStateTests(TestCase):
+    def setUp(self):
+        self.flight_ticket_type = create_flight_ticket_type(available_seats=5, price=1000000)
+        self.account = Account.objects.create_user(
+            username='quoted', password='secret123', email='quoted@example.com', phone_number='0912345678')
+        self.client.force_login(self.account)
+
+    def test_prices_come_from_the_server_side_quote(self):
+        response = self.client.get(reverse('book_infor'), {
+            'd_flight_id': self.flight_ticket_type.flight_id, 'flight_ticket_type': 'Economy', 'num_passengers': 2})
+        checkout_id = response.context['checkout_id']
+        FlightTicketType.objects.filter(pk=self.flight_ticket_type.pk).update(price=1500000)
+
+        state = checkout.CheckoutState.load(response.wsgi_request, checkout_id)
+        self.assertEqual(state.total, 2000000)
+        session = self.client.session
+        session['checkouts'][checkout_id]['quoted_at'] = (timezone.now() - timedelta(hours=1)).isoformat()
+        session.save()
+        response = self.client.post(reverse('payment'), {
+            'checkout_id': checkout_id, 'totalCost': '1', 'numPassengers': 9,
+            'countryCode': '84', 'mobile': '912345678', 'email': 'quoted@example.com',
+            **{f'passenger{i}{field}': value for i in range(2) for field, value in [
+                ('Fname', 'Quo'), ('Lname', 'Ted'), ('Gender', 'Female'), ('DateOfBirth', '1990-01-01'),
+                ('Nationality', 'Vietnamese')]},
+        })
+        self.assertEqual(response.context['price'], PRICE_FORMAT.format(3000000))
+        self.assertEqual(Booking.objects.get().seat_count, 2)
+        self.assertEqual(Booking.objects.get().seat_number, '10A,10B')
+
+        response = self.client.post(reverse('process'), {
+            'checkout_id': checkout_id, 'cardNumber': '4111111111111111', 'cardHolderName': 'Quo Ted',
+            'expMonth': '12', 'expYear': '2059', 'cardType': 'Visa'})
+        self.assertEqual(Payment.objects.get().amount, 3000000)
+        self.assertIsNone(checkout.CheckoutState.load(response.wsgi_request, checkout_id))
+
+
+class SeatMapTests(TestCase):
+    def setUp(self):
+        self.flight_ticket_type = create_flight_ticket_type(available_seats=8)
+        self.account = Account.objects.create_user(
+            username='windowseat', password='secret123', email='window@example.com', phone_number='0912345678')
+        self.booking = Booking.objects.create(
+            account=self.account, flight_ticket_type=self.flight_ticket_type, seat_count=2, status='Confirmed')
+
+    def test_groups_are_seated_together(self):
+        seat_map = SeatMap.objects.for_fare(self.flight_ticket_type)
+        self.booking.refresh_from_db()
+        self.assertEqual((seat_map.capacity, self.booking.seat_number), (10, '10A,10B'))
+        self.assertEqual(len(bytes(seat_map.occupied)), 2)
+
+        self.assertEqual(seat_map.assign(3), ['10D', '10E', '10F'])
+        self.assertIsNone(seat_map.assign(1, ['10A']))
+        self.assertEqual(seat_map.assign(2, ['11b', '11A']), ['11A', '11B'])
+        self.assertEqual(SeatMap.objects.get().free_count(), 3)
+
+        SeatMap.objects.release({self.flight_ticket_type.pk: self.booking.seat_labels()})
+        self.assertEqual(SeatMap.objects.get().free_count(), 5)
+
+    def test_checkout_refuses_taken_seats(self):
+        SeatMap.objects.for_fare(self.flight_ticket_type)
+        passengers = [Passenger(first_name='Window', last_name='Seat')]
+        with self.assertRaises(checkout.CheckoutError):
+            checkout.create_bookings(
+                self.account, [self.flight_ticket_type], passengers, '912345678', 'window@example.com',
+                seat_labels=[['10B']])
+        self.assertEqual(Booking.objects.count(), 1)
+
+        [booking] = checkout.create_bookings(
+            self.account, [self.flight_ticket_type], passengers, '912345678', 'window@example.com',
+            seat_labels=[['11C']])
+        self.assertEqual(booking.seat_number, '11C')
+        SeatHold.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        SeatHold.objects.release_expired()
+        self.assertEqual(SeatMap.objects.get().free_count(), 8)
+
+
+class JobQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='mailme', password='secret123', email='mailme@example.com', phone_number='0912345678')
+
+    def run_worker(self):
+        out = StringIO()
+        call_command('runworker', '--once', '--concurrency', '2', '--poll-interval', '0.01', stdout=out)
+        return out.getvalue()
+
+    def test_jobs_are_queued_on_commit_and_run_by_the_worker(self):
+        booking = Booking.objects.create(
+            account=self.account, flight_ticket_type=create_flight_ticket_type(),
+            status='Confirmed')
+        card = Card.objects.create(user=self.account, card_number='4111', cardholder_name='Mail Me',
+                                   expiry_date=timezone.now().date(), card_type='Visa', billing_address='Hanoi')
+        Payment.objects.create(booking=booking, card=card, amount=1000000, transaction_id='ABC123')
+        with transaction.atomic():
+            jobs.enqueue('send_booking_confirmation', booking_ids=[booking.booking_id])
+            self.assertFalse(Job.objects.exists())
+        self.assertEqual(Job.objects.get().status, 'Pending')
+
+        self.assertIn('Ran 1 job(s), 0 failed.', self.run_worker())
+        self.assertEqual(Job.objects.get().status, 'Done')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['mailme@example.com'])
+        self.assertIn('ABC123', mail.outbox[0].body)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        calls = []
+
+        @jobs.job('test_flaky')
+        def flaky(fail_times):
+            calls.append(fail_times)
+            if len(calls) <= fail_times:
+                raise RuntimeError('temporary failure')
+
+        self.addCleanup(jobs._handlers.pop, 'test_flaky')
+
+        jobs.enqueue('test_flaky', fail_times=1)
+        with self.assertLogs('booking.jobs', 'WARNING'):
+            self.assertIn('Ran 0 job(s), 1 failed.', self.run_worker())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), ('Pending', 1))
+        self.assertIn('temporary failure', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.update(run_at=timezone.now())
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Done', 2))
+
+    def test_stale_jobs_are_requeued_until_their_attempts_run_out(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        lost, exhausted, alive = [
+            Job.objects.create(name='test_lost', status='Running', locked_by='worker-1', locked_at=long_ago,
+                               attempts=attempts, max_attempts=3)
+            for attempts in (1, 3, 1)
+        ]
+        self.assertEqual(Job.objects.heartbeat([alive.pk], 'worker-1'), 1)
+        self.assertEqual(Job.objects.requeue_stale(timezone.now() - timedelta(minutes=10)), 1)
+        for job in (lost, exhausted, alive):
+            job.refresh_from_db()
+        self.assertEqual((lost.status, lost.locked_by), ('Pending', ''))
+        self.assertEqual(exhausted.status, 'Failed')
+        self.assertIsNotNone(exhausted.finished_at)
+        self.assertEqual((alive.status, alive.locked_by), ('Running', 'worker-1'))
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_generate_and_benchmark(self):
+        output = os.path.join(tempfile.mkdtemp(), 'benchmark.json')
+        call_command('generate_synthetic_data', airports=4, days=2, flights_per_day=10, accounts=3, bookings=20,
+                     stdout=StringIO())
+        self.assertEqual(Flight.objects.count(), 20)
+        self.assertEqual(Booking.objects.count(), 20)
+        call_command('benchmark', iterations=2, warmup=0, host='testserver', output=output, stdout=StringIO())
+        with open(output) as results:
+            scenarios = json.load(results)['scenarios']
+        self.assertEqual(set(scenarios), {'index', 'flight_list', 'user_bookings', 'payment_view', 'process_view'})
+        for result in scenarios.values():
+            self.assertEqual(result['status_codes'], [200])
+        # Benchmark requests are rolled back.
+        self.assertEqual(Booking.objects.count(), 20)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_views_are_timed_and_exposed_to_admins(self):
+        create_flight_ticket_type()
+        response = self.client.get(reverse('flight'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+        member = Account.objects.create_user(
+            username='member1', password='secret123', email='member@example.com', phone_number='0912345678')
+        self.client.force_login(member)
+        self.assertEqual(self.client.get(reverse('request_metrics')).status_code, 302)
+
+        member.is_superuser = True
+        member.save()
+        views = self.client.get(reverse('request_metrics')).json()['views']
+        self.assertEqual(views['flight_list']['requests'], 1)
+        self.assertGreater(views['flight_list']['mean_queries'], 0)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            metrics.fingerprint("SELECT * FROM t WHERE id = 4 AND name = 'x' AND k IN (%s, %s)"),
+            metrics.fingerprint("SELECT * FROM t WHERE id = 17 AND name = 'y' AND k IN (%s)"))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], BOOKING_PRIMARY_PIN_SECONDS=0)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.session = {}
+
+    def request(self, method='get', write=False, view=None):
+        def routed(request):
+            reads = [router.db_for_read(Flight)]
+            if write:
+                router.db_for_write(Flight)
+            reads += [router.db_for_read(Flight), router.db_for_read(IdempotencyKey)]
+            return HttpResponse(','.join(reads))
+        request = getattr(RequestFactory(), method)('/')
+        request.session = self.session
+        response = db_router.DatabasePinMiddleware(view(routed) if view else routed)(request)
+        return response.content.decode().split(',')
+
+    def test_safe_requests_read_from_replicas_until_the_session_writes(self):
+        self.assertEqual(self.request(), ['replica', 'replica', 'default'])
+        self.assertEqual(self.request(method='post'), ['default', 'default', 'default'])
+        self.assertEqual(self.request(view=db_router.use_primary), ['default', 'default', 'default'])
+        self.assertNotIn(db_router.PIN_SESSION_KEY, self.session)
+
+        self.assertEqual(self.request(write=True), ['replica', 'default', 'default'])
+        self.assertEqual(self.request(), ['default', 'default', 'default'])
+        with self.settings(BOOKING_PRIMARY_PIN_SECONDS=60):
+            self.session[db_router.PIN_SESSION_KEY] -= 61
+            self.assertEqual(self.request(), ['replica', 'replica', 'default'])
+
+    def test_queries_outside_requests_stay_on_the_primary(self):
+        self.assertEqual(router.db_for_read(Flight), 'default')
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # close() keeps the in-memory test database open, so nothing is ever returned or opened anew.
+            self.skipTest('needs a database whose connections really close')
+
+    def tearDown(self):
+        clear_pool('pooled')
+
+    def test_closed_connections_are_reused(self):
+        PooledWrapper = type('PooledWrapper', (ConnectionPoolMixin, type(connections['default'])), {})
+        first = PooledWrapper({**connection.settings_dict, 'POOL_SIZE': 1}, alias='pooled')
+        second = PooledWrapper({**connection.settings_dict, 'POOL_SIZE': 1}, alias='pooled')
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        second.ensure_connection()
+        self.assertIs(second.connection, raw)
+        first.ensure_connection()
+        self.assertIsNot(first.connection, raw)
+        # Connections beyond the pool size are really closed.
+        second.close()
+        first.close()
+        self.assertEqual(first.pool().qsize(), 1)
+
+    def test_benchmark_compares_connection_modes(self):
+        out = StringIO()
+        call_command('benchmark_connections', iterations=5, stdout=out)
+        self.assertRegex(out.getvalue(), r'new .* connections opened 5')
+        self.assertRegex(out.getvalue(), r'persistent .* connections opened 0')
+
+
+class ReferenceDataTests(TestCase):
+    def setUp(self):
+        reference_data.invalidate()
+        Airport.objects.create(airport_code='HAN', name='Noi Bai', city='Hanoi', country='Vietnam')
+
+    def test_invalidation_waits_for_the_commit(self):
+        self.assertEqual([airport['name'] for airport in reference_data.get_airports()], ['Noi Bai'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.filter(pk='HAN').update(name='Noi Bai International')
+            Airport.objects.get(pk='HAN').save()
+            self.assertEqual(reference_data.get_airports()[0]['name'], 'Noi Bai')
+        self.assertEqual(reference_data.get_airports()[0]['name'], 'Noi Bai International')
+
+    def test_value_loaded_across_an_invalidation_is_not_kept(self):
+        loads = []
+
+        def loader():
+            loads.append(len(loads))
+            if len(loads) == 1:
+                reference_data.invalidate()
+            return len(loads)
+        self.assertEqual(reference_data._get('test', loader), 1)
+        self.assertEqual(reference_data._get('test', loader), 2)
+        self.assertEqual(reference_data._get('test', loader), 2)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reference_data.invalidate()
+        self.flight = create_flight_ticket_type().flight
+
+    def test_flight_detail_is_cached_until_the_flight_is_saved(self):
+        url = reverse('flight_detail', args=[self.flight.pk])
+        self.assertContains(self.client.get(url), 'VN123')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'VN123')
+        self.flight.flight_number = 'VN456'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight.save()
+            # Until the commit, a render could only cache the old row again, so the page is kept.
+            self.assertContains(self.client.get(url), 'VN123')
+        self.assertContains(self.client.get(url), 'VN456')
+
+    def test_dropdowns_follow_airport_changes_and_language(self):
+        response = self.client.get(reverse('index'), {'from': 'HAN'})
+        self.assertContains(response, 'Noi Bai (HAN)')
+        Airport.objects.filter(pk='HAN').update(name='Noi Bai International')
+        self.assertContains(self.client.get(reverse('index'), {'from': 'HAN'}), 'Noi Bai (HAN)')
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.get(pk='HAN').save()
+        self.assertContains(self.client.get(reverse('index'), {'from': 'HAN'}), 'Noi Bai International (HAN)')
+        self.assertContains(self.client.get('/vi' + reverse('index'), {'from': 'HAN'}), 'Noi Bai International (HAN)')
+
+    def test_dropdowns_do_not_vary_on_unknown_query_values(self):
+        response = self.client.get(reverse('index'), {'from': 'not-an-airport', 'to': 'SGN'})
+        vary_on = [response.context['LANGUAGE_CODE'], fragment_cache.version(fragment_cache.REFERENCE_DATA)]
+        self.assertIsNotNone(cache.get(make_template_fragment_key('search_from_airports', vary_on + [''])))
+        self.assertIsNone(cache.get(make_template_fragment_key('search_from_airports', vary_on + ['not-an-airport'])))
+        self.assertIsNotNone(cache.get(make_template_fragment_key('search_to_airports', vary_on + ['SGN'])))
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_templates_and_catalogs_are_loaded_ahead_of_requests(self):
+        loader = engines['django'].engine.template_loaders[0]
+        loader.reset()
+        self.assertGreater(warmup.warm_templates(), 20)
+        self.assertIn('homepage.html', loader.get_template_cache)
+        self.assertIn('components/search.html', loader.get_template_cache)
+        self.assertEqual(warmup.warm_translations(), 2)
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.flight_ticket_type = create_flight_ticket_type(available_seats=6, price=1200000)
+        self.flight = self.flight_ticket_type.flight
+
+    async def test_search_detail_and_availability(self):
+        day = timezone.localtime(self.flight.departure_time).date().isoformat()
+        params = {'from': 'HAN', 'to': 'SGN', 'departureDate': day, 'numPassengers': 2, 'chairType': 'Economy'}
+        response = await self.async_client.get(reverse('api_search_flights'), params)
+        self.assertEqual(response.status_code, 200)
+        flights = response.json()['flights']
+        self.assertEqual([(flight['flight_id'], flight['price']) for flight in flights], [(self.flight.pk, 1200000)])
+
+        response = await self.async_client.get(reverse('api_search_flights'), dict(params, numPassengers=7))
+        self.assertEqual(response.json()['flights'], [])
+        self.assertEqual((await self.async_client.get(reverse('api_search_flights'))).status_code, 400)
+
+        response = await self.async_client.get(reverse('api_flight_detail', args=[self.flight.pk]))
+        self.assertEqual(response.json()['flight_number'], 'VN123')
+        response = await self.async_client.get(reverse('api_flight_availability', args=[self.flight.pk]))
+        self.assertEqual(response.json()['fares'], [{'ticket_type': 'Economy', 'price': 1200000, 'available_seats': 6}])
+        response = await self.async_client.get(reverse('api_flight_detail', args=[self.flight.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse('api_fare_calendar'), dict(params, days=1))
+        self.assertEqual([day['flights'] for day in response.json()['days']], [0, 1, 0])
+
+    async def test_search_falls_back_to_the_query_without_a_summary(self):
+        await sync_to_async(cache.clear)()
+        await RouteDayAvailability.objects.all().adelete()
+        params = {'from': 'HAN', 'to': 'SGN', 'numPassengers': 2, 'chairType': 'Economy',
+                  'departureDate': timezone.localtime(self.flight.departure_time).date().isoformat()}
+        response = await self.async_client.get(reverse('api_search_flights'), params)
+        self.assertEqual([flight['flight_id'] for flight in response.json()['flights']], [self.flight.pk])
+        # The sync search reads the entry the API search cached.
+        response = await self.async_client.get(reverse('index'), dict(params, tripType='oneway'))
+        self.assertEqual([flight.pk for flight in response.context['departure_flights']], [self.flight.pk])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='financeadmin', password='secret123', email='finance@example.com',
+            phone_number='0912345678', is_superuser=True)
+        flight_ticket_type = create_flight_ticket_type()
+        self.bookings = [
+            Booking.objects.create(account=self.account, flight_ticket_type=flight_ticket_type)
+            for _ in range(5)
+        ]
+        self.bookings[0].passengers.create(first_name='An', last_name='Nguyen')
+        self.bookings[0].passengers.create(first_name='Binh', last_name='Tran')
+
+    def test_export_streams_every_row_in_batches(self):
+        lines = list(exports.stream('bookings', 'csv', chunk_size=2))
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith('booking_id,booking_date'))
+        self.assertIn('An Nguyen; Binh Tran', lines[1])
+
+        lines = list(exports.stream('bookings', 'jsonl', end=timezone.localdate() - timedelta(days=1)))
+        self.assertEqual(lines, [])
+
+    def test_export_view_is_for_admins(self):
+        self.client.force_login(self.account)
+        response = self.client.get(reverse('export_data'), {'kind': 'bookings', 'format': 'jsonl'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['booking_id'] for row in rows], [booking.pk for booking in self.bookings])
+        self.assertEqual(self.client.get(reverse('export_data'), {'kind': 'cards'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_data'), {'start': '2024-02-30'}).status_code, 400)
+
+
+class ImportScheduleTests(TestCase):
+    def setUp(self):
+        for code in ['HAN', 'SGN']:
+            Airport.objects.create(airport_code=code, name=code, city=code, country='Vietnam')
+        TicketType.objects.create(name='Economy')
+        TicketType.objects.create(name='Business')
+        self.path = os.path.join(tempfile.mkdtemp(), 'schedule.csv')
+
+    def write_schedule(self, rows):
+        with open(self.path, 'w') as schedule:
+            schedule.write('flight_number,departure_airport,arrival_airport,departure_time,arrival_time,'
+                           'ticket_type,price,available_seats\n')
+            schedule.writelines(f"{','.join(map(str, row))}\n" for row in rows)
+
+    def import_schedule(self, **options):
+        out = StringIO()
+        call_command('import_schedule', self.path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_creates_then_updates_in_batches(self):
+        rows = []
+        for day in range(1, 6):
+            for ticket_type, price in [('Economy', 1000000), ('Business', 3000000)]:
+                rows.append([f'VN{day}', 'HAN', 'SGN', f'2030-01-0{day}T08:00', f'2030-01-0{day}T10:00',
+                             ticket_type, price, 50])
+        self.write_schedule(rows)
+        with CaptureQueriesContext(connection) as queries:
+            self.import_schedule(batch_size=2)
+        self.assertEqual((Flight.objects.count(), FlightTicketType.objects.count()), (5, 10))
+        # A handful of statements per batch of 2 flights, not one per row.
+        self.assertLess(len(queries), 40)
+        self.assertEqual(RouteDayAvailability.objects.count(), 10)
+
+        rows[0][4] = '2030-01-01T10:30'
+        rows[1][6] = 3500000
+        self.write_schedule(rows)
+        output = self.import_schedule(dry_run=True, verbosity=2)
+        self.assertIn('~ VN1', output)
+        self.assertIn('Business price 3000000.00 -> 3500000', output)
+        self.assertEqual(FlightTicketType.objects.get(flight__flight_number='VN1', ticket_type__name='Business').price,
+                         3000000)
+
+        self.assertIn('updated 1 flight(s) and 1 fare(s); 4 flight(s) unchanged', self.import_schedule())
+        flight = Flight.objects.get(flight_number='VN1')
+        self.assertEqual(flight.get_duration(), timedelta(hours=2, minutes=30))
+
+    def test_unknown_airport_aborts_before_writing(self):
+        self.write_schedule([['VN1', 'HAN', 'DAD', '2030-01-01T08:00', '2030-01-01T10:00', 'Economy', 1, 1]])
+        with self.assertRaisesMessage(CommandError, "line 2: unknown airport 'DAD'"):
+            self.import_schedule()
+        self.assertFalse(Flight.objects.exists())
+
+    def test_only_the_imported_route_days_are_summarized_again(self):
+        rows = [['VN1', 'HAN', 'SGN', '2030-01-01T08:00', '2030-01-01T10:00', 'Economy', 1000000, 50],
+                ['VN2', 'HAN', 'SGN', '2030-01-02T08:00', '2030-01-02T10:00', 'Economy', 1000000, 50]]
+        self.write_schedule(rows)
+        self.import_schedule()
+        RouteDayAvailability.objects.filter(travel_date='2030-01-02').update(total_available_seats=0)
+        self.write_schedule([rows[0][:6] + [900000, 50]])
+        self.import_schedule()
+        self.assertEqual(RouteDayAvailability.objects.get(travel_date='2030-01-01').min_price, 900000)
+        self.assertEqual(RouteDayAvailability.objects.get(travel_date='2030-01-02').total_available_seats, 0)
+
+    def test_updated_seats_leave_out_the_sold_and_held_ones(self):
+        row = ['VN1', 'HAN', 'SGN', '2030-01-01T08:00', '2030-01-01T10:00', 'Economy', 1000000, 50]
+        self.write_schedule([row])
+        self.import_schedule()
+        fare = FlightTicketType.objects.get()
+        account = Account.objects.create_user(
+            username='traveller', password='secret123', email='traveller@example.com', phone_number='0912345678')
+        Booking.objects.create(account=account, flight_ticket_type=fare, seat_count=3, status='Confirmed')
+        Booking.objects.create(account=account, flight_ticket_type=fare, seat_count=4, status='Canceled')
+        FlightTicketType.objects.filter(pk=fare.pk).update(available_seats=45, held_seats=2)
+
+        self.write_schedule([row[:7] + [40]])
+        self.import_schedule(update_seats=True)
+        fare.refresh_from_db()
+        self.assertEqual((fare.available_seats, fare.held_seats), (35, 2))
+        self.assertEqual(RouteDayAvailability.objects.get().total_available_seats, 35)
+
+        self.write_schedule([row[:7] + [4]])
+        with self.assertRaisesMessage(CommandError, 'Economy has 5 seat(s) sold or held'):
+            self.import_schedule(update_seats=True)
+        fare.refresh_from_db()
+        self.assertEqual(fare.available_seats, 35)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 from .views import flight_detail, flight_list, pending_cancellations, user_bookings, approve_cancellation, reject_cancellation
 urlpatterns = [
     path('', views.index, name='index'),
@@ -10,6 +10,12 @@ urlpatterns = [
 
     path('flight', flight_list, name = 'flight'),
     path('flight/<int:flight_id>/', flight_detail, name='flight_detail'),
+    path('fare-calendar', views.fare_calendar, name='fare_calendar'),
+
+    path('api/flights/search', async_views.api_search_flights, name='api_search_flights'),
+    path('api/flights/<int:flight_id>/', async_views.api_flight_detail, name='api_flight_detail'),
+    path('api/flights/<int:flight_id>/availability', async_views.api_flight_availability, name='api_flight_availability'),
+    path('api/fare-calendar', async_views.api_fare_calendar, name='api_fare_calendar'),
 
     path('book/', user_bookings, name='user_bookings'),
     path('cancelbooking/<int:booking_id>/', views.cancel_booking, name='cancel_booking'),
@@ -17,6 +23,9 @@ urlpatterns = [
     path('pending-cancellations/', pending_cancellations, name='pending_cancellations'),
     path('approve-cancellation/<int:booking_id>/', approve_cancellation, name='approve_cancellation'),
     path('reject-cancellation/<int:booking_id>/', reject_cancellation, name='reject_cancellation'),
+    path('pending-cancellations/bulk/', views.bulk_cancellations, name='bulk_cancellations'),
+    path('metrics', views.request_metrics, name='request_metrics'),
+    path('export', views.export_data, name='export_data'),
     
     path('review', views.book_infor_view, name='book_infor'),
     path('payment', views.payment_view, name='payment'),
@@ -5,13 +5,24 @@ from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
 from .forms import *
 from .models import *
-from .constants import PRICE_FORMAT, REGEX_PATTERN, REGEX_PATTERN_NAME, REGEX_PATTERN_NUMBER, REGEX_PATTERN_EMAIL
+from . import checkout, db_router, exports, fragment_cache, idempotency, jobs, metrics, reference_data, route_graph, search_cache
+from .constants import (
+    BOOKINGS_PER_PAGE, FARE_CALENDAR_DEFAULT_DAYS, FARE_CALENDAR_MAX_DAYS, FLIGHTS_PER_PAGE, PRICE_FORMAT,
+    REGEX_PATTERN, REGEX_PATTERN_NAME, REGEX_PATTERN_NUMBER, REGEX_PATTERN_EMAIL, SEARCH_MODE_CONNECTIONS,
+    SEARCH_MODE_DIRECT
+)
 from django.shortcuts import render, get_object_or_404
 from .models import Flight, Airport
+from django.db import transaction
 from django.db.models import Min, Q, F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.views.decorators.http import require_POST
 from django.utils import timezone
 from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from datetime import timedelta
 import secrets
 import re
 
@@ -66,31 +77,38 @@ def logout_view(request):
     logout(request)
     return HttpResponseRedirect(reverse("index"))
 
-def __get_airports():
-    """Retrieve all airports from the database."""
-    airports = Airport.objects.all().values("airport_code", "name", "city", "country")
-    return list(airports)
-
-def __get_ticket_types():
-    """Retrieve all ticket types from the database."""
-    ticket_types = TicketType.objects.all().values("ticket_type_id", "name")
-    return list(ticket_types)
-
-def __get_available_flights(departure_airport, arrival_airport, departure_date, num_passengers, chair_type_name):
-    return Flight.objects.filter(
-        departure_airport=departure_airport,
-        arrival_airport=arrival_airport,
-        departure_time__date=departure_date,
-        flighttickettype__available_seats__gte=num_passengers,
-        flighttickettype__ticket_type__name=chair_type_name
-    ).annotate(
-        min_price=Min(
-            "flighttickettype__price",
-            filter=Q(flighttickettype__available_seats__gte=num_passengers)
-        ),
-        ticket_type_price=F("flighttickettype__price"),
-        ticket_type_available_seats=F("flighttickettype__available_seats")
-    ).order_by("min_price")
+def __get_ticket_type_id(ticket_types, ticket_type_name):
+    """Resolve a ticket type name to its id from the already loaded ticket types."""
+    for ticket_type in ticket_types:
+        if ticket_type["name"] == ticket_type_name:
+            return ticket_type["ticket_type_id"]
+    return None
+
+def __get_available_flights(departure_airport, arrival_airport, departure_date, num_passengers, ticket_type_id):
+    day = parse_date(f"{departure_date}")
+    if day is None:
+        return Flight.objects.none()
+    return Flight.objects.available(departure_airport, arrival_airport, day, num_passengers, ticket_type_id)
+
+def __search_flights(departure_airport, arrival_airport, departure_date, num_passengers, ticket_type_id):
+    """Available flights with display-ready prices, served from the search cache."""
+    def compute():
+        # The route/day summary answers "nothing available" with one indexed lookup.
+        day = parse_date(f"{departure_date}")
+        if day is None or RouteDayAvailability.objects.rules_out(
+                departure_airport, arrival_airport, day, ticket_type_id, num_passengers).exists():
+            return []
+        flights = list(__get_available_flights(
+            departure_airport, arrival_airport, departure_date, num_passengers, ticket_type_id
+        ))
+        for flight in flights:
+            flight.ticket_type_price = PRICE_FORMAT.format(flight.ticket_type_price)
+        return flights
+
+    search = search_cache.normalize(
+        departure_airport, arrival_airport, departure_date, num_passengers, ticket_type_id
+    )
+    return search_cache.get_or_compute(search, compute)
 
 def __check_datetime(date):
     try:
@@ -99,9 +117,24 @@ def __check_datetime(date):
         return False
     return True
 
+def __search_connections(departure_airport, arrival_airport, departure_date, num_passengers, ticket_type_id, sort):
+    """Itineraries with connections, found on the in-memory route graph of the day."""
+    day = parse_date(f"{departure_date}")
+    if day is None:
+        return []
+    itineraries = route_graph.search(
+        f"{departure_airport}".strip().upper(), f"{arrival_airport}".strip().upper(),
+        day, num_passengers, ticket_type_id, sort=sort
+    )
+    for itinerary in itineraries:
+        itinerary.total_price_display = PRICE_FORMAT.format(itinerary.total_price)
+    return itineraries
+
 def index(request):
     context = {}
     trip_type = request.GET.get("tripType")
+    search_mode = request.GET.get("searchMode") or SEARCH_MODE_DIRECT
+    sort_by = request.GET.get("sortBy") or route_graph.SORT_EARLIEST
     from_airport = request.GET.get("from")
     to_airport = request.GET.get("to")
     departure_date = request.GET.get("departureDate")
@@ -112,9 +145,13 @@ def index(request):
     except:
         context["error_message"] = _("Please use number only for number of passengers.")
     chair_type_name = request.GET.get("chairType")
+    ticket_types = reference_data.get_ticket_types()
+    ticket_type_id = __get_ticket_type_id(ticket_types, chair_type_name)
     if not __check_datetime(departure_date) or not __check_datetime(return_date):
         context["error_message"] = _("Please fill in appropriate date value.")
 
+    airports = reference_data.get_airports()
+    airport_codes = {airport["airport_code"] for airport in airports}
     context.update({
         "trip_type": trip_type,
         "from_airport": from_airport,
@@ -123,8 +160,14 @@ def index(request):
         "return_date": return_date,
         "num_passengers": num_passengers,
         "chair_type": chair_type_name,
-        "airports": __get_airports(),
-        "ticket_types": __get_ticket_types(),
+        "search_mode": search_mode,
+        "sort_by": sort_by,
+        "airports": airports,
+        "ticket_types": ticket_types,
+        # The cached dropdowns vary on these, so only known values are passed on.
+        "selected_from": from_airport if from_airport in airport_codes else "",
+        "selected_to": to_airport if to_airport in airport_codes else "",
+        "selected_chair_type": chair_type_name if ticket_type_id is not None else "",
     })
 
     # If required fields are missing, return to the homepage
@@ -136,7 +179,7 @@ def index(request):
         context["error_message"] = _("Please select a departure date.")
     if trip_type == "round" and not return_date:
         context["error_message"] = _("Please select a return date.")
-    if not chair_type_name:
+    if not chair_type_name or ticket_type_id is None:
         context["error_message"] = _("Please select a chair type.")
     if not num_passengers:
         context["error_message"] = _("Please select the number of passengers.")
@@ -154,33 +197,93 @@ def index(request):
     if departure_date and parse_datetime(f"{departure_date}T23:59:59+0700") < timezone.now():
         context["error_message"] = _("You cannot book flights from the past.")
 
+    if search_mode not in (SEARCH_MODE_DIRECT, SEARCH_MODE_CONNECTIONS):
+        context["error_message"] = _("Please select a valid search mode.")
+    if sort_by not in (route_graph.SORT_EARLIEST, route_graph.SORT_CHEAPEST):
+        context["error_message"] = _("Please select a valid sort order.")
+
     if context.get("error_message"):
         return render(request, "homepage.html", context)
 
+    if search_mode == SEARCH_MODE_CONNECTIONS:
+        departure_itineraries = __search_connections(
+            from_airport, to_airport, departure_date, num_passengers, ticket_type_id, sort_by)
+        if not departure_itineraries:
+            context["error_message"] = _("No flights available with the selected criteria. Please try again.")
+            return render(request, "homepage.html", context)
+        context["departure_itineraries"] = departure_itineraries
+        if trip_type == "round":
+            return_itineraries = __search_connections(
+                to_airport, from_airport, return_date, num_passengers, ticket_type_id, sort_by)
+            if not return_itineraries:
+                context["error_message"] = _("No return flights available with the selected criteria. Please try again.")
+                return render(request, "homepage.html", context)
+            context["return_itineraries"] = return_itineraries
+        return render(request, "homepage.html", context)
+
     # Filter flights by chair type and available seats
-    departure_flights = __get_available_flights(from_airport, to_airport, departure_date, num_passengers, chair_type_name)
+    departure_flights = __search_flights(from_airport, to_airport, departure_date, num_passengers, ticket_type_id)
     if not departure_flights:
         context["error_message"] = _("No flights available with the selected criteria. Please try again.")
         return render(request, "homepage.html", context)
 
     context["departure_flights"] = departure_flights
-    for flight in departure_flights:
-        flight.ticket_type_price = PRICE_FORMAT.format(flight.ticket_type_price)
 
     # If round trip, get return flights with the same conditions
     if trip_type == "round":
-        return_flights = __get_available_flights(to_airport, from_airport, return_date, num_passengers, chair_type_name)
+        return_flights = __search_flights(to_airport, from_airport, return_date, num_passengers, ticket_type_id)
         if not return_flights:
             context["error_message"] = _("No return flights available with the selected criteria. Please try again.")
             return render(request, "homepage.html", context)
         context["return_flights"] = return_flights
-        for flight in return_flights:
-            flight.ticket_type_price = PRICE_FORMAT.format(flight.ticket_type_price)
 
     return render(request, "homepage.html", context)
 
+def __get_fare_calendar(departure_airport, arrival_airport, first_day, last_day, num_passengers, ticket_type_id):
+    """Cheapest fare and number of flights per day, from a single grouped query."""
+    rows = FlightTicketType.objects.fare_calendar(
+        departure_airport, arrival_airport, first_day, last_day, num_passengers, ticket_type_id
+    )
+    return build_fare_calendar(rows, first_day, last_day)
+
+def fare_calendar(request):
+    from_airport = request.GET.get("from")
+    to_airport = request.GET.get("to")
+    chair_type_name = request.GET.get("chairType")
+    ticket_type_id = __get_ticket_type_id(reference_data.get_ticket_types(), chair_type_name)
+    try:
+        departure_date = parse_date(request.GET.get("departureDate", ""))
+        num_passengers = int(request.GET.get("numPassengers", 1))
+        window = int(request.GET.get("days", FARE_CALENDAR_DEFAULT_DAYS))
+    except ValueError:
+        departure_date = None
+    if not from_airport or not to_airport or departure_date is None or ticket_type_id is None:
+        return JsonResponse({"error": _("Please provide from, to, departureDate and chairType.")}, status=400)
+    window = max(0, min(window, FARE_CALENDAR_MAX_DAYS))
+    num_passengers = max(num_passengers, 1)
+    first_day = departure_date - timedelta(days=window)
+    last_day = departure_date + timedelta(days=window)
+    days = search_cache.get_or_compute_calendar(
+        from_airport, to_airport,
+        [first_day + timedelta(days=offset) for offset in range(2 * window + 1)],
+        num_passengers, ticket_type_id,
+        lambda: __get_fare_calendar(from_airport, to_airport, first_day, last_day, num_passengers, ticket_type_id)
+    )
+    return JsonResponse({
+        "from": from_airport,
+        "to": to_airport,
+        "chair_type": chair_type_name,
+        "num_passengers": num_passengers,
+        "days": days,
+    })
+
 def flight_detail(request, flight_id):
-    flight = get_object_or_404(Flight, flight_id=flight_id)
+    content = fragment_cache.get_flight_detail(request, flight_id)
+    if content is not None:
+        return HttpResponse(content)
+    flight = get_object_or_404(
+        Flight.objects.select_related('departure_airport', 'arrival_airport'), flight_id=flight_id
+    )
     departure_airport = flight.departure_airport
     arrival_airport = flight.arrival_airport
     
@@ -190,26 +293,72 @@ def flight_detail(request, flight_id):
         'arrival_airport': arrival_airport,
     }
     
-    return render(request, 'flight_detail.html', context)
+    response = render(request, 'flight_detail.html', context)
+    # The page depends only on the flight, the language and the audience; see booking.fragment_cache.
+    fragment_cache.set_flight_detail(request, flight_id, response.content)
+    return response
+
+def __encode_flight_cursor(flight):
+    value = f"{flight.departure_time.isoformat()}|{flight.flight_id}"
+    return urlsafe_base64_encode(value.encode())
+
+def __decode_flight_cursor(cursor):
+    """Return the (departure_time, flight_id) a cursor points at, or None if it is malformed."""
+    try:
+        departure_time, flight_id = urlsafe_base64_decode(cursor).decode().split("|")
+        departure_time = parse_datetime(departure_time)
+        flight_id = int(flight_id)
+    except ValueError:
+        return None
+    if departure_time is None:
+        return None
+    return departure_time, flight_id
 
 def flight_list(request):
-    flights = Flight.objects.all()
+    flights = Flight.objects.select_related('departure_airport', 'arrival_airport')
     departure_date = request.GET.get('departure_date')
-    if departure_date:
-        flights = flights.filter(departure_time__date=departure_date)
+    day = parse_date(departure_date) if departure_date and __check_datetime(departure_date) else None
+    if day:
+        day_start, day_end = get_day_range(day)
+        flights = flights.filter(departure_time__gte=day_start, departure_time__lt=day_end)
     departure_location = request.GET.get('departure_location')
     if departure_location:
-        flights = flights.filter(departure_airport__city=departure_location)
-    airports = Airport.objects.values_list('city', flat=True).distinct()
+        # Filter on the indexed departure_airport column instead of joining Airport.city.
+        airport_codes = [
+            airport["airport_code"] for airport in reference_data.get_airports()
+            if airport["city"] == departure_location
+        ]
+        flights = flights.filter(departure_airport__in=airport_codes)
+
+    # Keyset pagination: continue after the last (departure_time, flight_id) shown.
+    position = __decode_flight_cursor(request.GET.get('cursor', ''))
+    if position:
+        departure_time, flight_id = position
+        flights = flights.filter(
+            Q(departure_time__gt=departure_time) | Q(departure_time=departure_time, flight_id__gt=flight_id)
+        )
+    flights = list(flights.order_by('departure_time', 'flight_id')[:FLIGHTS_PER_PAGE + 1])
+    next_query = None
+    if len(flights) > FLIGHTS_PER_PAGE:
+        flights = flights[:FLIGHTS_PER_PAGE]
+        query = request.GET.copy()
+        query['cursor'] = __encode_flight_cursor(flights[-1])
+        next_query = query.urlencode()
+
+    airports = reference_data.get_cities()
     context = {
         'flights': flights,
         'airports': airports,
+        'next_query': next_query,
+        'is_first_page': position is None,
     }
     return render(request, 'flight_list.html', context)
+
 @login_required
 def user_bookings(request):
-    bookings = Booking.objects.filter(account=request.user)
-    return render(request, 'user_bookings.html', {'bookings': bookings})
+    bookings = Booking.objects.filter(account=request.user).with_listing_data().order_by('-booking_id')
+    page = Paginator(bookings, BOOKINGS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'user_bookings.html', {'bookings': page, 'page_obj': page})
 
 @login_required
 def cancel_booking(request, booking_id):
@@ -229,8 +378,60 @@ def is_admin(user):
 @login_required
 @user_passes_test(is_admin)
 def pending_cancellations(request):
+    bookings = Booking.objects.filter(status="PendingCancellation").with_listing_data().order_by('booking_id')
+    page = Paginator(bookings, BOOKINGS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'pending_cancellations.html', {'bookings': page, 'page_obj': page})
+
+@login_required
+@user_passes_test(is_admin)
+@require_POST
+def bulk_cancellations(request):
+    """Approve or reject the selected pending cancellations, or all of them, at once."""
+    action = request.POST.get("action")
     bookings = Booking.objects.filter(status="PendingCancellation")
-    return render(request, 'pending_cancellations.html', {'bookings': bookings})
+    if request.POST.get("scope") != "all":
+        bookings = bookings.filter(booking_id__in=[
+            booking_id for booking_id in request.POST.getlist("booking_ids") if booking_id.isdigit()
+        ])
+    if action == "approve":
+        count = bookings.approve_cancellations()
+        messages.success(request, _("%(count)d cancellation(s) approved.") % {"count": count})
+    elif action == "reject":
+        count = bookings.reject_cancellations()
+        messages.success(request, _("%(count)d cancellation(s) rejected.") % {"count": count})
+    else:
+        messages.error(request, _("Unknown action."))
+    return redirect('pending_cancellations')
+
+@login_required
+@user_passes_test(is_admin)
+def request_metrics(request):
+    """Per-view latency histograms and query counts of this process."""
+    return JsonResponse({"views": metrics.snapshot(), "search_cache": search_cache.stats()})
+
+@login_required
+@user_passes_test(is_admin)
+def export_data(request):
+    """Stream bookings or payments as CSV or JSONL, optionally within a date range."""
+    kind = request.GET.get("kind", "bookings")
+    file_format = request.GET.get("format", "csv")
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    try:
+        # parse_date returns None for malformed dates and raises ValueError for impossible ones.
+        start_date = parse_date(start) if start else None
+        end_date = parse_date(end) if end else None
+    except ValueError:
+        start_date = end_date = None
+    if kind not in exports.EXPORTS or file_format not in exports.FORMATS \
+            or (start and start_date is None) or (end and end_date is None):
+        return HttpResponse(_("Please provide a valid kind, format, start and end."), status=400)
+    response = StreamingHttpResponse(
+        exports.stream(kind, file_format, start=start_date, end=end_date),
+        content_type="text/csv" if file_format == "csv" else "application/x-ndjson"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{file_format}"'
+    return response
 
 @login_required
 @user_passes_test(is_admin)
@@ -251,6 +452,7 @@ def reject_cancellation(request, booking_id):
     return redirect('pending_cancellations')
 
 
+@db_router.use_primary
 def book_infor_view(request):
     flight_1 = request.GET.get('d_flight_id')
     seat = request.GET.get('flight_ticket_type')
@@ -262,79 +464,48 @@ def book_infor_view(request):
         flight_2 = request.GET.get('r_flight_id')
 
     if request.user.is_authenticated:
-        flight1 = Flight.objects.get(flight_id=flight_1)
-        flight1price = FlightTicketType.objects.get(flight_id=flight_1, ticket_type__name=seat).price
-        flight1ddate = flight1.departure_time.date
-        flight1adate = flight1.arrival_time.date
-        flight2 = None
-        flight2ddate = None
-        flight2adate = None
+        num_passengers = int(request.GET.get('num_passengers'))
+        flight_ticket_types = [checkout.get_flight_ticket_type(flight_1, seat)]
         if round_trip:
-            flight2 = Flight.objects.get(flight_id=flight_2)
-            flight2price = FlightTicketType.objects.get(flight_id=flight_2, ticket_type__name=seat).price
-            flight2ddate = flight2.departure_time.date
-            flight2adate = flight2.arrival_time.date
-            return render(request, "book_infor.html", {
-                'flight1': flight1,
-                'flight2': flight2,
-                "flight1ddate": flight1ddate,
-                "flight1adate": flight1adate,
-                "flight2ddate": flight2ddate,
-                "flight2adate": flight2adate,
-                "seat": seat,
-                "num_passengers": request.GET.get('num_passengers'),
-                "passengers": list(range(int(request.GET.get('num_passengers')))),
-                "price": PRICE_FORMAT.format(float(flight1price) + float(flight2price)),
-                "total_price": PRICE_FORMAT.format((float(flight1price) + float(flight2price)) * int(request.GET.get('num_passengers'))),
-                "phone_number": request.user.phone_number[1:],
-                "email": request.user.email,
-                "real_price": (float(flight1price) + float(flight2price)) * int(request.GET.get('num_passengers'))
-            })
+            flight_ticket_types.append(checkout.get_flight_ticket_type(flight_2, seat))
+        # The quote is kept server-side; later steps never read prices from the form.
+        state = checkout.CheckoutState.start(request, flight_ticket_types, num_passengers)
+        flight1 = flight_ticket_types[0].flight
+        flight2 = flight_ticket_types[1].flight if round_trip else None
         return render(request, "book_infor.html", {
             'flight1': flight1,
-            "flight1ddate": flight1ddate,
-            "flight1adate": flight1adate,
+            'flight2': flight2,
+            "flight1ddate": flight1.departure_time.date,
+            "flight1adate": flight1.arrival_time.date,
+            "flight2ddate": flight2.departure_time.date if flight2 else None,
+            "flight2adate": flight2.arrival_time.date if flight2 else None,
             "seat": seat,
-            "num_passengers": request.GET.get('num_passengers'),
-            "passengers": list(range(int(request.GET.get('num_passengers')))),
-            "price": PRICE_FORMAT.format(float(flight1price)),
-            "total_price": PRICE_FORMAT.format(float(flight1price) * int(request.GET.get('num_passengers'))),
+            "num_passengers": num_passengers,
+            "passengers": list(range(num_passengers)),
+            "price": PRICE_FORMAT.format(sum(float(fare.price) for fare in flight_ticket_types)),
+            "total_price": PRICE_FORMAT.format(float(state.total)),
             "phone_number": request.user.phone_number[1:],
             "email": request.user.email,
-            "real_price": float(flight1price) * int(request.GET.get('num_passengers'))
+            "seat_maps": [
+                SeatMap.objects.for_fare(flight_ticket_type) for flight_ticket_type in flight_ticket_types
+            ],
+            "checkout_id": state.checkout_id,
+            "idempotency_key": idempotency.new_key()
         })
     else:
         return redirect(reverse("login"))
 
-def __create_ticket(user, passengers, passengerscount, flight, flight_class, countrycode, mobile, email):
-    booking = Booking.objects.create(
-        account=user, 
-        flight_ticket_type=FlightTicketType.objects.get(flight=flight, ticket_type__name=flight_class)
-    )
-    booking.seat_number = passengerscount
-    for passenger in passengers:
-        booking.passengers.add(passenger)
-    flightTicket = FlightTicketType.objects.get(flight=flight, ticket_type__name=flight_class)
-    booking.flight_ticket_type = flightTicket
-    flightTicket.book_seat(int(passengerscount))
-    phone_number = f"0{mobile}"
-    booking.account.phone_number = phone_number
-    booking.account.email = email
-    booking.account.save()
-    booking.save()
-    return booking
-
+@db_router.use_primary
+@idempotency.idempotent('payment')
 def payment_view(request):
     if request.method == 'POST':
         if request.user.is_authenticated:
             proceed = True
             flight_1 = request.POST.get('flight1')
-            flight_1date = request.POST.get('flight1Date')
             flight_1class = request.POST.get('flight1Class')
             f2 = False
             if request.POST.get('flight2'):
                 flight_2 = request.POST.get('flight2')
-                flight_2date = request.POST.get('flight2Date')
                 flight_2class = request.POST.get('flight2Class')
                 f2 = True
             countrycode = request.POST['countryCode']
@@ -355,120 +526,88 @@ def payment_view(request):
             elif not re.match(REGEX_PATTERN_EMAIL, email):
                 messages.error(request, _("Your email is not valid."))
                 proceed = False
-            flight1 = Flight.objects.get(flight_id=flight_1)
-            if f2:
-                flight2 = Flight.objects.get(flight_id=flight_2)
-            passengerscount = request.POST['numPassengers']
-            passengers=[]
-            for i in range(int(passengerscount)):
-                fname = request.POST[f'passenger{i}Fname']
-                if not fname:
-                    messages.error(request, _("Please input the first names."))
-                    proceed = False
-                elif not re.match(REGEX_PATTERN_NAME, fname):
-                    messages.error(request, _("Some of the first names are not valid."))
-                    proceed = False
-                lname = request.POST[f'passenger{i}Lname']
-                if not lname:
-                    messages.error(request, _("Please input the last names."))
-                    proceed = False
-                elif not re.match(REGEX_PATTERN_NAME, lname):
-                    messages.error(request, _("Some of the last names are not valid."))
-                    proceed = False
-                gender = request.POST[f'passenger{i}Gender']
-                if not gender:
-                    messages.error(request, _("Please select the genders."))
-                    proceed = False
-                elif gender not in [_("Male"), _("Female"), _("Other")]:
-                    messages.error(request, _("Some of the genders are not valid."))
-                    proceed = False
-                dob = request.POST[f'passenger{i}DateOfBirth']
-                if not dob:
-                    messages.error(request, _("Please input the dates of birth."))
-                    proceed = False
-                else:
-                    try:
-                        parse_dob = parse_date(dob)
-                    except:
-                        messages.error(request, _("Some of the dates of birth are not valid."))
-                        proceed = False
-                if dob and parse_datetime(f"{dob}T23:59:59+0700") >= timezone.now():
-                    messages.error(request, _("The dates of birth should be prior to today."))
-                    proceed = False 
-                nationality = request.POST[f'passenger{i}Nationality']
-                if flight1.departure_airport.country != flight1.arrival_airport.country:
-                    passno = request.POST[f'passenger{i}PassportNumber']
-                    if not passno:
-                        messages.error(request, _("Please input the passport numbers."))
-                        proceed = False
-                    elif not re.match(REGEX_PATTERN, passno):
-                        messages.error(request, _("Some of the passport numbers are not valid."))
-                        proceed = False
-                    coi = request.POST[f'passenger{i}CountryOfIssue']
-                    expire = request.POST[f'passenger{i}PassportExpireDate']
-                    if not expire:
-                        messages.error(request, _("Please input the passport expire dates."))
-                        proceed = False
-                    else:
-                        try:
-                            parse_dob = parse_date(expire)
-                        except:
-                            messages.error(request, _("Some of the expire dates are not valid."))
-                            proceed = False
+            state = checkout.CheckoutState.load(request, request.POST.get('checkout_id'))
+            try:
+                if state is None:
+                    # Forms without a checkout id start one from the submitted flights.
+                    flight_ticket_types = [checkout.get_flight_ticket_type(flight_1, flight_1class)]
+                    if f2:
+                        flight_ticket_types.append(checkout.get_flight_ticket_type(flight_2, flight_2class))
+                    state = checkout.CheckoutState.start(
+                        request, flight_ticket_types, int(request.POST['numPassengers'])
+                    )
                 else:
-                    passno = 'None'
-                    coi = 'None'
-                    expire = timezone.now()
-                if proceed:
-                    passengers.append(Passenger.objects.create(
-                        first_name=fname,
-                        last_name=lname,
-                        gender=gender.capitalize(),
-                        date_of_birth=dob,
-                        nationality=nationality,
-                        passport_number=passno,
-                        passport_from_country=coi,
-                        due_date=expire
-                    ))
+                    flight_ticket_types = state.flight_ticket_types()
+            except (FlightTicketType.DoesNotExist, ValueError, KeyError):
+                messages.error(request, _("Your information is not valid. Please try again."))
+                return redirect(request.META.get('HTTP_REFERER', '/'))
+            f2 = len(flight_ticket_types) > 1
+            flight1 = flight_ticket_types[0].flight
+            passengers, errors = checkout.parse_passengers(
+                request.POST, state.num_passengers, not flight1.is_domestic()
+            )
+            for error in errors:
+                messages.error(request, error)
             coupon = request.POST.get('coupon')
-            price = request.POST.get('totalCost')
-            if not proceed:
+            if not proceed or errors:
                 return redirect(request.META.get('HTTP_REFERER', '/'))
             try:
-                ticket1 = __create_ticket(request.user,passengers,passengerscount,flight1,flight_1class,countrycode,mobile,email)
-                if f2:
-                    ticket2 = __create_ticket(request.user,passengers,passengerscount,flight2,flight_2class,countrycode,mobile,email)
+                bookings = checkout.create_bookings(
+                    request.user, flight_ticket_types, passengers, mobile, email,
+                    seat_labels=[request.POST.getlist(f'flight{leg}Seats') for leg in (1, 2)]
+                )
+            except checkout.CheckoutError as e:
+                messages.error(request, str(e))
+                return redirect(request.META.get('HTTP_REFERER', '/'))
             except Exception as e:
-                messages.error(request, _(f"Your information is not valid. Please try again."))
+                messages.error(request, _("Your information is not valid. Please try again."))
                 return redirect(request.META.get('HTTP_REFERER', '/'))
+            state.booking_ids = [booking.booking_id for booking in bookings]
+            state.save(request)
 
             if f2:    ##
                 return render(request, "payment.html", {
-                    "ticket1": ticket1.booking_id,
-                    "ticket2": ticket2.booking_id,
-                    "price": PRICE_FORMAT.format(float(price)),
-                    "real_price": price
+                    "ticket1": bookings[0].booking_id,
+                    "ticket2": bookings[1].booking_id,
+                    "price": PRICE_FORMAT.format(float(state.total)),
+                    "checkout_id": state.checkout_id,
+                    "idempotency_key": idempotency.new_key()
                 })  ##
             return render(request, "payment.html", {
-                "ticket1": ticket1.booking_id,
-                "price": PRICE_FORMAT.format(float(price)),
-                "real_price": price
+                "ticket1": bookings[0].booking_id,
+                "price": PRICE_FORMAT.format(float(state.total)),
+                "checkout_id": state.checkout_id,
+                "idempotency_key": idempotency.new_key()
             })
         else:
             return HttpResponseRedirect(reverse("login"))
     else:
         return HttpResponse("Method must be post.")
 
+def __confirm_seat_holds(bookings):
+    """Confirm the seat holds of all bookings; the caller rolls back when this returns False."""
+    for booking in bookings:
+        seat_hold = SeatHold.objects.filter(booking=booking).select_related('flight_ticket_type__flight').first()
+        if seat_hold is not None and not seat_hold.confirm():
+            return False
+    return True
+
+@db_router.use_primary
+@idempotency.idempotent('process')
 def process_view(request):
     if request.user.is_authenticated:
         if request.method == 'POST':
             proceed = True
-            ticket1_id = request.POST['ticket1']
+            # Bookings and amounts come from the checkout, not from the form.
+            state = checkout.CheckoutState.load(request, request.POST.get('checkout_id'))
+            if state is None or not state.booking_ids:
+                messages.error(request, _("Your checkout has expired. Please search for your flight again."))
+                return redirect('index')
+            ticket1_id = state.booking_ids[0]
             t2 = False
-            if request.POST.get('ticket2'):
-                ticket2_id = request.POST['ticket2']
+            if len(state.booking_ids) > 1:
+                ticket2_id = state.booking_ids[1]
                 t2 = True
-            fare = request.POST.get('fare')
             card_number = request.POST['cardNumber']
             if not card_number:
                 messages.error(request, _("Please input your card number."))
@@ -516,57 +655,72 @@ def process_view(request):
                     return render(request, 'payment.html', {
                         "ticket1": ticket1_id,
                         "ticket2": ticket2_id,
-                        "price": PRICE_FORMAT.format(float(fare)),
-                        "real_price": fare
+                        "price": PRICE_FORMAT.format(float(state.total)),
+                        "checkout_id": state.checkout_id,
+                        "idempotency_key": idempotency.new_key()
                     })
                 return render(request, 'payment.html', {
                     "ticket1": ticket1_id,
-                    "price": PRICE_FORMAT.format(float(fare)),
-                    "real_price": fare
+                    "price": PRICE_FORMAT.format(float(state.total)),
+                    "checkout_id": state.checkout_id,
+                    "idempotency_key": idempotency.new_key()
                 })
             try:
-                card = Card.objects.filter(user=request.user).exists()
-                if card:
-                    card = Card.objects.get(user=request.user)
-                else:
-                    card = Card.objects.create(user=request.user, expiry_date=timezone.now())
-                card.card_number = card_number
-                card.card_type = card_type
-                card.cardholder_name = card_holder_name
-                card.expiry_date = expiry_date
-                card.save()
-
-                ticket = Booking.objects.get(booking_id=ticket1_id)
-                ticket.status = 'Confirmed'
-                ticket.booking_date = timezone.now()
-                ticket.save()
-                payment = Payment.objects.filter(booking=ticket).exists()
-                if payment:
-                    payment = Payment.objects.get(booking=ticket)
-                else:
-                    payment = Payment.objects.create(booking=ticket,card=card,amount=fare)
-                payment.card = card
-                payment.amount = fare
-                payment.payment_method = 'Credit Card'
-                payment.transaction_id = secrets.token_hex(3).upper()
-                id1 = payment.transaction_id
-                payment.save()
-                if t2:
-                    ticket2 = Booking.objects.get(booking_id=ticket2_id)
-                    ticket2.status = 'Confirmed'
-                    ticket2.booking_date = timezone.now()
-                    ticket2.save()
-                    payment2 = Payment.objects.filter(booking=ticket2).exists()
-                    if payment2:
-                        payment2 = Payment.objects.get(booking=ticket2)
+                # One transaction from the card to the payments: a failure leaves no seats sold without
+                # a payment, and the confirmation e-mail is only queued once it has committed.
+                with transaction.atomic():
+                    card = Card.objects.filter(user=request.user).exists()
+                    if card:
+                        card = Card.objects.get(user=request.user)
                     else:
-                        payment2 = Payment.objects.create(booking=ticket2,card=card,amount=fare)
-                    payment2.card = card
-                    payment2.amount = fare
-                    payment2.payment_method = 'Credit Card'
-                    payment2.transaction_id = secrets.token_hex(3).upper()
-                    id2 = payment2.transaction_id
-                    payment2.save()
+                        card = Card.objects.create(user=request.user, expiry_date=timezone.now())
+                    card.card_number = card_number
+                    card.card_type = card_type
+                    card.cardholder_name = card_holder_name
+                    card.expiry_date = expiry_date
+                    card.save()
+
+                    ticket = Booking.objects.get(booking_id=ticket1_id)
+                    if t2:
+                        ticket2 = Booking.objects.get(booking_id=ticket2_id)
+                    if not __confirm_seat_holds([ticket, ticket2] if t2 else [ticket]):
+                        transaction.set_rollback(True)
+                        messages.error(request, _("Your seat reservation has expired and the seats are no longer available."))
+                        return redirect('index')
+                    ticket.status = 'Confirmed'
+                    ticket.booking_date = timezone.now()
+                    ticket.save()
+                    payment = Payment.objects.filter(booking=ticket).exists()
+                    if payment:
+                        payment = Payment.objects.get(booking=ticket)
+                    else:
+                        payment = Payment.objects.create(booking=ticket,card=card,amount=state.leg_total(0))
+                    payment.card = card
+                    payment.amount = state.leg_total(0)
+                    payment.payment_method = 'Credit Card'
+                    payment.transaction_id = secrets.token_hex(3).upper()
+                    id1 = payment.transaction_id
+                    payment.save()
+                    if t2:
+                        ticket2.status = 'Confirmed'
+                        ticket2.booking_date = timezone.now()
+                        ticket2.save()
+                        payment2 = Payment.objects.filter(booking=ticket2).exists()
+                        if payment2:
+                            payment2 = Payment.objects.get(booking=ticket2)
+                        else:
+                            payment2 = Payment.objects.create(booking=ticket2,card=card,amount=state.leg_total(1))
+                        payment2.card = card
+                        payment2.amount = state.leg_total(1)
+                        payment2.payment_method = 'Credit Card'
+                        payment2.transaction_id = secrets.token_hex(3).upper()
+                        id2 = payment2.transaction_id
+                        payment2.save()
+                        jobs.enqueue('send_booking_confirmation', booking_ids=[ticket.booking_id, ticket2.booking_id])
+                    else:
+                        jobs.enqueue('send_booking_confirmation', booking_ids=[ticket.booking_id])
+                state.discard(request)
+                if t2:
                     return render(request, 'payment_process.html', {
                         'ticket1': ticket,
                         'ticket2': ticket2,
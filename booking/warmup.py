@@ -0,0 +1,69 @@
+"""Work done once at startup so the first requests of a worker are not slower.
+
+With the cached template loader, every template is read and compiled on
+first use and then kept for the life of the process; translation catalogs
+and the per-language URL reverse maps are built the same way. ``run``
+does all of that up front. It is called from ``BookingConfig.ready`` when
+``BOOKING_WARM_UP`` is set, as it is in ``ticketbooking.settings_production``.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+from django.urls import reverse
+from django.utils import translation
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_EXTENSIONS = (".html", ".txt")
+
+
+def _template_names(backend):
+    names = set()
+    # Not backend.template_dirs: with explicit loaders APP_DIRS is off, but the app directories are still searched.
+    for directory in [*backend.engine.dirs, *get_app_template_dirs("templates")]:
+        for root, _dirs, files in os.walk(directory):
+            names.update(
+                os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+                for name in files if name.endswith(TEMPLATE_EXTENSIONS)
+            )
+    return sorted(names)
+
+
+def warm_templates():
+    """Compile every template of the Django template engines into the loader cache."""
+    count = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in _template_names(backend):
+            try:
+                backend.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+                # Not every file under a template directory is a template, e.g. third-party includes.
+                logger.debug("Not warming template %s: %s", name, e)
+                continue
+            count += 1
+    return count
+
+
+def warm_translations():
+    """Load the catalog and the URL reverse map of every configured language."""
+    languages = [code for code, _name in settings.LANGUAGES]
+    for language in languages:
+        with translation.override(language):
+            translation.gettext("")
+            reverse("index")
+    return len(languages)
+
+
+def run():
+    start = time.perf_counter()
+    templates = warm_templates()
+    languages = warm_translations()
+    logger.info("Warmed %d templates and %d languages in %.0f ms",
+                templates, languages, (time.perf_counter() - start) * 1000)
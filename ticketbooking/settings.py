@@ -45,8 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booking.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'booking.db_router.DatabasePinMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -69,6 +71,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.i18n',
+                'booking.context_processors.fragments',
             ],
         },
     },
@@ -80,17 +83,92 @@ WSGI_APPLICATION = 'ticketbooking.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds ("none" for no
+# limit, 0 to close them after every request) and checked before reuse.
+# DATABASE_POOL_SIZE above 0 keeps that many idle connections in a pool per
+# process, which also helps servers that do not reuse threads, such as ASGI
+# ones; there, leave DATABASE_CONN_MAX_AGE at 0. See booking.db_backends.pool.
+DATABASE_CONN_MAX_AGE = (os.getenv('DATABASE_CONN_MAX_AGE') or '60').lower()
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE') or 0)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'booking.db_backends.mysql_pool' if DATABASE_POOL_SIZE else 'django.db.backends.mysql',
         'NAME': os.getenv('DATABASE_NAME'),
         'USER': os.getenv('DATABASE_USER'),
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
         'HOST': os.getenv('DATABASE_HOST'),
         'PORT': os.getenv('DATABASE_PORT'),
+        'CONN_MAX_AGE': None if DATABASE_CONN_MAX_AGE == 'none' else int(DATABASE_CONN_MAX_AGE),
+        'CONN_HEALTH_CHECKS': (os.getenv('DATABASE_CONN_HEALTH_CHECKS') or 'true').lower() == 'true',
+        'POOL_SIZE': DATABASE_POOL_SIZE,
+    }
+}
+
+# Read replicas, as comma-separated host[:port] values sharing the primary's
+# name and credentials. Safe requests read from them; see booking.db_router.
+# Tests mirror them to the primary's test database.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, (os.getenv('DATABASE_REPLICA_HOSTS') or '').split(',')), 1):
+    host, separator, port = replica.strip().partition(':')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port if separator else DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['booking.db_router.ReplicaRouter']
+
+# Seconds a session keeps reading from the primary after it wrote; 0 keeps it there for the rest of the session.
+BOOKING_PRIMARY_PIN_SECONDS = int(os.getenv('BOOKING_PRIMARY_PIN_SECONDS') or 0)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION') or '',
     }
 }
 
+# Cache alias shared by all worker processes for airports and ticket types.
+# Leave empty to keep reference data in a process-local store only.
+BOOKING_REFERENCE_CACHE = os.getenv('BOOKING_REFERENCE_CACHE', '')
+
+# Flight search results: seconds a result is fresh, and how many more
+# seconds a stale result may be served while one request refreshes it.
+BOOKING_SEARCH_CACHE = os.getenv('BOOKING_SEARCH_CACHE') or 'default'
+BOOKING_SEARCH_CACHE_TTL = int(os.getenv('BOOKING_SEARCH_CACHE_TTL') or 30)
+BOOKING_SEARCH_CACHE_STALE_TTL = int(os.getenv('BOOKING_SEARCH_CACHE_STALE_TTL') or 0)
+
+# Seconds the search dropdowns, the shared layout and flight pages stay in
+# the template fragment cache; edits invalidate them earlier.
+BOOKING_FRAGMENT_CACHE_TTL = int(os.getenv('BOOKING_FRAGMENT_CACHE_TTL') or 3600)
+
+# Per-view latency and query metrics, see booking.middleware
+BOOKING_REQUEST_METRICS = (os.getenv('BOOKING_REQUEST_METRICS') or 'true').lower() == 'true'
+BOOKING_SLOW_REQUEST_MS = int(os.getenv('BOOKING_SLOW_REQUEST_MS') or 500)
+
+
+# E-mail
+# https://docs.djangoproject.com/en/5.0/topics/email/
+
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND') or 'django.core.mail.backends.console.EmailBackend'
+EMAIL_HOST = os.getenv('EMAIL_HOST') or 'localhost'
+EMAIL_PORT = int(os.getenv('EMAIL_PORT') or 25)
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER') or ''
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD') or ''
+EMAIL_USE_TLS = (os.getenv('EMAIL_USE_TLS') or 'false').lower() == 'true'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL') or 'webmaster@localhost'
+
+
+# Compile templates and load translations at startup, see booking.warmup.
+BOOKING_WARM_UP = (os.getenv('BOOKING_WARM_UP') or 'false').lower() == 'true'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -0,0 +1,32 @@
+"""
+Production settings for ticketbooking: the base settings with debugging off,
+the cached template loader and the startup warm-up of booking.warmup.
+
+Use with DJANGO_SETTINGS_MODULE=ticketbooking.settings_production.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host.strip() for host in (os.getenv('ALLOWED_HOSTS') or '').split(',') if host.strip()]
+
+# Templates are compiled once per process and kept; with BOOKING_WARM_UP
+# that happens before the first request instead of during it.
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+BOOKING_WARM_UP = (os.getenv('BOOKING_WARM_UP') or 'true').lower() == 'true'